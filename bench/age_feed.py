@@ -0,0 +1,142 @@
+"""
+Нагрузочная проверка ленты с диапазоном возраста партнера: обход по
+индексу (age, user_id) против прежнего обхода по user_id с фильтром
+по возрасту.
+
+    python bench/age_feed.py --profiles 200000 --ranges 25-27 20-60
+
+Для каждого диапазона лента проходится целиком пачками по 50 анкет,
+как это делает очередь кандидатов, отдельно без города и внутри
+одного города. Индекс каждого способа задан через INDEXED BY, чтобы
+планировщик не подменил его. Пол и поиск у всех анкет одинаковые,
+оценок нет.
+"""
+import argparse
+import asyncio
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import DatabaseConfig
+from database.models import AGE_FEED_QUERY, FEED_AFTER_AGE, FEED_AFTER_USER, FEED_QUERY, Database
+
+
+CITIES = ["moscow", "saint-petersburg", "kazan", "novosibirsk", "yekaterinburg"]
+BATCH = 50
+
+
+async def create_database(path: str):
+    """Создать схему и индексы так же, как при запуске бота"""
+    db = Database(path, DatabaseConfig(path=path))
+    await db.connect()
+    await db.disconnect()
+
+
+def fill(connection: sqlite3.Connection, count: int):
+    """count видимых анкет женщин, ищущих мужчин, со случайным возрастом и городом"""
+    with connection:
+        connection.executemany(
+            "INSERT INTO users (id, telegram_id) VALUES (?, ?)",
+            ((user_id, user_id) for user_id in range(1, count + 1))
+        )
+        connection.executemany(
+            "INSERT INTO profiles (user_id, name, age, gender, looking_for, city, city_key) "
+            "VALUES (?, 'Анкета', ?, 'female', 'male', ?, ?)",
+            (
+                (user_id, random.randint(18, 70), city, city)
+                for user_id, city in ((user_id, random.choice(CITIES)) for user_id in range(1, count + 1))
+            )
+        )
+
+
+def walk_by_user(connection, low: int, high: int, city: str = None, index: str = None) -> tuple[int, float]:
+    """Прежний обход: по user_id, возраст проверяется у каждой строки"""
+    query = FEED_QUERY + FEED_AFTER_USER + " AND p.age BETWEEN ? AND ?"
+    if city:
+        query += " AND p.city_key = ?"
+    query += " ORDER BY p.user_id LIMIT ?"
+    if index:
+        query = query.replace("FROM profiles p", f"FROM profiles p INDEXED BY {index}")
+    found, cursor, started = 0, 0, time.perf_counter()
+    while True:
+        params = [0, "female", "male", cursor, low, high] + ([city] if city else []) + [BATCH]
+        rows = connection.execute(query, params).fetchall()
+        if rows:
+            found += len(rows)
+            cursor = rows[-1][0]
+        if len(rows) < BATCH:
+            return found, time.perf_counter() - started
+
+
+def walk_by_age(connection, low: int, high: int, city: str = None, index: str = None) -> tuple[int, float]:
+    """Обход очереди с диапазоном возраста: по (age, user_id) внутри диапазона"""
+    query = AGE_FEED_QUERY + FEED_AFTER_AGE + " AND p.age <= ?"
+    if city:
+        query += " AND p.city_key = ?"
+    query += " ORDER BY p.age, p.user_id LIMIT ?"
+    if index:
+        query = query.replace("FROM profiles p", f"FROM profiles p INDEXED BY {index}")
+    found, cursor_age, cursor, started = 0, low, 0, time.perf_counter()
+    while True:
+        params = [0, "female", "male", cursor_age, cursor, high] + ([city] if city else []) + [BATCH]
+        rows = connection.execute(query, params).fetchall()
+        if rows:
+            found += len(rows)
+            cursor, cursor_age = rows[-1][0], rows[-1][1]
+        if len(rows) < BATCH:
+            return found, time.perf_counter() - started
+
+
+def report(name: str, result: tuple[int, float]):
+    found, seconds = result
+    print(f"  {name:<44} {found:>7} анкет  {seconds * 1000:>9.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обход ленты с диапазоном возраста")
+    parser.add_argument("--profiles", type=int, default=200000)
+    parser.add_argument("--ranges", nargs="+", default=["25-27", "20-60"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = str(Path(directory) / "bench.db")
+        asyncio.run(create_database(path))
+        connection = sqlite3.connect(path)
+        fill(connection, args.profiles)
+        connection.execute("ANALYZE")
+
+        print(f"Анкет: {args.profiles}, пачка: {BATCH}")
+        for bounds in args.ranges:
+            low, high = map(int, bounds.split("-"))
+            print(f"Возраст {low}-{high}:")
+            report(
+                "по user_id с фильтром (idx_profiles_feed)",
+                walk_by_user(connection, low, high, index="idx_profiles_feed")
+            )
+            report(
+                "по (age, user_id) (idx_profiles_age)",
+                walk_by_age(connection, low, high, index="idx_profiles_age")
+            )
+            print(f"Возраст {low}-{high}, один город:")
+            report(
+                "по user_id с фильтром (idx_profiles_city_feed)",
+                walk_by_user(connection, low, high, CITIES[0], index="idx_profiles_city_feed")
+            )
+            report(
+                "по (age, user_id) без города в индексе",
+                walk_by_age(connection, low, high, CITIES[0], index="idx_profiles_age")
+            )
+            report(
+                "по (age, user_id) (idx_profiles_city_age)",
+                walk_by_age(connection, low, high, CITIES[0], index="idx_profiles_city_age")
+            )
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Нагрузочная проверка клавиатур: время и память на вызов при сборке
+разметки заново и при выдаче готовой из кэша.
+
+    python bench/keyboards.py --calls 20000
+
+Сборка заново — это исходная функция без кэша (__wrapped__), то есть
+то, что обработчик делал на каждый вызов до мемоизации.
+Для клавиатур с id пользователя берутся разные id, как у разных
+пользователей, в пределах PER_USER_CACHE_SIZE.
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import keyboards.keyboards as kb
+
+
+def measure(call, calls: int) -> tuple[float, float]:
+    """Микросекунд на вызов и байт, выделенных за вызов, после прогрева кэша"""
+    for i in range(calls):
+        call(i)
+
+    started = time.perf_counter()
+    for i in range(calls):
+        call(i)
+    seconds = time.perf_counter() - started
+
+    # Пик памяти внутри вызова: разметка, собранная заново, успевает освободиться
+    allocated = 0
+    tracemalloc.start()
+    for i in range(calls):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        call(i)
+        _, peak = tracemalloc.get_traced_memory()
+        allocated += peak - before
+    tracemalloc.stop()
+    return seconds / calls * 1e6, allocated / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка клавиатур заново и из кэша")
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    users = kb.PER_USER_CACHE_SIZE
+    cases = {
+        "get_main_menu": lambda f: lambda i: f(),
+        "get_shop_keyboard": lambda f: lambda i: f(),
+        "get_no_profiles_keyboard": lambda f: lambda i: f(),
+        "get_profile_actions_keyboard": lambda f: lambda i: f(i % users, 0, 3),
+        "get_match_keyboard": lambda f: lambda i: f(i % users),
+    }
+
+    print(f"Вызовов: {args.calls}")
+    for name, make_call in cases.items():
+        cached = getattr(kb, name)
+        cached.cache_clear()
+        built = measure(make_call(cached.__wrapped__), args.calls)
+        reused = measure(make_call(cached), args.calls)
+        print(
+            f"{name:<30} заново {built[0]:>7.1f} мкс {built[1]:>8.0f} Б   "
+            f"из кэша {reused[0]:>6.2f} мкс {reused[1]:>6.0f} Б"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Нагрузочная проверка ранжирования ленты: время оценки пачки кандидатов
+и выбора лучших top_k по сравнению с бюджетом кадра.
+
+    python bench/ranking.py --candidates 50000 --repeat 50
+
+Кандидаты синтетические, в том же виде, что строки RANKED_FEED_QUERY.
+Отдельно измеряются разбор строк в столбцы признаков и сам векторный
+проход score_candidates + top_k; база не участвует.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import RankingConfig
+from database.ranking import candidate_features, rank_candidates, score_candidates, top_k
+
+
+FRAME_BUDGET_MS = 1000 / 60
+
+
+def make_rows(count: int, now: float) -> list[dict]:
+    """Кандидаты со случайными признаками"""
+    return [
+        {
+            "user_id": user_id,
+            "age": random.randint(18, 60),
+            "same_city": int(random.random() < 0.2),
+            "updated_ts": int(now - random.uniform(0, 90 * 24 * 3600)),
+            "photo_count": random.randint(0, 8),
+            "has_video": int(random.random() < 0.1),
+            "liked_me": int(random.random() < 0.05),
+        }
+        for user_id in range(1, count + 1)
+    ]
+
+
+def measure(step, repeat: int) -> list[float]:
+    """Время каждого из repeat вызовов, мс"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        step()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(name: str, timings: list[float]):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<28} медиана {statistics.median(timings):>7.2f} мс  p95 {p95:>7.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время ранжирования пачки кандидатов")
+    parser.add_argument("--candidates", type=int, default=50000)
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    now = time.time()
+    config = RankingConfig(enabled=True, pool_size=args.candidates, top_k=args.top_k)
+    rows = make_rows(args.candidates, now)
+    features = candidate_features(rows)
+    viewer = {"age": 30}
+
+    print(f"Кандидатов: {args.candidates}, top_k: {args.top_k}, бюджет кадра: {FRAME_BUDGET_MS:.1f} мс")
+    report("оценка и top_k", measure(
+        lambda: top_k(score_candidates(features, viewer["age"], config, now), config.top_k), args.repeat
+    ))
+    report("разбор строк в признаки", measure(lambda: candidate_features(rows), args.repeat))
+    report("rank_candidates целиком", measure(lambda: rank_candidates(rows, viewer, config), args.repeat))
+
+
+if __name__ == "__main__":
+    main()
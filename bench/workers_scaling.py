@@ -0,0 +1,103 @@
+"""
+Нагрузочная проверка многопроцессного режима: обновлений в секунду
+при разном числе воркеров.
+
+    python bench/workers_scaling.py --updates 20000 --workers 1 2 4
+
+Воркеры обрабатывают обновления тем же циклом consume_updates, что и бот:
+разбор JSON в объекты aiogram, роутер, сборка клавиатуры и сериализация
+ответа. Сеть и база не участвуют, поэтому измеряется только работа
+процессора, которую и распределяет супервизор.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.methods import SendMessage
+from aiogram.types import Message
+
+import keyboards.keyboards as kb
+from utils.workers import Supervisor, consume_updates
+
+
+def make_update(update_id: int, user_id: int) -> str:
+    return json.dumps({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Тест"},
+            "text": "❤️",
+        },
+    })
+
+
+def run_worker(ready, index: int, updates):
+    """Процесс-воркер: обработчик готовит ответ, но не отправляет его"""
+    router = Router()
+
+    @router.message()
+    async def handler(message: Message, bot: Bot):
+        markup = kb.get_profile_actions_keyboard(message.from_user.id, 0, 3)
+        method = SendMessage(chat_id=message.chat.id, text=f"Анкета {message.message_id}", reply_markup=markup)
+        # Та же сериализация, что перед отправкой запроса в Telegram
+        bot.session.build_form_data(bot, method)
+
+    async def main():
+        dispatcher = Dispatcher()
+        dispatcher.include_router(router)
+        bot = Bot("42:BENCH")
+        ready.release()
+        try:
+            await consume_updates(bot, dispatcher, updates)
+        finally:
+            await bot.session.close()
+
+    asyncio.run(main())
+
+
+async def measure(workers: int, total: int, users: int) -> float:
+    """Обновлений в секунду: от первой отправки до обработки последнего"""
+    ready = multiprocessing.get_context("spawn").Semaphore(0)
+    supervisor = Supervisor(workers, partial(run_worker, ready), queue_size=1000)
+    supervisor.start()
+    loop = asyncio.get_running_loop()
+    for _ in range(workers):
+        await loop.run_in_executor(None, ready.acquire)
+
+    raw = [make_update(i, 1 + i % users) for i in range(total)]
+    started = time.perf_counter()
+    for update in raw:
+        await supervisor.dispatch(update)
+    # stop дожидается, пока воркеры доработают свои очереди
+    await supervisor.stop(timeout=600)
+    return total / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Масштабирование по числу воркеров")
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    print(f"Ядер: {os.cpu_count()}, обновлений: {args.updates}, пользователей: {args.users}")
+    baseline = None
+    for workers in args.workers:
+        rate = asyncio.run(measure(workers, args.updates, args.users))
+        baseline = baseline or rate
+        print(f"воркеров: {workers:>2}  {rate:>8.0f} обн/с  x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
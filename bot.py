@@ -3,9 +3,12 @@ Telegram бот для знакомств
 Главный файл запуска
 """
 import asyncio
+import dataclasses
 import logging
+import signal
 import sys
 from pathlib import Path
+from typing import Optional
 
 # Добавляем текущую директорию в путь поиска модулей
 sys.path.insert(0, str(Path(__file__).parent))
@@ -13,13 +16,20 @@ sys.path.insert(0, str(Path(__file__).parent))
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
 
-from config import load_config
+from config import BotConfig, DatabaseConfig, load_config
+from database.fsm_storage import SQLiteStorage, TTLStorage
 from database.models import Database
+from handlers.admin import router as admin_router
 from handlers.profile import router as profile_router
 from handlers.matching import router as matching_router
 from handlers.payments import router as payments_router
+from handlers.fallback import router as fallback_router
+from utils.notifications import MatchNotifier
+from utils.outbox import Outbox, begin_reply
+from utils.prefetch import ProfilePrefetcher
+from utils.webhook import create_forwarding_app, run_webhook, serve_webhook
+from utils.workers import Supervisor, consume_updates
 
 
 # Настройка логирования
@@ -32,6 +42,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# fallback_router последний: ловит то, что не подошло остальным
+ROUTERS = [admin_router, profile_router, matching_router, payments_router, fallback_router]
+
 
 async def main():
     """Главная функция запуска бота"""
@@ -42,8 +55,30 @@ async def main():
     db_path = Path(db_config.path)
     db_path.parent.mkdir(parents=True, exist_ok=True)
     
+    if bot_config.workers > 1:
+        await run_supervisor(bot_config)
+    else:
+        await run_bot(bot_config, db_config)
+
+
+async def run_bot(
+    bot_config: BotConfig,
+    db_config: DatabaseConfig,
+    shard: Optional[tuple[int, int]] = None,
+    updates=None
+):
+    """
+    Запустить бота в этом процессе.
+    В режиме воркера shard — (номер воркера, число воркеров), а обновления
+    приходят от супервизора через очередь updates.
+    """
+    if shard is not None:
+        # База общая с другими воркерами, лимит отправки делится между ними
+        db_config = dataclasses.replace(db_config, shared=True)
+        bot_config = dataclasses.replace(bot_config, outbox_rate=bot_config.outbox_rate / shard[1])
+    
     # Инициализируем базу данных
-    db = Database(db_config.path)
+    db = Database(db_config.path, db_config)
     await db.connect()
     logger.info("База данных подключена")
     
@@ -53,38 +88,152 @@ async def main():
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
     
-    dp = Dispatcher(storage=MemoryStorage())
+    # Очередь исходящих сообщений
+    outbox = Outbox(
+        bot,
+        rate=bot_config.outbox_rate,
+        chat_interval=bot_config.outbox_chat_interval,
+        max_retries=bot_config.outbox_max_retries
+    )
+    outbox.start()
+    
+    # Доставка уведомлений о мэтчах
+    notifier = MatchNotifier(
+        db,
+        outbox,
+        poll_interval=bot_config.notification_poll_interval,
+        batch_size=bot_config.notification_batch_size,
+        max_attempts=bot_config.notification_max_attempts,
+        retry_delay=bot_config.notification_retry_delay,
+        shard=shard
+    )
+    notifier.start()
+    
+    # Следующая анкета готовится, пока пользователь смотрит текущую
+    prefetcher = None
+    if bot_config.prefetch_profiles:
+        prefetcher = ProfilePrefetcher(
+            db,
+            max_users=bot_config.prefetch_max_users,
+            ttl=bot_config.prefetch_ttl
+        )
+    
+    # Состояния FSM хранятся в базе, изменения за обновление пишутся разом,
+    # брошенные сценарии сбрасываются по таймауту
+    sqlite_storage = SQLiteStorage(db, shard=shard)
+    storage = TTLStorage(
+        sqlite_storage,
+        ttl=db_config.fsm_session_ttl,
+        max_sessions=db_config.fsm_max_sessions,
+        sweep_interval=db_config.fsm_sweep_interval
+    )
+    storage.start()
+    dp = Dispatcher(storage=storage)
+    
+    @dp.update.outer_middleware()
+    async def flush_fsm_storage(handler, event, data):
+        try:
+            return await handler(event, data)
+        finally:
+            await sqlite_storage.flush()
     
     # Регистрируем роутеры
-    dp.include_router(profile_router)
-    dp.include_router(matching_router)
-    dp.include_router(payments_router)
+    for router in ROUTERS:
+        dp.include_router(router)
     
     # Middleware для передачи зависимостей
     @dp.message.middleware()
     @dp.callback_query.middleware()
     async def inject_dependencies(handler, event, data):
+        # Сообщения обработчика — один ответ, паузы между ними не нужны
+        begin_reply()
         data["db"] = db
         data["config"] = bot_config
+        data["outbox"] = outbox
+        data["notifier"] = notifier
+        data["prefetcher"] = prefetcher
         return await handler(event, data)
     
     @dp.pre_checkout_query.middleware()
     async def inject_db_pre_checkout(handler, event, data):
+        begin_reply()
         data["db"] = db
         data["config"] = bot_config
+        data["outbox"] = outbox
         return await handler(event, data)
     
     try:
+        if updates is not None:
+            logger.info("Воркер %s запущен", shard[0])
+            await consume_updates(bot, dp, updates, bot_config.worker_max_concurrent)
+            return
+        
         logger.info("Бот запущен!")
-        # Удаляем вебхук и начинаем polling
-        await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if bot_config.use_webhook:
+            await run_webhook(bot, dp, bot_config)
+        else:
+            # Удаляем вебхук и начинаем polling; накопленные обновления сохраняются
+            await bot.delete_webhook(drop_pending_updates=bot_config.drop_pending_updates)
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
+        await notifier.stop()
+        if prefetcher:
+            await prefetcher.close()
+        await outbox.stop()
+        await storage.close()
         await db.disconnect()
         await bot.session.close()
         logger.info("Бот остановлен")
 
 
+def run_worker(index: int, updates):
+    """Точка входа процесса-воркера"""
+    # Остановкой воркеров управляет супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    bot_config, db_config = load_config()
+    asyncio.run(run_bot(bot_config, db_config, shard=(index, bot_config.workers), updates=updates))
+
+
+async def run_supervisor(bot_config: BotConfig):
+    """
+    Принимать обновления и раздавать их воркерам по пользователю.
+    Супервизор не разбирает обновления и не работает с базой.
+    """
+    supervisor = Supervisor(
+        bot_config.workers, run_worker, queue_size=bot_config.worker_queue_size,
+        max_restarts=bot_config.worker_max_restarts, restart_window=bot_config.worker_restart_window
+    )
+    supervisor.start()
+    
+    bot = Bot(token=bot_config.token)
+    allowed_updates = sorted(set().union(*(router.resolve_used_update_types() for router in ROUTERS)))
+    
+    async def receive():
+        if bot_config.use_webhook:
+            app = create_forwarding_app(bot_config, supervisor.dispatch)
+            await serve_webhook(bot, app, bot_config, allowed_updates)
+        else:
+            await bot.delete_webhook(drop_pending_updates=bot_config.drop_pending_updates)
+            await supervisor.poll(bot, allowed_updates)
+    
+    try:
+        logger.info("Супервизор запущен!")
+        # Прием обновлений идет, пока воркеры не начнут падать без остановки
+        tasks = [asyncio.create_task(receive()), asyncio.create_task(supervisor.watch())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for task in done:
+            task.result()
+    finally:
+        await supervisor.stop()
+        await bot.session.close()
+        logger.info("Супервизор остановлен")
+
+
 if __name__ == "__main__":
     try:
         asyncio.run(main())
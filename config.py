@@ -2,7 +2,7 @@
 Конфигурация бота для знакомств
 """
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -24,12 +24,137 @@ class BotConfig:
     max_photos: int = 5
     max_video_duration: int = 15  # секунд
     max_bio_length: int = 500
+    
+    # Мэтчи
+    matches_page_size: int = 10  # Мэтчей на одной странице
+    
+    # Просмотр в одной карточке: сообщение с анкетой редактируется на месте,
+    # фотографии листаются кнопками ◀ ▶ вместо альбома
+    carousel_mode: bool = False
+    
+    # Подготовка следующей анкеты, пока пользователь смотрит текущую
+    prefetch_profiles: bool = True
+    prefetch_max_users: int = 10000  # Пользователей с подготовленной анкетой
+    prefetch_ttl: float = 600.0  # секунд, после которых подготовленная анкета забывается
+    
+    # Очередь исходящих сообщений
+    outbox_rate: float = 25.0  # Сообщений в секунду на всего бота (лимит Telegram — 30)
+    outbox_chat_interval: float = 1.0  # секунд между ответами в один чат
+    outbox_max_retries: int = 3  # Повторов после TelegramRetryAfter и сетевых ошибок
+    
+    # Уведомления о мэтчах
+    notification_poll_interval: float = 30.0  # секунд между проверками очереди без новых мэтчей
+    notification_batch_size: int = 50
+    notification_max_attempts: int = 5  # Попыток доставки при временных ошибках
+    notification_retry_delay: float = 60.0  # секунд, растет с каждой попыткой
+    
+    # Получение обновлений
+    drop_pending_updates: bool = False  # Отбрасывать накопленные обновления при запуске
+    use_webhook: bool = False  # Вебхук вместо long polling
+    webhook_url: str = ""  # Внешний адрес сервера, например https://example.com
+    webhook_path: str = "/webhook"
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_secret: str = ""  # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+    webhook_max_concurrent: int = 40  # Обновлений в обработке одновременно
+    
+    # Несколько процессов-воркеров
+    workers: int = 1  # Больше 1 — супервизор раздает обновления воркерам по пользователю
+    worker_queue_size: int = 1000  # Обновлений в очереди одного воркера
+    worker_max_concurrent: int = 100  # Обновлений в обработке у одного воркера
+    worker_max_restarts: int = 5  # Перезапусков упавших воркеров за worker_restart_window, потом остановка
+    worker_restart_window: float = 60.0  # секунд
+
+
+@dataclass
+class RankingConfig:
+    """Ранжирование ленты: веса признаков кандидата"""
+    enabled: bool = False  # Без ранжирования кандидаты идут в случайном порядке
+    pool_size: int = 1000  # Кандидатов, оцениваемых за один раз
+    top_k: int = 50  # Лучших из них попадает в очередь
+    city_weight: float = 2.0  # Тот же город
+    age_weight: float = 1.0  # Штраф за каждые age_scale лет разницы
+    age_scale: float = 5.0
+    recency_weight: float = 1.0  # Свежая анкета; вклад вдвое меньше каждые recency_half_life секунд
+    recency_half_life: float = 7 * 24 * 3600
+    reciprocity_weight: float = 3.0  # Кандидат уже лайкнул пользователя
+    photos_weight: float = 0.5  # За число фото до max_photos
+    max_photos: int = 5
+    video_weight: float = 0.5  # Есть видео
+    noise: float = 0.1  # Случайная добавка, чтобы лента не была одинаковой
 
 
 @dataclass
 class DatabaseConfig:
     """Настройки базы данных"""
     path: str = "database/dating_bot.db"
+    
+    # Пул соединений
+    reader_connections: int = 4  # Соединений только для чтения (0 — читать через писателя)
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    busy_timeout: int = 5000  # мс
+    mmap_size: int = 256 * 1024 * 1024  # байт
+    
+    # Групповая фиксация записей
+    group_commit: bool = False
+    group_commit_interval: float = 0.005  # секунд
+    group_commit_max_statements: int = 100
+    
+    # Кэш пользователей по telegram_id
+    user_cache_size: int = 50000
+    user_cache_ttl: float = 300.0  # секунд
+    
+    # Кэш анкет по user_id
+    profile_cache_size: int = 20000
+    profile_cache_ttl: float = 60.0  # секунд, ограничивает устаревание при нескольких процессах
+    
+    # Готовые карточки анкет: текст, альбом и кнопки
+    card_cache_size: int = 20000
+    
+    # Граф лайков в памяти: проверка мэтча и исключение оцененных без запросов
+    like_graph: bool = False
+    like_graph_max_users: int = 100000  # Сколько пользователей держать в памяти
+    
+    # База открыта несколькими процессами: чужие оценки проверяются запросом,
+    # а не по графу в памяти, который другой процесс не обновит;
+    # очередь лайкнувших перечитывается с каждой пачкой ленты
+    shared: bool = False
+    
+    # Фильтры Блума «уже оценил» вместо подзапроса NOT IN
+    seen_filter: bool = False
+    seen_filter_capacity: int = 2000  # Начальная емкость фильтра, растет вдвое при переполнении
+    seen_filter_error_rate: float = 0.01  # Доля ложных срабатываний
+    seen_filter_flush_every: int = 20  # Сохранять фильтр после стольких новых оценок
+    seen_filter_max_users: int = 20000  # Сколько фильтров держать в памяти
+    
+    # Состояния FSM
+    fsm_session_ttl: float = 24 * 3600  # секунд без активности до сброса незавершенного сценария
+    fsm_max_sessions: int = 100000  # Незавершенных сценариев в памяти, лишние сбрасываются по LRU
+    fsm_sweep_interval: float = 300.0  # секунд между проверками
+    
+    # Очередь кандидатов для ленты
+    candidate_batch_size: int = 50  # Сколько кандидатов подгружать за раз
+    candidate_queue_users: int = 10000  # Сколько очередей держать в памяти
+    
+    # Города: канонические ключи по справочнику и лента по городам
+    cities_path: str = ""  # Свой справочник вместо встроенного database/cities.json
+    city_feed: bool = True  # Сначала свой город, затем соседние, затем все остальные
+    city_neighbor_radius_km: float = 300.0
+    city_max_neighbors: int = 5
+    
+    # Ранжирование кандидатов (нужен numpy)
+    ranking: RankingConfig = field(default_factory=RankingConfig)
+    
+    # Рекомендации, посчитанные заранее командой python recommend.py
+    use_recommendations: bool = True  # Показывать их раньше ленты, пока не кончатся
+    recommendations_per_user: int = 200
+    recommendation_chunk_size: int = 1000  # Смотрящих в одной задаче пакетного расчета
+    
+    # Лента сначала показывает тех, кто уже лайкнул пользователя
+    admirers_every: int = 3  # Каждая N-я анкета — от лайкнувшего; 0 — не выделять их
+    admirers_per_user: int = 200  # Сколько последних лайков читать при создании очереди
+    admirers_max_users: int = 10000  # Сколько очередей держать в памяти
 
 
 # Загрузка конфигурации
@@ -38,6 +163,13 @@ def load_config() -> tuple[BotConfig, DatabaseConfig]:
     bot_config = BotConfig(
         token=os.getenv("BOT_TOKEN", "YOUR_BOT_TOKEN_HERE"),
         admin_ids=[int(id) for id in os.getenv("ADMIN_IDS", "").split(",") if id],
+        use_webhook=bool(os.getenv("WEBHOOK_URL")),
+        webhook_url=os.getenv("WEBHOOK_URL", ""),
+        webhook_secret=os.getenv("WEBHOOK_SECRET", ""),
+        webhook_host=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+        webhook_port=int(os.getenv("WEBHOOK_PORT", "8080")),
+        workers=int(os.getenv("WORKERS", "1")),
+        carousel_mode=os.getenv("CAROUSEL_MODE", "").lower() in ("1", "true", "yes"),
     )
     db_config = DatabaseConfig()
     return bot_config, db_config
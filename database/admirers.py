@@ -0,0 +1,85 @@
+"""
+Очереди тех, кто уже лайкнул пользователя, для ленты анкет
+"""
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+
+class AdmirerLanes:
+    """
+    Для каждого загруженного пользователя — те, кто его лайкнул и кого он
+    ещё не оценил, от новых лайков к старым.
+    Очередь читается из likes один раз при создании очереди ленты, а дальше
+    обновляется в add_like, так что свайп не требует запросов.
+    add_like видит только лайки своего процесса: с несколькими воркерами
+    (DatabaseConfig.shared) очередь обновляется через refresh с каждой пачкой
+    ленты, и лайк из другого воркера появляется в ней со следующей пачкой.
+    Хранит не больше max_users очередей, вытесняя самые старые.
+    """
+
+    def __init__(self, max_users: int = 10000):
+        self.max_users = max_users
+        self._lanes: OrderedDict[int, OrderedDict[int, None]] = OrderedDict()
+        # Уже выданные в ленту: анкета могла быть показана, но ещё не оценена
+        self._given: dict[int, set[int]] = {}
+
+    def is_loaded(self, user_id: int) -> bool:
+        return user_id in self._lanes
+
+    def load(self, user_id: int, admirer_ids: Iterable[int]):
+        """Загрузить очередь пользователя: id лайкнувших, от новых к старым"""
+        self._lanes[user_id] = OrderedDict.fromkeys(admirer_ids)
+        self._given[user_id] = set()
+        self._lanes.move_to_end(user_id)
+        while len(self._lanes) > self.max_users:
+            evicted, _ = self._lanes.popitem(last=False)
+            del self._given[evicted]
+
+    def refresh(self, user_id: int, admirer_ids: Iterable[int]):
+        """Перечитанная очередь без тех, кто уже выдан в ленту"""
+        if user_id not in self._lanes:
+            self.load(user_id, admirer_ids)
+            return
+        given = self._given[user_id]
+        self._lanes[user_id] = OrderedDict.fromkeys(i for i in admirer_ids if i not in given)
+        self._lanes.move_to_end(user_id)
+
+    def record(self, from_user_id: int, to_user_id: int, is_like: bool):
+        """Учесть новую оценку; незагруженные очереди не меняются"""
+        # Оцененный больше не ждет в очереди оценившего
+        self.discard(from_user_id, to_user_id)
+
+        lane = self._lanes.get(to_user_id)
+        if lane is None:
+            return
+        if is_like:
+            lane[from_user_id] = None
+            lane.move_to_end(from_user_id, last=False)
+        else:
+            # Повторная оценка могла сменить лайк на дизлайк
+            lane.pop(from_user_id, None)
+
+    def pop(self, user_id: int) -> Optional[int]:
+        """Следующий лайкнувший или None, если очередь пуста или не загружена"""
+        lane = self._lanes.get(user_id)
+        if not lane:
+            return None
+        self._lanes.move_to_end(user_id)
+        admirer_id, _ = lane.popitem(last=False)
+        self._given[user_id].add(admirer_id)
+        return admirer_id
+
+    def discard(self, user_id: int, admirer_id: int):
+        """Убрать лайкнувшего из очереди пользователя"""
+        lane = self._lanes.get(user_id)
+        if lane is not None:
+            lane.pop(admirer_id, None)
+            self._given[user_id].add(admirer_id)
+
+    def clear(self):
+        """Забыть все очереди"""
+        self._lanes.clear()
+        self._given.clear()
+
+    def __len__(self) -> int:
+        return len(self._lanes)
@@ -0,0 +1,127 @@
+"""
+Групповая фиксация записей в базу данных
+"""
+import asyncio
+from dataclasses import dataclass, field
+from typing import Optional
+
+import aiosqlite
+
+
+@dataclass
+class WriteResult:
+    """Результат одного изменяющего запроса"""
+    lastrowid: Optional[int]
+    rowcount: int
+    rows: list = field(default_factory=list)  # Строки из RETURNING
+
+
+class WriteBatcher:
+    """
+    Собирает записи от параллельных обработчиков и применяет их
+    одной транзакцией раз в interval секунд или по достижении
+    max_statements запросов. Каждый вызов submit завершается только
+    после фиксации своей пачки.
+    """
+
+    def __init__(self, connection: aiosqlite.Connection, interval: float, max_statements: int):
+        self.connection = connection
+        self.interval = interval
+        self.max_statements = max_statements
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Запустить фоновую фиксацию"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Зафиксировать оставшиеся записи и остановиться"""
+        if self._task:
+            self._queue.put_nowait(None)
+            await self._task
+            self._task = None
+
+    async def submit(self, statements: list[tuple[str, tuple]]) -> list[WriteResult]:
+        """
+        Поставить запросы в очередь.
+        Запросы одного вызова применяются атомарно: либо все, либо ни одного.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((statements, future))
+        return await future
+
+    async def _run(self):
+        """Цикл сбора пачек"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            size = len(item[0])
+            deadline = loop.time() + self.interval
+
+            while size < self.max_statements:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            await self._apply(batch)
+
+        # Дописываем всё, что успели поставить в очередь до остановки
+        rest = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                rest.append(item)
+        if rest:
+            await self._apply(rest)
+
+    async def _apply(self, batch: list):
+        """Применить пачку одной транзакцией"""
+        done = []
+        try:
+            await self.connection.execute("BEGIN")
+            for statements, future in batch:
+                # Ошибка одного вызова не должна откатывать чужие записи
+                await self.connection.execute("SAVEPOINT batch_item")
+                try:
+                    results = []
+                    for query, params in statements:
+                        async with self.connection.execute(query, params) as cursor:
+                            rows = await cursor.fetchall()
+                            results.append(WriteResult(cursor.lastrowid, cursor.rowcount, rows))
+                    await self.connection.execute("RELEASE batch_item")
+                    done.append((future, results, None))
+                except Exception as e:
+                    await self.connection.execute("ROLLBACK TO batch_item")
+                    await self.connection.execute("RELEASE batch_item")
+                    done.append((future, None, e))
+            await self.connection.commit()
+        except Exception as e:
+            await self.connection.rollback()
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, results, error in done:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results)
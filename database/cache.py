@@ -0,0 +1,179 @@
+"""
+Кэши для часто читаемых строк базы данных
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Ограниченный LRU-кэш с временем жизни записей.
+    При переполнении вытесняются давно не использованные записи.
+    on_evict(key, value) вызывается для записей, которые кэш выбросил сам:
+    вытесненных или устаревших, но не удаленных через pop().
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Получить значение или default, если записи нет или она устарела"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at and expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            if self.on_evict:
+                self.on_evict(key, value)
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """Сохранить значение"""
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0.0
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            evicted_key, (_, evicted) = self._data.popitem(last=False)
+            if self.on_evict:
+                self.on_evict(evicted_key, evicted)
+
+    def pop(self, key: Hashable):
+        """Удалить запись"""
+        self._data.pop(key, None)
+
+    def clear(self):
+        """Очистить кэш"""
+        self._data.clear()
+
+    def stats(self) -> dict:
+        """Счетчики попаданий и промахов"""
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class VersionedCache:
+    """
+    Кэш со сквозной записью и версиями записей.
+    Каждая запись получает номер версии. Значение, прочитанное из базы,
+    попадает в кэш, только если ключ не менялся с начала чтения, поэтому
+    медленный читатель не затрет более свежую запись.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self._cache = TTLCache(maxsize, ttl)
+        self._clock = 0
+        # Версии последних записей; при переполнении помним только нижнюю границу
+        self._written: OrderedDict[Hashable, int] = OrderedDict()
+        self._written_limit = max(maxsize, 1)
+        self._floor = 0
+
+    @property
+    def hits(self) -> int:
+        return self._cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self._cache.misses
+
+    def version(self) -> int:
+        """Текущая версия; берется перед чтением из базы"""
+        return self._clock
+
+    def get(self, key: Hashable) -> Any:
+        """Получить значение из кэша"""
+        entry = self._cache.get(key)
+        return entry[1] if entry else None
+
+    def fill(self, key: Hashable, value: Any, version: int):
+        """Сохранить значение, прочитанное из базы начиная с версии version"""
+        written = self._written.get(key)
+        if written is None:
+            if version < self._floor:
+                return  # Запись могла случиться, но уже забыта — не рискуем
+        elif written > version:
+            return  # Ключ изменился, пока шло чтение
+        self._cache.set(key, (version, value))
+
+    def write(self, key: Hashable, value: Any):
+        """Сквозная запись после изменения в базе"""
+        version = self._bump(key)
+        self._cache.set(key, (version, value))
+
+    def invalidate(self, key: Hashable):
+        """Удалить значение после изменения в базе"""
+        self._bump(key)
+        self._cache.pop(key)
+
+    def stats(self) -> dict:
+        """Счетчики попаданий и промахов"""
+        return self._cache.stats()
+
+    def _bump(self, key: Hashable) -> int:
+        """Выдать новую версию для ключа"""
+        self._clock += 1
+        self._written[key] = self._clock
+        self._written.move_to_end(key)
+        while len(self._written) > self._written_limit:
+            _, version = self._written.popitem(last=False)
+            self._floor = max(self._floor, version)
+        return self._clock
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+class CardCache:
+    """
+    Кэш отрисованных карточек анкет: несколько видов карточек на анкету.
+    Карточки помечены updated_at анкеты, по которой построены, и для
+    другой версии анкеты не выдаются. Изменения анкеты в этом процессе
+    сбрасывают все её карточки сразу через invalidate().
+    """
+
+    def __init__(self, maxsize: int):
+        self._cache = TTLCache(maxsize)  # user_id -> (updated_at, {вид: карточка})
+
+    def get(self, kind: str, user_id: int, updated_at: Any) -> Any:
+        """Карточка вида kind для версии анкеты updated_at"""
+        entry = self._cache.get(user_id)
+        if entry is None or entry[0] != updated_at:
+            return None
+        return entry[1].get(kind)
+
+    def set(self, kind: str, user_id: int, updated_at: Any, card: Any):
+        """Сохранить карточку"""
+        entry = self._cache.get(user_id)
+        if entry is None or entry[0] != updated_at:
+            entry = (updated_at, {})
+            self._cache.set(user_id, entry)
+        entry[1][kind] = card
+
+    def invalidate(self, user_id: int):
+        """Сбросить карточки анкеты после её изменения"""
+        self._cache.pop(user_id)
+
+    def stats(self) -> dict:
+        """Счетчики попаданий и промахов"""
+        return self._cache.stats()
+
+    def __len__(self) -> int:
+        return len(self._cache)
@@ -0,0 +1,84 @@
+"""
+Очередь кандидатов для ленты анкет
+"""
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class ViewerQueue:
+    """Перемешанная очередь кандидатов одного пользователя"""
+    key: tuple  # Параметры поиска, под которые собрана очередь
+    pivot: int  # Случайная точка старта обхода по user_id
+    cursor: int  # Последний выбранный user_id
+    wrapped: bool = False  # Обход перешёл через конец таблицы
+    exhausted: bool = False  # Кандидаты закончились
+    items: deque = field(default_factory=deque)
+    # Ключи городов по порядку обхода; None — все остальные города
+    partitions: list = field(default_factory=list)
+    partition: int = 0  # Текущий город в partitions
+    # Диапазон возраста партнера: обход идет по (age, user_id) от (pivot_age, pivot)
+    age_range: Optional[tuple[int, int]] = None
+    pivot_age: int = 0
+    cursor_age: int = 0
+    # Пока True, очередь пополняется из таблицы recommendations
+    recommended: bool = False
+    rank_cursor: int = 0  # Последний выданный ранг
+    # Не вошедшие в top_k своей пачки: (оценка, user_id), показываются после обхода
+    ranked_rest: list = field(default_factory=list)
+    served: int = 0  # Показано анкет; по нему чередуются лайкнувшие
+
+    def next_partition(self) -> bool:
+        """Перейти к следующему городу; False, если города закончились"""
+        if self.partition + 1 >= len(self.partitions):
+            return False
+        self.partition += 1
+        self.cursor = self.pivot
+        self.cursor_age = self.pivot_age
+        self.wrapped = False
+        return True
+
+
+class CandidateQueue:
+    """
+    Очереди кандидатов для всех просматривающих.
+    Хранит не больше max_viewers очередей, вытесняя самые старые.
+    """
+
+    def __init__(self, max_viewers: int = 10000):
+        self.max_viewers = max_viewers
+        self._queues: OrderedDict[int, ViewerQueue] = OrderedDict()
+
+    def get(self, viewer_id: int, key: tuple) -> Optional[ViewerQueue]:
+        """Получить очередь, если она собрана под те же параметры поиска"""
+        queue = self._queues.get(viewer_id)
+        if queue is None:
+            return None
+        if queue.key != key:
+            del self._queues[viewer_id]
+            return None
+        self._queues.move_to_end(viewer_id)
+        return queue
+
+    def create(self, viewer_id: int, key: tuple, pivot: int, partitions: Optional[list] = None,
+               age_range: Optional[tuple[int, int]] = None, pivot_age: int = 0,
+               recommended: bool = False) -> ViewerQueue:
+        """Создать новую очередь, начиная обход с pivot"""
+        queue = ViewerQueue(
+            key=key, pivot=pivot, cursor=pivot, partitions=partitions or [],
+            age_range=age_range, pivot_age=pivot_age, cursor_age=pivot_age,
+            recommended=recommended
+        )
+        self._queues[viewer_id] = queue
+        self._queues.move_to_end(viewer_id)
+        while len(self._queues) > self.max_viewers:
+            self._queues.popitem(last=False)
+        return queue
+
+    def invalidate(self, viewer_id: int):
+        """Сбросить очередь пользователя"""
+        self._queues.pop(viewer_id, None)
+
+    def __len__(self) -> int:
+        return len(self._queues)
@@ -0,0 +1,91 @@
+"""
+Нормализация городов и соседние города для ленты
+"""
+import json
+import math
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+
+GAZETTEER_PATH = Path(__file__).with_name("cities.json")
+
+# «г. Москва», «город Москва»
+_PREFIX = re.compile(r"^(?:г|гор|город)\.?\s+")
+_SEPARATORS = re.compile(r"[\s\-‐–—_.,]+")
+
+
+def normalize_city(text: str) -> str:
+    """Привести название к виду для сравнения: регистр, пробелы, ё, дефисы"""
+    text = text.casefold().replace("ё", "е").strip()
+    text = _PREFIX.sub("", text)
+    return _SEPARATORS.sub(" ", text).strip()
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по большому кругу"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+@dataclass(frozen=True)
+class City:
+    """Город из справочника"""
+    key: str
+    name: str
+    lat: float
+    lon: float
+
+
+class Gazetteer:
+    """
+    Справочник городов с координатами и синонимами.
+    Ключ известного города — его key из справочника, неизвестного —
+    нормализованный текст, так что «Тверь» и «тверь » всё равно совпадут.
+    Соседи каждого города считаются один раз при загрузке.
+    """
+
+    def __init__(self, cities: list[City], aliases: dict[str, str],
+                 neighbor_radius_km: float = 300.0, max_neighbors: int = 5):
+        self.cities = {city.key: city for city in cities}
+        self.aliases = aliases  # нормализованное название -> ключ
+        self._neighbors: dict[str, list[str]] = {}
+        for city in cities:
+            nearby = sorted(
+                (distance_km(city.lat, city.lon, other.lat, other.lon), other.key)
+                for other in cities if other.key != city.key
+            )
+            self._neighbors[city.key] = [
+                key for distance, key in nearby[:max_neighbors] if distance <= neighbor_radius_km
+            ]
+
+    @classmethod
+    def load(cls, path: Optional[str] = None, **kwargs) -> "Gazetteer":
+        """Загрузить справочник из JSON; по умолчанию — встроенный cities.json"""
+        with open(path or GAZETTEER_PATH, encoding="utf-8") as file:
+            entries = json.load(file)
+
+        cities, aliases = [], {}
+        for entry in entries:
+            city = City(entry["key"], entry["name"], entry["lat"], entry["lon"])
+            cities.append(city)
+            for alias in (city.name, city.key, *entry.get("aliases", ())):
+                aliases[normalize_city(alias)] = city.key
+        return cls(cities, aliases, **kwargs)
+
+    def key(self, text: Optional[str]) -> Optional[str]:
+        """Канонический ключ города"""
+        if not text:
+            return None
+        normalized = normalize_city(text)
+        return self.aliases.get(normalized, normalized) or None
+
+    def neighbors(self, key: Optional[str]) -> list[str]:
+        """Ближайшие города из справочника, от ближних к дальним"""
+        return self._neighbors.get(key, [])
+
+    def __len__(self) -> int:
+        return len(self.cities)
@@ -0,0 +1,267 @@
+"""
+Хранилище состояний FSM в базе данных
+"""
+import asyncio
+import copy
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Mapping, Optional
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from .cache import TTLCache
+from .models import Database
+
+
+logger = logging.getLogger(__name__)
+
+
+def storage_key_id(key: StorageKey) -> str:
+    """Строковый ключ записи в таблице fsm_states"""
+    return ":".join(str(part) for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+    ))
+
+
+@dataclass
+class _Entry:
+    """Состояние и данные одного ключа, прочитанные из базы"""
+    state: Optional[str] = None
+    data: dict = field(default_factory=dict)
+    user_id: int = 0  # telegram id владельца
+    version: int = 0  # Растет при каждом изменении
+    saved: int = 0  # Версия, записанная в базу
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Состояния FSM в таблице fsm_states той же базы.
+    Запись читается из базы при первом обращении в пределах обновления,
+    изменения копятся в памяти и записываются одной транзакцией в flush(),
+    который вызывается после обработки каждого обновления. После записи
+    буфер очищается, поэтому память не растет с числом брошенных анкет.
+    В режиме воркера shard — (номер воркера, число воркеров): expire()
+    удаляет только записи пользователей этого воркера.
+    """
+
+    def __init__(self, db: Database, shard: Optional[tuple[int, int]] = None):
+        self.db = db
+        self.shard = shard
+        self._entries: dict[str, _Entry] = {}
+
+    async def _entry(self, key: StorageKey) -> _Entry:
+        """Запись ключа, при необходимости прочитанная из базы"""
+        key_id = storage_key_id(key)
+        entry = self._entries.get(key_id)
+        if entry is None:
+            state, data = await self.db.get_fsm_record(key_id)
+            # Пока шло чтение, запись могла появиться из параллельного обработчика
+            entry = self._entries.setdefault(key_id, _Entry(state, data, key.user_id))
+        return entry
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        entry.version += 1
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(
+                f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            )
+        entry = await self._entry(key)
+        entry.data = copy.deepcopy(data)
+        entry.version += 1
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return copy.deepcopy((await self._entry(key)).data)
+
+    async def flush(self):
+        """Записать накопленные изменения и освободить буфер"""
+        snapshot = {key_id: entry.version for key_id, entry in self._entries.items()}
+        changes = [
+            (key_id, entry.user_id, entry.state, entry.data)
+            for key_id, entry in self._entries.items()
+            if entry.version != entry.saved
+        ]
+        if changes:
+            await self.db.save_fsm_records(changes)
+
+        for key_id, version in snapshot.items():
+            entry = self._entries.get(key_id)
+            if entry is None:
+                continue
+            entry.saved = max(entry.saved, version)
+            # Изменения, сделанные во время записи, дождутся следующего flush
+            if entry.version == entry.saved:
+                del self._entries[key_id]
+
+    async def expire(self, max_age: float) -> list[tuple[str, Optional[str]]]:
+        """Удалить записи, не менявшиеся дольше max_age секунд; вернуть пары (ключ, состояние)"""
+        await self.flush()
+        return await self.db.expire_fsm_records(max_age, self.shard)
+
+    async def close(self) -> None:
+        await self.flush()
+
+
+@dataclass
+class _Session:
+    """Незавершенный сценарий пользователя"""
+    last_seen: float
+    state: Optional[str] = None
+    size: int = 0  # Примерный объем данных в байтах
+
+
+class TTLStorage(BaseStorage):
+    """
+    Обертка над хранилищем FSM, которая забывает брошенные сценарии.
+    Сценарий без активности дольше ttl секунд сбрасывается фоновой
+    очисткой; при числе сценариев больше max_sessions сбрасываются
+    давно не использованные. Ключи сброшенных сценариев запоминаются,
+    чтобы вернувшемуся пользователю предложить начать заново.
+    Если вложенное хранилище умеет expire(), очистка заодно удаляет
+    старые записи, оставшиеся с прошлых запусков.
+    """
+
+    def __init__(self, storage: BaseStorage, ttl: float, max_sessions: int,
+                 sweep_interval: float = 300.0, evicted_ttl: float = 7 * 24 * 3600):
+        self.storage = storage
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sweep_interval = sweep_interval
+        self.evicted_total = 0
+        self._sessions: OrderedDict[StorageKey, _Session] = OrderedDict()
+        self._evicted = TTLCache(max_sessions, evicted_ttl)  # Ключ -> брошенное состояние
+        self._task: Optional[asyncio.Task] = None
+        self._resets: set[asyncio.Task] = set()  # Фоновые сбросы вытесненных сценариев
+
+    def start(self):
+        """Запустить фоновую очистку"""
+        self._task = asyncio.create_task(self._run())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.storage.set_state(key, state)
+        session = self._touch(key)
+        session.state = state.state if isinstance(state, State) else state
+        self._forget_if_empty(key, session)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state = await self.storage.get_state(key)
+        if state is not None:
+            self._touch(key).state = state
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self.storage.set_data(key, data)
+        session = self._touch(key)
+        session.size = len(json.dumps(data, ensure_ascii=False, default=str)) if data else 0
+        self._forget_if_empty(key, session)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        data = await self.storage.get_data(key)
+        if data:
+            self._touch(key)
+        return data
+
+    def pop_evicted(self, key: StorageKey) -> Optional[str]:
+        """Состояние, в котором был сброшен сценарий пользователя, если был"""
+        state = self._evicted.get(storage_key_id(key))
+        if state is not None:
+            self._evicted.pop(storage_key_id(key))
+        return state
+
+    def stats(self) -> dict:
+        """Живые сценарии и примерный объем их данных"""
+        return {
+            "sessions": len(self._sessions),
+            "bytes": sum(session.size + len(session.state or "") for session in self._sessions.values()),
+            "evicted": self.evicted_total,
+        }
+
+    async def sweep(self):
+        """Сбросить сценарии без активности дольше ttl"""
+        deadline = time.monotonic() - self.ttl
+        expired = []
+        for key, session in self._sessions.items():
+            if session.last_seen >= deadline:
+                break  # Дальше по порядку LRU только более свежие
+            expired.append(key)
+        for key in expired:
+            await self._reset(key, self._sessions.pop(key))
+
+        expire = getattr(self.storage, "expire", None)
+        if expire:
+            for key_id, state in await expire(self.ttl):
+                self.evicted_total += 1
+                if state:
+                    self._evicted.set(key_id, state)
+
+        if expired:
+            logger.info("Сброшено брошенных сценариев: %s, осталось: %s", len(expired), self.stats())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Вытесненные сценарии должны успеть сброситься до закрытия хранилища
+        while self._resets:
+            await asyncio.gather(*self._resets)
+        await self.storage.close()
+
+    def _touch(self, key: StorageKey) -> _Session:
+        """Отметить активность сценария"""
+        session = self._sessions.get(key)
+        if session is None:
+            session = self._sessions[key] = _Session(time.monotonic())
+        else:
+            session.last_seen = time.monotonic()
+            self._sessions.move_to_end(key)
+        while len(self._sessions) > self.max_sessions:
+            # Сбрасываем в фоне: обработчик не должен ждать чужую запись
+            oldest, evicted = self._sessions.popitem(last=False)
+            task = asyncio.create_task(self._reset(oldest, evicted))
+            self._resets.add(task)
+            task.add_done_callback(self._resets.discard)
+        return session
+
+    def _forget_if_empty(self, key: StorageKey, session: _Session):
+        """Завершенный сценарий больше не отслеживаем"""
+        if session.state is None and not session.size:
+            self._sessions.pop(key, None)
+
+    async def _reset(self, key: StorageKey, session: _Session):
+        """Сбросить вытесненный сценарий во вложенном хранилище"""
+        self.evicted_total += 1
+        if session.state:
+            # Без состояния сценария нет, предлагать начать заново незачем
+            self._evicted.set(storage_key_id(key), session.state)
+        try:
+            await self.storage.set_state(key, None)
+            await self.storage.set_data(key, {})
+            flush = getattr(self.storage, "flush", None)
+            if flush:
+                await flush()
+        except Exception:
+            logger.exception("Не удалось сбросить состояние FSM %s", storage_key_id(key))
+
+    async def _run(self):
+        """Цикл фоновой очистки"""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Ошибка очистки состояний FSM")
@@ -0,0 +1,102 @@
+"""
+Индексы базы данных и проверка планов запросов
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+import aiosqlite
+
+
+@dataclass(frozen=True)
+class Index:
+    """Описание индекса"""
+    name: str
+    table: str
+    columns: str
+    where: Optional[str] = None  # Условие частичного индекса
+
+    def create_sql(self) -> str:
+        sql = f"CREATE INDEX IF NOT EXISTS {self.name} ON {self.table}({self.columns})"
+        if self.where:
+            sql += f" WHERE {self.where}"
+        return sql
+
+
+@dataclass(frozen=True)
+class PlanExpectation:
+    """Индекс, который обязан использовать запрос"""
+    name: str
+    query: str
+    params: tuple
+    index: str
+
+
+INDEXES = [
+    Index("idx_profiles_gender", "profiles", "gender, looking_for"),
+    # Лента: обход видимых анкет по user_id внутри пары gender/looking_for
+    Index("idx_profiles_feed", "profiles", "gender, looking_for, user_id", where="is_visible = 1"),
+    # То же внутри одного города
+    Index(
+        "idx_profiles_city_feed", "profiles", "city_key, gender, looking_for, user_id",
+        where="is_visible = 1"
+    ),
+    # Лента с диапазоном возраста партнера: обход по (age, user_id) без сортировки
+    Index("idx_profiles_age", "profiles", "gender, looking_for, is_visible, age, user_id"),
+    # То же внутри одного города
+    Index("idx_profiles_city_age", "profiles", "city_key, gender, looking_for, is_visible, age, user_id"),
+    # Лайкнувшие пользователя, от новых к старым; им же читаются входящие лайки
+    Index("idx_likes_admirers", "likes", "to_user_id, is_like, created_at, from_user_id"),
+    Index("idx_matches_user1", "matches", "user1_id, created_at"),
+    Index("idx_matches_user2", "matches", "user2_id, created_at"),
+    # Очередь уведомлений о мэтчах: только неотправленные
+    Index(
+        "idx_match_notifications_pending", "match_notifications", "next_attempt_at, id",
+        where="status = 'pending'"
+    ),
+    # Очистка брошенных состояний FSM
+    Index("idx_fsm_states_updated", "fsm_states", "updated_at"),
+]
+
+# Индексы, которые больше не нужны
+OBSOLETE_INDEXES = [
+    "idx_likes_users",  # Дублировал UNIQUE(from_user_id, to_user_id)
+    "idx_profiles_city",  # По сырому тексту города; заменен idx_profiles_city_feed
+    "idx_likes_reverse",  # Входящие лайки; заменен idx_likes_admirers
+]
+
+
+async def ensure_indexes(connection: aiosqlite.Connection):
+    """Создать недостающие индексы и удалить устаревшие"""
+    for name in OBSOLETE_INDEXES:
+        await connection.execute(f"DROP INDEX IF EXISTS {name}")
+    for index in INDEXES:
+        await connection.execute(index.create_sql())
+    await connection.commit()
+
+
+async def explain(connection: aiosqlite.Connection, query: str, params=()) -> list[str]:
+    """Шаги плана запроса из EXPLAIN QUERY PLAN"""
+    async with connection.execute(f"EXPLAIN QUERY PLAN {query}", params) as cursor:
+        return [row[3] for row in await cursor.fetchall()]
+
+
+async def check_plans(connection: aiosqlite.Connection, expectations: list[PlanExpectation]) -> list[str]:
+    """
+    Проверить, что запросы используют свои индексы.
+    Возвращает описания нарушений: полный обход таблицы, сортировка
+    во временном B-дереве или другой индекс.
+    """
+    problems = []
+    for expectation in expectations:
+        steps = await explain(connection, expectation.query, expectation.params)
+        plan = "; ".join(steps)
+        # Обход уже ограниченного подзапроса допустим, обход таблицы — нет
+        scans = [step for step in steps if step.startswith("SCAN ") and not step.startswith("SCAN (")]
+        if scans:
+            problems.append(f"{expectation.name}: полный обход ({plan})")
+        elif any(step.startswith("USE TEMP B-TREE") for step in steps):
+            # Сортировка читает все подходящие строки, а не LIMIT первых по индексу
+            problems.append(f"{expectation.name}: сортировка во временном B-дереве ({plan})")
+        elif expectation.index not in plan:
+            problems.append(f"{expectation.name}: не используется {expectation.index} ({plan})")
+    return problems
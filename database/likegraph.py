@@ -0,0 +1,109 @@
+"""
+Граф лайков в памяти
+"""
+import sys
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Iterable
+
+
+def _contains(values: array, value: int) -> bool:
+    """Есть ли значение в отсортированном массиве"""
+    index = bisect_left(values, value)
+    return index < len(values) and values[index] == value
+
+
+def _discard(values: array, value: int):
+    """Удалить значение из отсортированного массива"""
+    index = bisect_left(values, value)
+    if index < len(values) and values[index] == value:
+        del values[index]
+
+
+class LikeGraph:
+    """
+    Исходящие оценки пользователей в памяти.
+    Для каждого загруженного пользователя хранятся два отсортированных
+    массива id: кого он оценил (лайк или дизлайк) и кого лайкнул.
+    Пользователи подгружаются из таблицы likes по первому обращению.
+    Хранит не больше max_users пользователей, вытесняя давно не нужных;
+    вытесненный перечитывается из likes при следующем обращении.
+    """
+
+    def __init__(self, max_users: int = 100000):
+        self.max_users = max_users
+        self._rated: OrderedDict[int, array] = OrderedDict()
+        self._liked: dict[int, array] = {}
+
+    def is_loaded(self, user_id: int) -> bool:
+        return user_id in self._rated
+
+    def load(self, user_id: int, rows: Iterable[tuple[int, bool]]):
+        """Загрузить исходящие оценки пользователя: пары (to_user_id, is_like)"""
+        rated = array("q")
+        liked = array("q")
+        for to_user_id, is_like in sorted(rows):
+            rated.append(to_user_id)
+            if is_like:
+                liked.append(to_user_id)
+        self._rated[user_id] = rated
+        self._liked[user_id] = liked
+        self._rated.move_to_end(user_id)
+        while len(self._rated) > self.max_users:
+            evicted, _ = self._rated.popitem(last=False)
+            del self._liked[evicted]
+
+    def _touch(self, user_id: int) -> array:
+        """Оценки загруженного пользователя; он становится самым свежим"""
+        self._rated.move_to_end(user_id)
+        return self._rated[user_id]
+
+    def record(self, from_user_id: int, to_user_id: int, is_like: bool):
+        """Учесть новую оценку; для незагруженного пользователя ничего не делает"""
+        if from_user_id not in self._rated:
+            return
+        rated = self._touch(from_user_id)
+
+        if not _contains(rated, to_user_id):
+            insort(rated, to_user_id)
+
+        liked = self._liked[from_user_id]
+        if is_like:
+            if not _contains(liked, to_user_id):
+                insort(liked, to_user_id)
+        else:
+            # Повторная оценка могла сменить лайк на дизлайк
+            _discard(liked, to_user_id)
+
+    def has_rated(self, from_user_id: int, to_user_id: int) -> bool:
+        return _contains(self._touch(from_user_id), to_user_id)
+
+    def has_liked(self, from_user_id: int, to_user_id: int) -> bool:
+        self._touch(from_user_id)
+        return _contains(self._liked[from_user_id], to_user_id)
+
+    def filter_unrated(self, user_id: int, candidate_ids: Iterable[int]) -> list[int]:
+        """Оставить только тех, кого пользователь ещё не оценивал"""
+        rated = self._touch(user_id)
+        return [candidate_id for candidate_id in candidate_ids if not _contains(rated, candidate_id)]
+
+    def clear(self):
+        """Забыть всех пользователей"""
+        self._rated.clear()
+        self._liked.clear()
+
+    def memory_usage(self) -> int:
+        """Примерный объем памяти в байтах"""
+        total = sys.getsizeof(self._rated) + sys.getsizeof(self._liked)
+        for values in (*self._rated.values(), *self._liked.values()):
+            total += sys.getsizeof(values)
+        return total
+
+    def stats(self) -> dict:
+        """Размер графа"""
+        return {
+            "users": len(self._rated),
+            "edges": sum(len(values) for values in self._rated.values()),
+            "bytes": self.memory_usage(),
+        }
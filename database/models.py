@@ -1,12 +1,244 @@
 """
 Модели базы данных для бота знакомств
 """
+import asyncio
+import json
+import logging
+import random
 import aiosqlite
 from datetime import datetime, date
 from dataclasses import dataclass
 from typing import Optional
 from enum import Enum
 
+from config import DatabaseConfig
+from .admirers import AdmirerLanes
+from .batching import WriteBatcher, WriteResult
+from .cache import CardCache, TTLCache, VersionedCache
+from .candidates import CandidateQueue
+from .cities import Gazetteer
+from .indexes import PlanExpectation, check_plans, ensure_indexes
+from .likegraph import LikeGraph
+from .seen import SeenSet, SeenSets
+from .pool import ConnectionPool
+from .ranking import rank_candidates
+
+
+logger = logging.getLogger(__name__)
+
+
+# Пачка кандидатов для ленты: обход видимых анкет по user_id (idx_profiles_feed)
+# или, если задан возраст партнера, по (age, user_id) (idx_profiles_age).
+# Условие обхода добавляется к запросу отдельно
+FEED_FROM = """
+    FROM profiles p
+    JOIN users u ON p.user_id = u.id
+    WHERE p.user_id != ?
+    AND p.gender = ?
+    AND p.looking_for = ?
+    AND p.is_visible = 1
+    AND u.is_active = 1
+    AND u.is_banned = 0
+"""
+FEED_QUERY = "SELECT p.user_id" + FEED_FROM
+FEED_AFTER_USER = " AND p.user_id > ?"
+AGE_FEED_QUERY = "SELECT p.user_id, p.age" + FEED_FROM
+FEED_AFTER_AGE = " AND (p.age, p.user_id) > (?, ?)"
+# Та же пачка с признаками для ранжирования; параметры — город и id смотрящего
+RANKED_FEED_QUERY = """
+    SELECT p.user_id, p.age,
+           COALESCE(p.city_key = ?, 0) AS same_city,
+           CAST(strftime('%s', p.updated_at) AS INTEGER) AS updated_ts,
+           CASE WHEN json_valid(p.photos) THEN json_array_length(p.photos) ELSE 0 END AS photo_count,
+           COALESCE(p.video, '') != '' AS has_video,
+           EXISTS (
+               SELECT 1 FROM likes l
+               WHERE l.from_user_id = p.user_id AND l.to_user_id = ? AND l.is_like = 1
+           ) AS liked_me
+""" + FEED_FROM
+# Следующие заранее посчитанные рекомендации по порядку ранга
+# Оцененные после расчета пропускаются здесь же, иначе каждый из них
+# стоил бы отдельного CANDIDATE_QUERY в _fetch_candidate
+RECOMMENDATIONS_QUERY = """
+    SELECT rank, candidate_id FROM recommendations
+    WHERE viewer_id = ? AND rank > ?
+    AND NOT EXISTS (
+        SELECT 1 FROM likes WHERE from_user_id = ? AND to_user_id = candidate_id
+    )
+    ORDER BY rank
+    LIMIT ?
+"""
+# Кто лайкнул пользователя и ещё не оценен им, от новых лайков к старым (idx_likes_admirers)
+ADMIRERS_QUERY = """
+    SELECT l.from_user_id FROM likes l
+    WHERE l.to_user_id = ? AND l.is_like = 1
+    AND NOT EXISTS (
+        SELECT 1 FROM likes r WHERE r.from_user_id = ? AND r.to_user_id = l.from_user_id
+    )
+    ORDER BY l.created_at DESC
+    LIMIT ?
+"""
+# Исключение уже оцененных, когда графа лайков в памяти нет
+FEED_UNRATED_FILTER = """
+    AND p.user_id NOT IN (
+        SELECT to_user_id FROM likes WHERE from_user_id = ?
+    )
+"""
+
+# Анкета кандидата, если её всё ещё можно показать
+CANDIDATE_QUERY = """
+    SELECT p.*, u.telegram_id, u.username FROM profiles p
+    JOIN users u ON p.user_id = u.id
+    WHERE p.user_id = ?
+    AND p.gender = ?
+    AND p.looking_for = ?
+    AND p.is_visible = 1
+    AND u.is_active = 1
+    AND u.is_banned = 0
+"""
+CANDIDATE_UNRATED_FILTER = """
+    AND NOT EXISTS (
+        SELECT 1 FROM likes WHERE from_user_id = ? AND to_user_id = p.user_id
+    )
+"""
+
+# Встречный лайк для проверки мэтча
+MUTUAL_LIKE_QUERY = """
+    SELECT id FROM likes 
+    WHERE from_user_id = ? AND to_user_id = ? AND is_like = 1
+"""
+
+# Половина страницы мэтчей: мэтчи, где пользователь стоит в колонке {own}.
+# Только таблица matches, чтобы ORDER BY и LIMIT читались прямо из индекса
+# idx_matches_user1/2 без сортировки; анкеты присоединяются снаружи
+MATCHES_SIDE_QUERY = """
+    SELECT * FROM (
+        SELECT m.id AS match_id, m.created_at, m.{other} AS partner_id
+        FROM matches m
+        WHERE m.{own} = ? {after}
+        AND EXISTS (SELECT 1 FROM profiles WHERE user_id = m.{other})
+        ORDER BY m.created_at DESC, m.id DESC
+        LIMIT ?
+    )
+"""
+MATCHES_AFTER_CURSOR = "AND (m.created_at, m.id) < (SELECT created_at, id FROM matches WHERE id = ?)"
+
+# Уведомление о мэтче одному из участников.
+# UNIQUE(match_id, user_id) не дает встречным лайкам поставить его дважды
+MATCH_NOTIFICATION_INSERT = """
+    INSERT OR IGNORE INTO match_notifications (match_id, user_id, partner_id)
+    SELECT id, ?, ? FROM matches WHERE user1_id = ? AND user2_id = ?
+"""
+
+# Уведомления, которые пора отправить, с данными для текста.
+# {shard} — отбор уведомлений своего воркера в многопроцессном режиме
+PENDING_NOTIFICATIONS_QUERY = """
+    SELECT n.id, n.match_id, n.user_id, n.partner_id, n.attempts,
+           u.telegram_id, pu.telegram_id AS partner_telegram_id, p.name AS partner_name
+    FROM match_notifications n
+    JOIN users u ON u.id = n.user_id
+    JOIN users pu ON pu.id = n.partner_id
+    LEFT JOIN profiles p ON p.user_id = n.partner_id
+    WHERE n.status = 'pending' AND n.next_attempt_at <= CURRENT_TIMESTAMP {shard}
+    ORDER BY n.next_attempt_at, n.id
+    LIMIT ?
+"""
+
+
+def matches_page_query(with_cursor: bool) -> str:
+    """
+    Запрос страницы мэтчей: обе половины по своим индексам и данные собеседника.
+    Общий ORDER BY по объединению заставил бы сортировать каждую половину,
+    поэтому половины сливаются по порядку уже в get_user_matches_page.
+    """
+    after = MATCHES_AFTER_CURSOR if with_cursor else ""
+    return f"""
+        SELECT page.match_id, page.created_at,
+               p.user_id, p.name, p.age, p.city,
+               json_extract(p.photos, '$[0]') AS photo,
+               p.updated_at, u.telegram_id
+        FROM ({MATCHES_SIDE_QUERY.format(own="user1_id", other="user2_id", after=after)}
+              UNION ALL
+              {MATCHES_SIDE_QUERY.format(own="user2_id", other="user1_id", after=after)}) page
+        JOIN profiles p ON p.user_id = page.partner_id
+        JOIN users u ON u.id = page.partner_id
+    """
+
+
+# Столбцы, добавленные после первых версий: таблица -> [(имя, объявление)]
+ADDED_COLUMNS = {
+    "profiles": [
+        ("city_key", "TEXT"),
+        ("min_partner_age", "INTEGER"),
+        ("max_partner_age", "INTEGER"),
+    ],
+    "fsm_states": [
+        ("user_id", "INTEGER"),  # telegram id владельца: по нему запись относится к воркеру
+    ],
+}
+
+# Допустимый возраст в анкете
+MIN_AGE = 18
+MAX_AGE = 100
+
+
+# Запросы горячего пути и индексы, без которых они превращаются в полный обход
+PLAN_EXPECTATIONS = [
+    PlanExpectation(
+        "лента", FEED_QUERY + FEED_UNRATED_FILTER + FEED_AFTER_USER + " ORDER BY p.user_id LIMIT ?",
+        (0, "male", "female", 0, 0, 50), "idx_profiles_feed"
+    ),
+    PlanExpectation(
+        "лента с ранжированием",
+        RANKED_FEED_QUERY + FEED_UNRATED_FILTER + FEED_AFTER_USER + " ORDER BY p.user_id LIMIT ?",
+        ("", 0, 0, "male", "female", 0, 0, 1000), "idx_profiles_feed"
+    ),
+    PlanExpectation(
+        "лента по городу",
+        FEED_QUERY + FEED_UNRATED_FILTER + FEED_AFTER_USER + " AND p.city_key = ? ORDER BY p.user_id LIMIT ?",
+        (0, "male", "female", 0, 0, "moscow", 50), "idx_profiles_city_feed"
+    ),
+    PlanExpectation(
+        "лента по возрасту",
+        AGE_FEED_QUERY + FEED_UNRATED_FILTER + FEED_AFTER_AGE + " AND p.age <= ? ORDER BY p.age, p.user_id LIMIT ?",
+        (0, "male", "female", 0, 25, 0, 30, 50), "idx_profiles_age"
+    ),
+    PlanExpectation(
+        "лента по городу и возрасту",
+        AGE_FEED_QUERY + FEED_UNRATED_FILTER + FEED_AFTER_AGE
+        + " AND p.age <= ? AND p.city_key = ? ORDER BY p.age, p.user_id LIMIT ?",
+        (0, "male", "female", 0, 25, 0, 30, "moscow", 50), "idx_profiles_city_age"
+    ),
+    PlanExpectation(
+        "рекомендации", RECOMMENDATIONS_QUERY,
+        (0, 0, 0, 50), "PRIMARY KEY"
+    ),
+    PlanExpectation(
+        "лайкнувшие", ADMIRERS_QUERY,
+        (0, 0, 200), "idx_likes_admirers"
+    ),
+    PlanExpectation(
+        "взаимный лайк", MUTUAL_LIKE_QUERY,
+        (0, 0), "sqlite_autoindex_likes_1"
+    ),
+    PlanExpectation(
+        "входящие лайки", "SELECT from_user_id FROM likes WHERE to_user_id = ? AND is_like = 1",
+        (0,), "idx_likes_admirers"
+    ),
+    PlanExpectation(
+        "мэтчи (первая половина)", matches_page_query(with_cursor=True),
+        (0, 0, 11, 0, 0, 11), "idx_matches_user1"
+    ),
+    PlanExpectation(
+        "мэтчи (вторая половина)", matches_page_query(with_cursor=True),
+        (0, 0, 11, 0, 0, 11), "idx_matches_user2"
+    ),
+    PlanExpectation(
+        "уведомления о мэтчах", PENDING_NOTIFICATIONS_QUERY.format(shard=""),
+        (50,), "idx_match_notifications_pending"
+    ),
+]
+
 
 class Gender(Enum):
     MALE = "male"
@@ -82,23 +314,126 @@ class Payment:
     created_at: datetime
 
 
+def decode_profile(row) -> dict:
+    """Строка анкеты со списком фото, уже разобранным из JSON"""
+    profile = dict(row)
+    profile["photo_list"] = json.loads(profile["photos"]) if profile.get("photos") else []
+    return profile
+
+
 class Database:
     """Класс для работы с базой данных"""
     
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, config: Optional[DatabaseConfig] = None):
         self.db_path = db_path
+        self.config = config or DatabaseConfig(path=db_path)
+        self.pool = ConnectionPool(db_path, self.config)
         self.connection: Optional[aiosqlite.Connection] = None
+        self.batcher: Optional[WriteBatcher] = None
+        self._write_lock = asyncio.Lock()
+        self.candidates = CandidateQueue(self.config.candidate_queue_users)
+        # Кто уже лайкнул пользователя: показываются в ленте вперемешку с остальными
+        self.admirers: Optional[AdmirerLanes] = None
+        if self.config.admirers_every:
+            self.admirers = AdmirerLanes(self.config.admirers_max_users)
+        # telegram_id -> строка users
+        self.users = TTLCache(self.config.user_cache_size, self.config.user_cache_ttl)
+        # user_id -> разобранная анкета
+        self.profiles = VersionedCache(self.config.profile_cache_size, self.config.profile_cache_ttl)
+        # user_id -> готовые карточки анкеты
+        self.cards = CardCache(self.config.card_cache_size)
+        # Справочник городов: канонические ключи и соседи
+        self.cities = Gazetteer.load(
+            self.config.cities_path or None,
+            neighbor_radius_km=self.config.city_neighbor_radius_km,
+            max_neighbors=self.config.city_max_neighbors
+        )
+        # Исходящие оценки в памяти (опционально)
+        self.like_graph: Optional[LikeGraph] = (
+            LikeGraph(self.config.like_graph_max_users) if self.config.like_graph else None
+        )
+        self._like_graph_loads: dict[int, asyncio.Future] = {}
+        # Фильтры «уже оценил» вместо подзапроса NOT IN (опционально)
+        self.seen_sets: Optional[SeenSets] = None
+        if self.config.seen_filter:
+            self.seen_sets = SeenSets(
+                self.config.seen_filter_capacity, self.config.seen_filter_error_rate,
+                self.config.seen_filter_max_users
+            )
+        self._seen_loads: dict[int, asyncio.Future] = {}
     
     async def connect(self):
         """Подключение к базе данных"""
-        self.connection = await aiosqlite.connect(self.db_path)
-        self.connection.row_factory = aiosqlite.Row
-        await self.create_tables()
+        await self.pool.open()
+        self.connection = self.pool.writer
+        try:
+            await self.create_tables()
+        except BaseException:
+            # Потоки открытых соединений не дали бы процессу завершиться
+            await self.pool.close()
+            self.connection = None
+            raise
+        
+        for problem in await self.check_query_plans():
+            logger.warning("План запроса: %s", problem)
+        
+        if self.config.group_commit:
+            self.batcher = WriteBatcher(
+                self.connection,
+                interval=self.config.group_commit_interval,
+                max_statements=self.config.group_commit_max_statements
+            )
+            self.batcher.start()
     
     async def disconnect(self):
         """Отключение от базы данных"""
+        if self.seen_sets and self.connection:
+            await self.flush_seen_sets()
+        if self.batcher:
+            await self.batcher.stop()
+            self.batcher = None
         if self.connection:
-            await self.connection.close()
+            await self.pool.close()
+            self.connection = None
+    
+    async def _fetchone(self, query: str, params=()) -> Optional[aiosqlite.Row]:
+        """Выполнить запрос на чтение и вернуть одну строку"""
+        async with self.pool.reader() as connection:
+            async with connection.execute(query, params) as cursor:
+                return await cursor.fetchone()
+    
+    async def _fetchall(self, query: str, params=()) -> list[aiosqlite.Row]:
+        """Выполнить запрос на чтение и вернуть все строки"""
+        async with self.pool.reader() as connection:
+            async with connection.execute(query, params) as cursor:
+                return await cursor.fetchall()
+    
+    async def _write(self, query: str, params=()) -> WriteResult:
+        """Выполнить изменяющий запрос и зафиксировать его"""
+        results = await self._write_many([(query, params)])
+        return results[0]
+    
+    async def _write_many(self, statements: list[tuple[str, tuple]]) -> list[WriteResult]:
+        """
+        Атомарно выполнить несколько изменяющих запросов.
+        В режиме group_commit запросы уходят в общую транзакцию с записями
+        других обработчиков, иначе фиксируются сразу.
+        """
+        if self.batcher:
+            return await self.batcher.submit(statements)
+        
+        async with self._write_lock:
+            results = []
+            try:
+                for query, params in statements:
+                    async with self.connection.execute(query, params) as cursor:
+                        rows = await cursor.fetchall()
+                        results.append(WriteResult(cursor.lastrowid, cursor.rowcount, rows))
+                await self.connection.commit()
+            except Exception:
+                await self.connection.rollback()
+                raise
+            return results
     
     async def create_tables(self):
         """Создание таблиц"""
@@ -120,6 +455,9 @@ class Database:
                 gender TEXT NOT NULL,
                 looking_for TEXT NOT NULL,
                 city TEXT NOT NULL,
+                city_key TEXT,
+                min_partner_age INTEGER,
+                max_partner_age INTEGER,
                 bio TEXT,
                 photos TEXT DEFAULT '[]',
                 video TEXT,
@@ -169,209 +507,871 @@ class Database:
                 FOREIGN KEY (user_id) REFERENCES users(id)
             );
             
-            CREATE INDEX IF NOT EXISTS idx_profiles_gender ON profiles(gender, looking_for);
-            CREATE INDEX IF NOT EXISTS idx_profiles_city ON profiles(city);
-            CREATE INDEX IF NOT EXISTS idx_likes_users ON likes(from_user_id, to_user_id);
+            CREATE TABLE IF NOT EXISTS seen_filters (
+                user_id INTEGER PRIMARY KEY,
+                bits BLOB NOT NULL,
+                capacity INTEGER NOT NULL,
+                error_rate REAL NOT NULL,
+                count INTEGER NOT NULL,
+                watermark INTEGER NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            );
+            
+            CREATE TABLE IF NOT EXISTS match_notifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                match_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                partner_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                last_error TEXT,
+                next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                sent_at TIMESTAMP,
+                FOREIGN KEY (match_id) REFERENCES matches(id),
+                FOREIGN KEY (user_id) REFERENCES users(id),
+                FOREIGN KEY (partner_id) REFERENCES users(id),
+                UNIQUE(match_id, user_id)
+            );
+            
+            CREATE TABLE IF NOT EXISTS fsm_states (
+                key TEXT PRIMARY KEY,
+                user_id INTEGER,
+                state TEXT,
+                data TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            
+            -- Заполняется пакетным расчетом (recommend.py)
+            CREATE TABLE IF NOT EXISTS recommendations (
+                viewer_id INTEGER NOT NULL,
+                rank INTEGER NOT NULL,
+                candidate_id INTEGER NOT NULL,
+                PRIMARY KEY (viewer_id, rank)
+            ) WITHOUT ROWID;
+            
+            CREATE TABLE IF NOT EXISTS recommendation_progress (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                next_viewer_id INTEGER NOT NULL,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            );
+            
         """)
         await self.connection.commit()
+        await self._migrate()
+        await ensure_indexes(self.connection)
+    
+    async def _migrate(self):
+        """
+        Добавить столбцы, появившиеся после создания базы, и заполнить их.
+        Воркеры запускаются одновременно, поэтому проверка столбцов и ALTER
+        идут под блокировкой записи: второй воркер ждет первого и видит уже
+        добавленные столбцы.
+        """
+        await self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            await self._apply_migrations()
+        except BaseException:
+            await self.connection.rollback()
+            raise
+        await self.connection.commit()
+    
+    async def _apply_migrations(self):
+        """Шаги миграции внутри транзакции _migrate"""
+        for table, added in ADDED_COLUMNS.items():
+            async with self.connection.execute(f"PRAGMA table_info({table})") as cursor:
+                columns = {row["name"] for row in await cursor.fetchall()}
+            for column, declaration in added:
+                if column not in columns:
+                    await self.connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+        
+        # Ключ FSM — bot_id:chat_id:user_id:..., см. database.fsm_storage.storage_key_id
+        async with self.connection.execute("SELECT key FROM fsm_states WHERE user_id IS NULL") as cursor:
+            rows = await cursor.fetchall()
+        if rows:
+            await self.connection.executemany(
+                "UPDATE fsm_states SET user_id = ? WHERE key = ?",
+                [(int(row["key"].split(":")[2]), row["key"]) for row in rows]
+            )
+        
+        async with self.connection.execute(
+            "SELECT user_id, city FROM profiles WHERE city_key IS NULL"
+        ) as cursor:
+            rows = await cursor.fetchall()
+        if rows:
+            await self.connection.executemany(
+                "UPDATE profiles SET city_key = ? WHERE user_id = ?",
+                [(self.cities.key(row["city"]), row["user_id"]) for row in rows]
+            )
+            logger.info("Заполнены ключи городов: %s анкет", len(rows))
+    
+    async def check_query_plans(self) -> list[str]:
+        """Проверить планы запросов горячего пути, вернуть найденные проблемы"""
+        async with self.pool.reader() as connection:
+            return await check_plans(connection, PLAN_EXPECTATIONS)
     
     # === Пользователи ===
     
     async def get_or_create_user(self, telegram_id: int, username: str = None) -> int:
         """Получить или создать пользователя, возвращает user_id"""
-        cursor = await self.connection.execute(
+        cached = self.users.get(telegram_id)
+        if cached:
+            return cached["id"]
+        
+        row = await self._fetchone(
             "SELECT id FROM users WHERE telegram_id = ?", (telegram_id,)
         )
-        row = await cursor.fetchone()
         if row:
             return row["id"]
         
-        cursor = await self.connection.execute(
+        result = await self._write(
             "INSERT INTO users (telegram_id, username) VALUES (?, ?)",
             (telegram_id, username)
         )
-        await self.connection.commit()
-        return cursor.lastrowid
+        return result.lastrowid
     
     async def get_user_by_telegram_id(self, telegram_id: int) -> Optional[dict]:
         """Получить пользователя по telegram_id"""
-        cursor = await self.connection.execute(
+        cached = self.users.get(telegram_id)
+        if cached:
+            return dict(cached)
+        
+        row = await self._fetchone(
             "SELECT * FROM users WHERE telegram_id = ?", (telegram_id,)
         )
-        row = await cursor.fetchone()
-        return dict(row) if row else None
+        if not row:
+            return None
+        
+        user = dict(row)
+        self.users.set(telegram_id, user)
+        return dict(user)
+    
+    async def set_user_banned(self, user_id: int, is_banned: bool):
+        """Заблокировать или разблокировать пользователя"""
+        result = await self._write(
+            "UPDATE users SET is_banned = ? WHERE id = ? RETURNING telegram_id",
+            (is_banned, user_id)
+        )
+        self._forget_users(result.rows)
+    
+    async def set_user_active(self, user_id: int, is_active: bool):
+        """Активировать или деактивировать пользователя"""
+        result = await self._write(
+            "UPDATE users SET is_active = ? WHERE id = ? RETURNING telegram_id",
+            (is_active, user_id)
+        )
+        self._forget_users(result.rows)
+    
+    def _forget_users(self, rows: list):
+        """Убрать пользователей из кэша после изменения их строк"""
+        for row in rows:
+            self.users.pop(row["telegram_id"])
     
     # === Анкеты ===
     
     async def create_profile(self, user_id: int, name: str, age: int, 
                             gender: str, looking_for: str, city: str, 
-                            bio: str, photos: str, video: str = None) -> int:
+                            bio: str, photos: str, video: str = None,
+                            min_partner_age: int = None, max_partner_age: int = None) -> int:
         """Создать анкету"""
-        cursor = await self.connection.execute("""
-            INSERT INTO profiles (user_id, name, age, gender, looking_for, city, bio, photos, video)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        result, _ = await self._write_many([("""
+            INSERT INTO profiles (user_id, name, age, gender, looking_for, city, city_key,
+                                  min_partner_age, max_partner_age, bio, photos, video)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ON CONFLICT(user_id) DO UPDATE SET
                 name = excluded.name,
                 age = excluded.age,
                 gender = excluded.gender,
                 looking_for = excluded.looking_for,
                 city = excluded.city,
+                city_key = excluded.city_key,
+                min_partner_age = excluded.min_partner_age,
+                max_partner_age = excluded.max_partner_age,
                 bio = excluded.bio,
                 photos = excluded.photos,
                 video = excluded.video,
                 updated_at = CURRENT_TIMESTAMP
-        """, (user_id, name, age, gender, looking_for, city, bio, photos, video))
-        await self.connection.commit()
-        return cursor.lastrowid
+            RETURNING *
+        """, (user_id, name, age, gender, looking_for, city, self.cities.key(city),
+              min_partner_age, max_partner_age, bio, photos, video)),
+            # Рекомендации посчитаны под прежние пол, поиск и город
+            ("DELETE FROM recommendations WHERE viewer_id = ?", (user_id,)),
+        ])
+        self.profiles.write(user_id, decode_profile(result.rows[0]))
+        self.cards.invalidate(user_id)
+        # Параметры поиска могли измениться — очередь кандидатов собирается заново
+        self.candidates.invalidate(user_id)
+        return result.rows[0]["id"]
     
     async def get_profile(self, user_id: int) -> Optional[dict]:
         """Получить анкету пользователя"""
-        cursor = await self.connection.execute(
+        cached = self.profiles.get(user_id)
+        if cached:
+            return dict(cached)
+        
+        version = self.profiles.version()
+        row = await self._fetchone(
             "SELECT * FROM profiles WHERE user_id = ?", (user_id,)
         )
-        row = await cursor.fetchone()
-        return dict(row) if row else None
+        if not row:
+            return None
+        
+        profile = decode_profile(row)
+        self.profiles.fill(user_id, profile, version)
+        return dict(profile)
     
     async def get_next_profile(self, user_id: int, gender: str, looking_for: str, city: str = None) -> Optional[dict]:
-        """Получить следующую анкету для просмотра"""
-        query = """
-            SELECT p.*, u.telegram_id, u.username FROM profiles p
-            JOIN users u ON p.user_id = u.id
-            WHERE p.user_id != ?
-            AND p.gender = ?
-            AND p.looking_for = ?
-            AND p.is_visible = 1
-            AND u.is_active = 1
-            AND u.is_banned = 0
-            AND p.user_id NOT IN (
-                SELECT to_user_id FROM likes WHERE from_user_id = ?
-            )
         """
-        params = [user_id, looking_for, gender, user_id]
+        Получить следующую анкету для просмотра.
+        Анкеты берутся из очереди кандидатов пользователя, которая
+        пополняется по мере опустошения: сначала заранее посчитанными
+        рекомендациями по рангу, затем перемешанными пачками.
+        Каждая admirers_every-я анкета — от того, кто уже лайкнул пользователя.
+        """
+        key = (gender, looking_for, city)
+        queue = self.candidates.get(user_id, key)
+        # Исчерпанная очередь ещё отдает последнюю пачку; пересобирается только пустая
+        if queue is None or (queue.exhausted and not queue.items):
+            queue = await self._create_candidate_queue(user_id, key)
+        
+        while True:
+            candidate_id = self._next_admirer(queue, user_id)
+            if candidate_id is None:
+                if not queue.items:
+                    await self._refill_candidates(queue, user_id, gender, looking_for, city)
+                if queue.items:
+                    candidate_id = queue.items.popleft()
+                    if self.admirers is not None:
+                        self.admirers.discard(user_id, candidate_id)
+                else:
+                    # Обычная лента кончилась, но лайкнувшие ещё остались
+                    candidate_id = self._next_admirer(queue, user_id, force=True)
+                    if candidate_id is None:
+                        return None
+            
+            profile = await self._fetch_candidate(user_id, candidate_id, gender, looking_for)
+            if profile and queue.age_range and not queue.age_range[0] <= profile["age"] <= queue.age_range[1]:
+                continue
+            if profile:
+                queue.served += 1
+                return profile
+    
+    async def _load_admirers(self, user_id: int, refresh: bool = False):
+        """Прочитать очередь лайкнувших пользователя из likes"""
+        rows = await self._fetchall(ADMIRERS_QUERY, (user_id, user_id, self.config.admirers_per_user))
+        admirer_ids = [row["from_user_id"] for row in rows]
+        if refresh:
+            self.admirers.refresh(user_id, admirer_ids)
+        else:
+            self.admirers.load(user_id, admirer_ids)
+    
+    def _next_admirer(self, queue, user_id: int, force: bool = False) -> Optional[int]:
+        """Лайкнувший пользователя, если подошла его очередь в ленте"""
+        if self.admirers is None or queue.key[2]:
+            return None
+        if not force and queue.served % self.config.admirers_every:
+            return None
+        return self.admirers.pop(user_id)
+    
+    async def recheck_candidate(self, user_id: int, candidate_id: int, gender: str, looking_for: str) -> Optional[dict]:
+        """
+        Анкета кандидата, взятого из очереди заранее, если её всё ещё можно показать:
+        анкета видима, автор не забанен и пользователь её не оценил.
+        """
+        return await self._fetch_candidate(user_id, candidate_id, gender, looking_for)
+    
+    def return_candidate(self, user_id: int, candidate_id: int, gender: str, looking_for: str, city: str = None):
+        """Вернуть непоказанного кандидата в начало очереди пользователя"""
+        queue = self.candidates.get(user_id, (gender, looking_for, city))
+        if queue is not None and candidate_id not in queue.items:
+            queue.items.appendleft(candidate_id)
+    
+    async def _create_candidate_queue(self, user_id: int, key: tuple):
+        """
+        Создать очередь кандидатов со случайной точкой старта.
+        В ленте по городам обходятся по очереди свой город, соседние
+        и в конце все остальные.
+        """
+        row = await self._fetchone("SELECT MAX(user_id) FROM profiles")
+        max_user_id = row[0] or 0
+        viewer = await self.get_profile(user_id)
+        
+        partitions = None
+        city = key[2]
+        if self.config.city_feed and not city:
+            city_key = viewer.get("city_key") if viewer else None
+            if city_key:
+                partitions = [city_key, *self.cities.neighbors(city_key), None]
+        
+        # С возрастом партнера обход идет по (age, user_id) со случайной точки внутри диапазона
+        age_range, pivot_age = None, 0
+        if viewer and (viewer.get("min_partner_age") or viewer.get("max_partner_age")):
+            age_range = (viewer["min_partner_age"] or MIN_AGE, viewer["max_partner_age"] or MAX_AGE)
+            pivot_age = random.randint(*age_range)
+        
+        # Рекомендации посчитаны без фильтра по городу
+        recommended = self.config.use_recommendations and not city
+        
+        # Лайкнувшие читаются один раз на очередь, дальше их ведет add_like
+        if self.admirers is not None and not city:
+            await self._load_admirers(user_id)
+        
+        return self.candidates.create(
+            user_id, key, pivot=random.randint(0, max_user_id), partitions=partitions,
+            age_range=age_range, pivot_age=pivot_age, recommended=recommended
+        )
+    
+    async def _refill_candidates(self, queue, user_id: int, gender: str, looking_for: str, city: str = None):
+        """
+        Пополнить очередь следующей пачкой кандидатов.
+        Таблица обходится по user_id от случайной точки до конца и затем
+        с начала до этой точки, поэтому сортировка всей выборки не нужна.
+        С диапазоном возраста партнера точка и обход — по паре (age, user_id)
+        внутри диапазона.
+        С ранжированием из каждой пачки в очередь сразу идут лучшие top_k,
+        остальные откладываются и после обхода идут по убыванию оценки.
+        """
+        ranking = self.config.ranking if self.config.ranking.enabled else None
+        batch_size = ranking.pool_size if ranking else self.config.candidate_batch_size
+        viewer = await self.get_profile(user_id) if ranking else None
+        
+        # Лайки из других процессов сюда не доходят, поэтому в общей базе
+        # очередь лайкнувших перечитывается с каждой пачкой ленты
+        if self.admirers is not None and self.config.shared and not city:
+            await self._load_admirers(user_id, refresh=True)
+        
+        # Заранее посчитанные рекомендации идут первыми и в порядке ранга;
+        # оцененные отсекает сам запрос, скрытые — _fetch_candidate
+        if queue.recommended:
+            rows = await self._fetchall(
+                RECOMMENDATIONS_QUERY, (user_id, queue.rank_cursor, user_id, self.config.candidate_batch_size)
+            )
+            if rows:
+                queue.rank_cursor = rows[-1]["rank"]
+                queue.items.extend(row["candidate_id"] for row in rows)
+                return
+            queue.recommended = False
+        
+        # Без графа и фильтров оцененные отсекаются подзапросом в самой выборке
+        filter_in_sql = not (self.like_graph or self.seen_sets)
+        
+        while not queue.items and not queue.exhausted:
+            if ranking:
+                query = RANKED_FEED_QUERY
+                params = [viewer["city_key"] if viewer else None, user_id]
+            elif queue.age_range:
+                query = AGE_FEED_QUERY
+                params = []
+            else:
+                query = FEED_QUERY
+                params = []
+            params += [user_id, looking_for, gender]
+            
+            if filter_in_sql:
+                query += FEED_UNRATED_FILTER
+                params.append(user_id)
+            
+            if queue.age_range:
+                query += FEED_AFTER_AGE
+                params += [queue.cursor_age, queue.cursor]
+                if queue.wrapped:
+                    query += " AND (p.age, p.user_id) <= (?, ?)"
+                    params += [queue.pivot_age, queue.pivot]
+                else:
+                    query += " AND p.age <= ?"
+                    params.append(queue.age_range[1])
+                order = " ORDER BY p.age, p.user_id LIMIT ?"
+            else:
+                query += FEED_AFTER_USER
+                params.append(queue.cursor)
+                if queue.wrapped:
+                    query += " AND p.user_id <= ?"
+                    params.append(queue.pivot)
+                order = " ORDER BY p.user_id LIMIT ?"
+            
+            if city:
+                query += " AND p.city = ?"
+                params.append(city)
+            
+            if queue.partitions:
+                city_key = queue.partitions[queue.partition]
+                if city_key is not None:
+                    query += " AND p.city_key = ?"
+                    params.append(city_key)
+                else:
+                    # Остальные города: всё, что не обошли раньше
+                    visited = queue.partitions[:-1]
+                    query += f" AND COALESCE(p.city_key, '') NOT IN ({', '.join('?' * len(visited))})"
+                    params.extend(visited)
+            
+            query += order
+            params.append(batch_size)
+            
+            rows = await self._fetchall(query, params)
+            scanned = [row["user_id"] for row in rows]
+            
+            if scanned:
+                queue.cursor = scanned[-1]
+                if queue.age_range:
+                    queue.cursor_age = rows[-1]["age"]
+                batch = scanned
+                if not filter_in_sql:
+                    batch = await self._exclude_rated(user_id, scanned)
+                if ranking:
+                    allowed = set(batch)
+                    batch, rest = rank_candidates([row for row in rows if row["user_id"] in allowed], viewer, ranking)
+                    queue.ranked_rest.extend(rest)
+                else:
+                    random.shuffle(batch)
+                queue.items.extend(batch)
+            
+            if len(scanned) < batch_size:
+                if not queue.wrapped:
+                    queue.wrapped = True
+                    queue.cursor = 0
+                    if queue.age_range:
+                        queue.cursor_age = queue.age_range[0]
+                elif not queue.next_partition():
+                    queue.exhausted = True
         
-        if city:
-            query += " AND p.city = ?"
-            params.append(city)
+        # Обход закончился, но отложенные при ранжировании ещё не показаны
+        if not queue.items and queue.ranked_rest:
+            queue.ranked_rest.sort(reverse=True)
+            queue.items.extend(user_id for _, user_id in queue.ranked_rest)
+            queue.ranked_rest.clear()
+    
+    async def _fetch_candidate(self, user_id: int, candidate_id: int, gender: str, looking_for: str) -> Optional[dict]:
+        """Получить анкету кандидата, если её всё ещё можно показать"""
+        query = CANDIDATE_QUERY
+        params = [candidate_id, looking_for, gender]
         
-        query += " ORDER BY RANDOM() LIMIT 1"
+        if self.like_graph or self.seen_sets:
+            if not await self._exclude_rated(user_id, [candidate_id]):
+                return None
+        else:
+            query += CANDIDATE_UNRATED_FILTER
+            params.append(user_id)
         
-        cursor = await self.connection.execute(query, params)
-        row = await cursor.fetchone()
-        return dict(row) if row else None
+        row = await self._fetchone(query, params)
+        return decode_profile(row) if row else None
+    
+    async def _exclude_rated(self, user_id: int, candidate_ids: list[int]) -> list[int]:
+        """
+        Убрать из списка тех, кого пользователь уже оценил.
+        Граф лайков отвечает точно. Фильтр Блума точно отсекает
+        неоцененных, а его положительные ответы перепроверяются одним
+        запросом по индексу.
+        """
+        if self.like_graph:
+            await self._load_like_graph(user_id)
+            return self.like_graph.filter_unrated(user_id, candidate_ids)
+        
+        seen = await self._load_seen_set(user_id)
+        maybe_rated = [candidate_id for candidate_id in candidate_ids if candidate_id in seen.filter]
+        if not maybe_rated:
+            return list(candidate_ids)
+        
+        placeholders = ", ".join("?" * len(maybe_rated))
+        rows = await self._fetchall(
+            f"SELECT to_user_id FROM likes WHERE from_user_id = ? AND to_user_id IN ({placeholders})",
+            [user_id, *maybe_rated]
+        )
+        rated = {row["to_user_id"] for row in rows}
+        return [candidate_id for candidate_id in candidate_ids if candidate_id not in rated]
     
     async def update_profile_visibility(self, user_id: int, is_visible: bool):
         """Обновить видимость анкеты"""
-        await self.connection.execute(
-            "UPDATE profiles SET is_visible = ? WHERE user_id = ?",
+        result = await self._write(
+            "UPDATE profiles SET is_visible = ? WHERE user_id = ? RETURNING *",
             (is_visible, user_id)
         )
-        await self.connection.commit()
+        if result.rows:
+            self.profiles.write(user_id, decode_profile(result.rows[0]))
+        else:
+            self.profiles.invalidate(user_id)
+        self.cards.invalidate(user_id)
+    
+    async def update_partner_age(self, user_id: int, min_age: Optional[int], max_age: Optional[int]):
+        """Обновить диапазон возраста партнера; None снимает ограничение"""
+        result = await self._write(
+            "UPDATE profiles SET min_partner_age = ?, max_partner_age = ? WHERE user_id = ? RETURNING *",
+            (min_age, max_age, user_id)
+        )
+        if result.rows:
+            self.profiles.write(user_id, decode_profile(result.rows[0]))
+        else:
+            self.profiles.invalidate(user_id)
+        self.cards.invalidate(user_id)
+        # Очередь ленты и рекомендации собраны под старый диапазон
+        self.candidates.invalidate(user_id)
+        await self._write("DELETE FROM recommendations WHERE viewer_id = ?", (user_id,))
     
     # === Лайки и мэтчи ===
     
     async def add_like(self, from_user_id: int, to_user_id: int, is_like: bool) -> bool:
         """Добавить лайк/дизлайк, возвращает True если это мэтч"""
-        await self.connection.execute("""
+        # Загружаем до записи, чтобы новая оценка не потерялась между чтением и записью
+        if self.like_graph:
+            await self._load_like_graph(from_user_id)
+        if self.seen_sets:
+            await self._load_seen_set(from_user_id)
+        
+        result = await self._write("""
             INSERT OR REPLACE INTO likes (from_user_id, to_user_id, is_like)
             VALUES (?, ?, ?)
         """, (from_user_id, to_user_id, is_like))
-        await self.connection.commit()
+        
+        if self.like_graph:
+            self.like_graph.record(from_user_id, to_user_id, is_like)
+        if self.seen_sets:
+            await self._record_seen(from_user_id, to_user_id, result.lastrowid)
+        if self.admirers is not None:
+            self.admirers.record(from_user_id, to_user_id, is_like)
         
         if not is_like:
             return False
         
         # Проверяем взаимный лайк
-        cursor = await self.connection.execute("""
-            SELECT id FROM likes 
-            WHERE from_user_id = ? AND to_user_id = ? AND is_like = 1
-        """, (to_user_id, from_user_id))
-        mutual = await cursor.fetchone()
+        if self.like_graph and not self.config.shared:
+            await self._load_like_graph(to_user_id)
+            mutual = self.like_graph.has_liked(to_user_id, from_user_id)
+        else:
+            mutual = await self._fetchone(MUTUAL_LIKE_QUERY, (to_user_id, from_user_id))
         
         if mutual:
-            # Создаем мэтч
-            await self.connection.execute("""
-                INSERT INTO matches (user1_id, user2_id) VALUES (?, ?)
-            """, (min(from_user_id, to_user_id), max(from_user_id, to_user_id)))
-            await self.connection.commit()
-            return True
+            # Создаем мэтч, если встречный лайк не успел создать его раньше,
+            # и в той же транзакции ставим уведомления обоим участникам
+            user1_id, user2_id = min(from_user_id, to_user_id), max(from_user_id, to_user_id)
+            results = await self._write_many([
+                ("""
+                    INSERT INTO matches (user1_id, user2_id)
+                    SELECT ?, ? WHERE NOT EXISTS (
+                        SELECT 1 FROM matches WHERE user1_id = ? AND user2_id = ?
+                    )
+                """, (user1_id, user2_id, user1_id, user2_id)),
+                (MATCH_NOTIFICATION_INSERT, (from_user_id, to_user_id, user1_id, user2_id)),
+                (MATCH_NOTIFICATION_INSERT, (to_user_id, from_user_id, user1_id, user2_id)),
+            ])
+            return results[0].rowcount > 0
         
         return False
     
-    async def get_user_matches(self, user_id: int) -> list[dict]:
-        """Получить мэтчи пользователя"""
-        cursor = await self.connection.execute("""
-            SELECT m.*, 
-                   CASE WHEN m.user1_id = ? THEN p2.* ELSE p1.* END as matched_profile,
-                   CASE WHEN m.user1_id = ? THEN u2.telegram_id ELSE u1.telegram_id END as matched_telegram_id
-            FROM matches m
-            JOIN profiles p1 ON m.user1_id = p1.user_id
-            JOIN profiles p2 ON m.user2_id = p2.user_id
-            JOIN users u1 ON m.user1_id = u1.id
-            JOIN users u2 ON m.user2_id = u2.id
-            WHERE m.user1_id = ? OR m.user2_id = ?
-            ORDER BY m.created_at DESC
-        """, (user_id, user_id, user_id, user_id))
-        rows = await cursor.fetchall()
+    @staticmethod
+    async def _load_once(loads: dict, user_id: int, read):
+        """Параллельные обращения к одному пользователю ждут одну и ту же загрузку"""
+        load = loads.get(user_id)
+        if load is None:
+            load = asyncio.ensure_future(read(user_id))
+            loads[user_id] = load
+            load.add_done_callback(lambda _: loads.pop(user_id, None))
+        return await load
+    
+    async def _load_like_graph(self, user_id: int):
+        """Подгрузить исходящие оценки пользователя в граф, если их там ещё нет"""
+        # Пока ждали загрузку, граф мог вытеснить пользователя или быть перестроен
+        while not self.like_graph.is_loaded(user_id):
+            await self._load_once(self._like_graph_loads, user_id, self._read_like_graph_user)
+    
+    async def _read_like_graph_user(self, user_id: int):
+        """Прочитать исходящие оценки пользователя из базы"""
+        rows = await self._fetchall(
+            "SELECT to_user_id, is_like FROM likes WHERE from_user_id = ?", (user_id,)
+        )
+        self.like_graph.load(user_id, ((row["to_user_id"], row["is_like"]) for row in rows))
+    
+    async def _load_seen_set(self, user_id: int):
+        """Фильтр «уже оценил» пользователя, при необходимости загруженный из базы"""
+        seen = self.seen_sets.get(user_id)
+        if seen is None:
+            seen = await self._load_once(self._seen_loads, user_id, self._read_seen_set)
+        return seen
+    
+    async def _read_seen_set(self, user_id: int):
+        """
+        Восстановить сохраненный фильтр и дописать в него оценки,
+        сделанные после сохранения. Если фильтра нет или он переполнен,
+        собрать заново по likes.
+        """
+        row = await self._fetchone(
+            "SELECT bits, capacity, error_rate, count, watermark FROM seen_filters WHERE user_id = ?",
+            (user_id,)
+        )
+        if row:
+            seen = self.seen_sets.restore(
+                user_id, row["bits"], row["capacity"], row["error_rate"], row["count"], row["watermark"]
+            )
+            rows = await self._fetchall(
+                "SELECT id, to_user_id FROM likes WHERE from_user_id = ? AND id > ?",
+                (user_id, seen.watermark)
+            )
+            for like in rows:
+                seen.filter.add(like["to_user_id"])
+                seen.watermark = max(seen.watermark, like["id"])
+                seen.dirty += 1
+            if not seen.filter.is_full:
+                return seen
+        
+        rows = await self._fetchall(
+            "SELECT id, to_user_id FROM likes WHERE from_user_id = ?", (user_id,)
+        )
+        return self.seen_sets.build(user_id, [(like["id"], like["to_user_id"]) for like in rows])
+    
+    async def _record_seen(self, user_id: int, to_user_id: int, like_id: int):
+        """Добавить оценку в фильтр и периодически сохранять его"""
+        # За время записи фильтр мог быть вытеснен; перечитанный уже содержит оценку
+        seen = await self._load_seen_set(user_id)
+        seen.filter.add(to_user_id)
+        seen.watermark = max(seen.watermark, like_id)
+        seen.dirty += 1
+        
+        if seen.filter.is_full:
+            # Фильтр переполнен — точность падает, собираем с запасом
+            self.seen_sets.discard(user_id)
+            seen = await self._load_seen_set(user_id)
+        
+        if seen.dirty >= self.config.seen_filter_flush_every:
+            await self._save_seen_set(user_id, seen)
+    
+    async def _save_seen_set(self, user_id: int, seen: SeenSet):
+        """Сохранить фильтр пользователя; он мог быть уже вытеснен из памяти"""
+        dirty = seen.dirty
+        await self._write("""
+            INSERT INTO seen_filters (user_id, bits, capacity, error_rate, count, watermark)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                bits = excluded.bits,
+                capacity = excluded.capacity,
+                error_rate = excluded.error_rate,
+                count = excluded.count,
+                watermark = excluded.watermark,
+                updated_at = CURRENT_TIMESTAMP
+        """, (user_id, bytes(seen.filter.bits), seen.filter.capacity, seen.filter.error_rate,
+              seen.filter.count, seen.watermark))
+        seen.dirty -= dirty
+    
+    async def flush_seen_sets(self):
+        """Сохранить все измененные фильтры"""
+        for user_id, seen in self.seen_sets.dirty():
+            await self._save_seen_set(user_id, seen)
+    
+    def rebuild_like_graph(self):
+        """
+        Перестроить граф лайков по базе.
+        Граф сбрасывается, и каждый пользователь перечитывается из likes
+        при следующем обращении — так новые оценки не теряются во время
+        перестроения.
+        """
+        if self.like_graph:
+            self.like_graph = LikeGraph(self.config.like_graph_max_users)
+    
+    async def get_user_matches_page(self, user_id: int, cursor: Optional[int] = None,
+                                    limit: int = 10) -> tuple[list[dict], Optional[int]]:
+        """
+        Получить страницу мэтчей пользователя, от новых к старым.
+        cursor — id последнего мэтча предыдущей страницы.
+        Возвращает мэтчи с данными собеседника и курсор следующей страницы.
+        """
+        params = []
+        for _ in range(2):
+            params.append(user_id)
+            if cursor is not None:
+                params.append(cursor)
+            params.append(limit + 1)
+        
+        # Каждая половина читает свой индекс и сразу обрезается до limit + 1;
+        # из двух половин берутся limit + 1 самых новых
+        rows = await self._fetchall(matches_page_query(with_cursor=cursor is not None), params)
+        matches = sorted(
+            (dict(row) for row in rows), key=lambda match: (match["created_at"], match["match_id"]), reverse=True
+        )[:limit + 1]
+        
+        next_cursor = None
+        if len(matches) > limit:
+            matches = matches[:limit]
+            next_cursor = matches[-1]["match_id"]
+        return matches, next_cursor
+    
+    async def count_user_matches(self, user_id: int) -> int:
+        """Количество мэтчей пользователя"""
+        row = await self._fetchone("""
+            SELECT (SELECT COUNT(*) FROM matches WHERE user1_id = ?)
+                 + (SELECT COUNT(*) FROM matches WHERE user2_id = ?)
+        """, (user_id, user_id))
+        return row[0]
+    
+    # === Уведомления о мэтчах ===
+    
+    async def get_pending_notifications(self, limit: int = 50,
+                                        shard: Optional[tuple[int, int]] = None) -> list[dict]:
+        """
+        Уведомления о мэтчах, которые пора отправить.
+        shard — (номер воркера, число воркеров): только уведомления получателей
+        этого воркера, чтобы процессы не отправляли одно и то же.
+        """
+        if shard is None:
+            query, params = PENDING_NOTIFICATIONS_QUERY.format(shard=""), (limit,)
+        else:
+            index, workers = shard
+            query = PENDING_NOTIFICATIONS_QUERY.format(shard="AND u.telegram_id % ? = ?")
+            params = (workers, index, limit)
+        rows = await self._fetchall(query, params)
         return [dict(row) for row in rows]
     
+    async def mark_notification_sent(self, notification_id: int):
+        """Отметить уведомление доставленным"""
+        await self._write("""
+            UPDATE match_notifications
+            SET status = 'sent', attempts = attempts + 1, last_error = NULL, sent_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (notification_id,))
+    
+    async def mark_notification_failed(self, notification_id: int, error: str,
+                                       retry_in: Optional[float] = None):
+        """
+        Записать ошибку доставки.
+        С retry_in уведомление будет отправлено снова через retry_in секунд,
+        без него — помечается как недоставленное окончательно.
+        """
+        if retry_in is None:
+            await self._write("""
+                UPDATE match_notifications
+                SET status = 'failed', attempts = attempts + 1, last_error = ?
+                WHERE id = ?
+            """, (error, notification_id))
+        else:
+            await self._write("""
+                UPDATE match_notifications
+                SET attempts = attempts + 1, last_error = ?,
+                    next_attempt_at = datetime('now', ?)
+                WHERE id = ?
+            """, (error, f"+{int(retry_in)} seconds", notification_id))
+    
+    # === Состояния FSM ===
+    
+    async def get_fsm_record(self, key: str) -> tuple[Optional[str], dict]:
+        """Состояние и данные FSM по ключу"""
+        row = await self._fetchone("SELECT state, data FROM fsm_states WHERE key = ?", (key,))
+        if not row:
+            return None, {}
+        return row["state"], json.loads(row["data"]) if row["data"] else {}
+    
+    async def save_fsm_records(self, records: list[tuple[str, int, Optional[str], dict]]):
+        """
+        Записать состояния FSM одной транзакцией: (ключ, telegram id, состояние, данные).
+        Пустые записи (без состояния и данных) удаляются.
+        """
+        statements = []
+        for key, user_id, state, data in records:
+            if state is None and not data:
+                statements.append(("DELETE FROM fsm_states WHERE key = ?", (key,)))
+            else:
+                statements.append(("""
+                    INSERT INTO fsm_states (key, user_id, state, data, updated_at)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(key) DO UPDATE SET
+                        state = excluded.state,
+                        data = excluded.data,
+                        updated_at = excluded.updated_at
+                """, (key, user_id, state, json.dumps(data, ensure_ascii=False))))
+        await self._write_many(statements)
+    
+    async def expire_fsm_records(self, max_age: float,
+                                 shard: Optional[tuple[int, int]] = None) -> list[tuple[str, Optional[str]]]:
+        """
+        Удалить состояния FSM, не менявшиеся дольше max_age секунд; вернуть пары (ключ, состояние).
+        shard — (номер воркера, число воркеров): только записи пользователей этого воркера,
+        чтобы сброшенный сценарий запомнил тот процесс, к которому вернется пользователь.
+        """
+        query = "DELETE FROM fsm_states WHERE updated_at < datetime('now', ?)"
+        params = (f"-{int(max_age)} seconds",)
+        if shard is not None:
+            index, workers = shard
+            query += " AND user_id % ? = ?"
+            params += (workers, index)
+        result = await self._write(query + " RETURNING key, state", params)
+        return [(row["key"], row["state"]) for row in result.rows]
+    
     # === Лимиты просмотров ===
     
     async def get_view_limit(self, user_id: int) -> dict:
         """Получить лимит просмотров на сегодня"""
         today = date.today().isoformat()
-        cursor = await self.connection.execute("""
+        row = await self._fetchone("""
             SELECT * FROM view_limits WHERE user_id = ? AND date = ?
         """, (user_id, today))
-        row = await cursor.fetchone()
         
         if row:
             return dict(row)
         
         # Создаем запись на сегодня
-        await self.connection.execute("""
-            INSERT INTO view_limits (user_id, date, views_used, extra_views)
+        await self._write("""
+            INSERT OR IGNORE INTO view_limits (user_id, date, views_used, extra_views)
             VALUES (?, ?, 0, 0)
         """, (user_id, today))
-        await self.connection.commit()
         
         return {"user_id": user_id, "date": today, "views_used": 0, "extra_views": 0}
     
+    async def try_consume_view(self, user_id: int, daily_limit: int) -> dict:
+        """
+        Списать один просмотр, если лимит на сегодня не исчерпан.
+        Запись на сегодня создается и увеличивается одним запросом,
+        поэтому два быстрых нажатия не проскочат мимо лимита.
+        """
+        today = date.today().isoformat()
+        result = await self._write("""
+            INSERT INTO view_limits (user_id, date, views_used, extra_views)
+            VALUES (?, ?, 1, 0)
+            ON CONFLICT(user_id, date) DO UPDATE SET
+                views_used = views_used + 1
+            WHERE views_used < ? + extra_views
+            RETURNING views_used, extra_views
+        """, (user_id, today, daily_limit))
+        
+        if result.rows:
+            row = result.rows[0]
+            return {"allowed": True, "views_used": row["views_used"], "extra_views": row["extra_views"]}
+        
+        # Лимит исчерпан — запись точно существует, читаем счетчики для сообщения
+        row = await self._fetchone("""
+            SELECT views_used, extra_views FROM view_limits WHERE user_id = ? AND date = ?
+        """, (user_id, today))
+        return {"allowed": False, "views_used": row["views_used"], "extra_views": row["extra_views"]}
+    
     async def increment_views(self, user_id: int):
         """Увеличить счетчик просмотров"""
         today = date.today().isoformat()
-        await self.connection.execute("""
+        await self._write("""
             UPDATE view_limits SET views_used = views_used + 1
             WHERE user_id = ? AND date = ?
         """, (user_id, today))
-        await self.connection.commit()
     
     async def add_extra_views(self, user_id: int, amount: int):
         """Добавить дополнительные просмотры"""
         today = date.today().isoformat()
-        await self.get_view_limit(user_id)  # Убедимся что запись существует
-        await self.connection.execute("""
-            UPDATE view_limits SET extra_views = extra_views + ?
-            WHERE user_id = ? AND date = ?
-        """, (amount, user_id, today))
-        await self.connection.commit()
+        await self._write("""
+            INSERT INTO view_limits (user_id, date, views_used, extra_views)
+            VALUES (?, ?, 0, ?)
+            ON CONFLICT(user_id, date) DO UPDATE SET
+                extra_views = extra_views + excluded.extra_views
+        """, (user_id, today, amount))
     
     async def reset_views(self, user_id: int):
         """Сбросить просмотры (после оплаты)"""
         today = date.today().isoformat()
-        await self.connection.execute("""
+        await self._write("""
             UPDATE view_limits SET views_used = 0
             WHERE user_id = ? AND date = ?
         """, (user_id, today))
-        await self.connection.commit()
     
     # === Платежи ===
     
     async def add_payment(self, user_id: int, amount: int, payment_type: str, 
                          telegram_payment_id: str = None) -> int:
         """Записать платеж"""
-        cursor = await self.connection.execute("""
+        result = await self._write("""
             INSERT INTO payments (user_id, amount, payment_type, telegram_payment_id)
             VALUES (?, ?, ?, ?)
         """, (user_id, amount, payment_type, telegram_payment_id))
-        await self.connection.commit()
-        return cursor.lastrowid
+        return result.lastrowid
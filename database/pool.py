@@ -0,0 +1,78 @@
+"""
+Пул соединений с базой данных
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import aiosqlite
+
+from config import DatabaseConfig
+
+
+class ConnectionPool:
+    """
+    Одно соединение для записи и несколько соединений для чтения.
+    В режиме WAL читатели не блокируются писателем, поэтому тяжёлые
+    выборки не задерживают лайки и счетчики.
+    """
+
+    def __init__(self, path: str, config: DatabaseConfig):
+        self.path = path
+        self.config = config
+        self.writer: Optional[aiosqlite.Connection] = None
+        self._readers: list[aiosqlite.Connection] = []
+        self._idle: Optional[asyncio.Queue] = None
+
+    async def open(self):
+        """Открыть соединения"""
+        self.writer = await self._connect()
+        await self._pragma(self.writer, f"journal_mode = {self.config.journal_mode}")
+
+        self._idle = asyncio.Queue()
+        for _ in range(self.config.reader_connections):
+            reader = await self._connect()
+            await self._pragma(reader, "query_only = 1")
+            self._readers.append(reader)
+            self._idle.put_nowait(reader)
+
+    async def close(self):
+        """Закрыть все соединения"""
+        for reader in self._readers:
+            await reader.close()
+        self._readers.clear()
+        if self.writer:
+            await self.writer.close()
+            self.writer = None
+
+    async def _connect(self) -> aiosqlite.Connection:
+        """Открыть соединение с общими настройками"""
+        connection = await aiosqlite.connect(self.path)
+        connection.row_factory = aiosqlite.Row
+        await self._pragma(connection, f"busy_timeout = {int(self.config.busy_timeout)}")
+        await self._pragma(connection, f"synchronous = {self.config.synchronous}")
+        await self._pragma(connection, f"mmap_size = {int(self.config.mmap_size)}")
+        return connection
+
+    @staticmethod
+    async def _pragma(connection: aiosqlite.Connection, pragma: str):
+        """
+        Выполнить PRAGMA и дочитать результат.
+        Незакрытый курсор держит блокировку и не дает открыть остальные соединения.
+        """
+        async with connection.execute(f"PRAGMA {pragma}") as cursor:
+            await cursor.fetchall()
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Взять свободное соединение для чтения"""
+        if not self._readers:
+            # Читатели отключены — читаем через писателя
+            yield self.writer
+            return
+
+        connection = await self._idle.get()
+        try:
+            yield connection
+        finally:
+            self._idle.put_nowait(connection)
@@ -0,0 +1,77 @@
+"""
+Ранжирование кандидатов для ленты анкет
+"""
+import time
+from typing import Optional, Sequence
+
+import numpy as np
+
+from config import RankingConfig
+
+
+_rng = np.random.default_rng()
+
+
+def candidate_features(rows: Sequence) -> dict[str, np.ndarray]:
+    """Признаки кандидатов из строк RANKED_FEED_QUERY, по столбцу на признак"""
+    n = len(rows)
+    return {
+        "user_id": np.fromiter((row["user_id"] for row in rows), np.int64, n),
+        "age": np.fromiter((row["age"] or 0 for row in rows), np.float64, n),
+        "same_city": np.fromiter((row["same_city"] or 0 for row in rows), np.float64, n),
+        "updated_ts": np.fromiter((row["updated_ts"] or 0 for row in rows), np.float64, n),
+        "photo_count": np.fromiter((row["photo_count"] or 0 for row in rows), np.float64, n),
+        "has_video": np.fromiter((row["has_video"] or 0 for row in rows), np.float64, n),
+        "liked_me": np.fromiter((row["liked_me"] or 0 for row in rows), np.float64, n),
+    }
+
+
+def score_candidates(features: dict[str, np.ndarray], viewer_age: Optional[int],
+                     config: RankingConfig, now: Optional[float] = None) -> np.ndarray:
+    """
+    Оценки кандидатов одним векторным проходом: совпадение города,
+    близость возраста, свежесть анкеты, встречный лайк, число фото и видео.
+    Небольшой шум перемешивает кандидатов с одинаковой оценкой.
+    """
+    now = time.time() if now is None else now
+    n = len(features["user_id"])
+
+    scores = config.city_weight * features["same_city"]
+    if viewer_age:
+        scores -= config.age_weight * np.abs(features["age"] - viewer_age) / config.age_scale
+    age_seconds = np.maximum(now - features["updated_ts"], 0.0)
+    scores += config.recency_weight * np.exp2(-age_seconds / config.recency_half_life)
+    scores += config.reciprocity_weight * features["liked_me"]
+    scores += config.photos_weight * np.minimum(features["photo_count"], config.max_photos) / config.max_photos
+    scores += config.video_weight * features["has_video"]
+    if config.noise:
+        scores += config.noise * _rng.random(n)
+    return scores
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Индексы k лучших оценок по убыванию"""
+    if k < len(scores):
+        best = np.argpartition(-scores, k - 1)[:k]
+    else:
+        best = np.arange(len(scores))
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+def rank_candidates(rows: Sequence, viewer: Optional[dict],
+                    config: RankingConfig) -> tuple[list[int], list[tuple[float, int]]]:
+    """
+    user_id лучших config.top_k кандидатов пачки, от лучшего к худшему,
+    и остальные кандидаты пачки парами (оценка, user_id)
+    """
+    if not rows:
+        return [], []
+    features = candidate_features(rows)
+    scores = score_candidates(features, viewer["age"] if viewer else None, config)
+    best = top_k(scores, config.top_k)
+    rest = np.ones(len(scores), dtype=bool)
+    rest[best] = False
+    return (
+        features["user_id"][best].tolist(),
+        list(zip(scores[rest].tolist(), features["user_id"][rest].tolist()))
+    )
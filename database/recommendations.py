@@ -0,0 +1,196 @@
+"""
+Пакетный расчет рекомендаций: ранжированные кандидаты для каждого пользователя
+заранее, в таблицу recommendations
+"""
+import logging
+import multiprocessing
+import sqlite3
+import time
+from typing import Optional
+
+import numpy as np
+
+from config import DatabaseConfig, RankingConfig
+from .ranking import score_candidates, top_k
+
+
+logger = logging.getLogger(__name__)
+
+
+# Смотрящие из диапазона user_id
+VIEWERS_QUERY = """
+    SELECT p.user_id, p.age, p.gender, p.looking_for, p.city_key,
+           p.min_partner_age, p.max_partner_age
+    FROM profiles p
+    JOIN users u ON p.user_id = u.id
+    WHERE p.user_id >= ? AND p.user_id < ?
+    AND u.is_active = 1
+    AND u.is_banned = 0
+    ORDER BY p.user_id
+"""
+
+# Все кандидаты одной пары gender/looking_for с признаками для ранжирования
+POOL_QUERY = """
+    SELECT p.user_id, p.age, p.city_key,
+           CAST(strftime('%s', p.updated_at) AS INTEGER) AS updated_ts,
+           CASE WHEN json_valid(p.photos) THEN json_array_length(p.photos) ELSE 0 END AS photo_count,
+           COALESCE(p.video, '') != '' AS has_video
+    FROM profiles p
+    JOIN users u ON p.user_id = u.id
+    WHERE p.gender = ?
+    AND p.looking_for = ?
+    AND p.is_visible = 1
+    AND u.is_active = 1
+    AND u.is_banned = 0
+    ORDER BY p.user_id
+"""
+
+RATED_QUERY = "SELECT to_user_id FROM likes WHERE from_user_id = ?"
+LIKED_ME_QUERY = "SELECT from_user_id FROM likes WHERE to_user_id = ? AND is_like = 1"
+
+
+# Состояние процесса пула: соединение только для чтения и кэш кандидатов
+_connection: Optional[sqlite3.Connection] = None
+_ranking: Optional[RankingConfig] = None
+_per_user = 0
+_pools: dict[tuple[str, str], dict] = {}
+
+
+def _init_worker(path: str, ranking: RankingConfig, per_user: int):
+    """Подготовить процесс пула"""
+    global _connection, _ranking, _per_user
+    _connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    _connection.row_factory = sqlite3.Row
+    _ranking = ranking
+    _per_user = per_user
+    _pools.clear()
+
+
+def _load_pool(gender: str, looking_for: str) -> dict:
+    """
+    Кандидаты пары gender/looking_for, по столбцу на признак, отсортированные по user_id.
+    Загружаются один раз на процесс; города заменены номерами, чтобы сравнение было числовым.
+    """
+    key = (gender, looking_for)
+    if key not in _pools:
+        rows = _connection.execute(POOL_QUERY, key).fetchall()
+        n = len(rows)
+        city_codes: dict[str, int] = {}
+        _pools[key] = {
+            "user_id": np.fromiter((row["user_id"] for row in rows), np.int64, n),
+            "age": np.fromiter((row["age"] or 0 for row in rows), np.float64, n),
+            "city": np.fromiter(
+                (city_codes.setdefault(row["city_key"] or "", len(city_codes)) for row in rows), np.int64, n
+            ),
+            "city_codes": city_codes,
+            "updated_ts": np.fromiter((row["updated_ts"] or 0 for row in rows), np.float64, n),
+            "photo_count": np.fromiter((row["photo_count"] or 0 for row in rows), np.float64, n),
+            "has_video": np.fromiter((row["has_video"] or 0 for row in rows), np.float64, n),
+        }
+    return _pools[key]
+
+
+def _positions(pool: dict, query: str, user_id: int) -> np.ndarray:
+    """Позиции в пуле для user_id, которые вернул запрос"""
+    ids = np.array([row[0] for row in _connection.execute(query, (user_id,))], dtype=np.int64)
+    positions = np.searchsorted(pool["user_id"], ids)
+    positions = positions[positions < len(pool["user_id"])]
+    return positions[np.isin(pool["user_id"][positions], ids)]
+
+
+def rank_for_viewer(viewer: sqlite3.Row, now: float) -> list[int]:
+    """Лучшие кандидаты для одного смотрящего, от лучшего к худшему"""
+    # Смотрящему подходят анкеты его looking_for, которые ищут его пол
+    pool = _load_pool(viewer["looking_for"], viewer["gender"])
+    if not len(pool["user_id"]):
+        return []
+
+    # Оценивается весь пул без копий, неподходящие получают -inf
+    allowed = pool["user_id"] != viewer["user_id"]
+    allowed[_positions(pool, RATED_QUERY, viewer["user_id"])] = False
+    if viewer["min_partner_age"]:
+        allowed &= pool["age"] >= viewer["min_partner_age"]
+    if viewer["max_partner_age"]:
+        allowed &= pool["age"] <= viewer["max_partner_age"]
+
+    city = pool["city_codes"].get(viewer["city_key"] or "")
+    liked_me = np.zeros(len(pool["user_id"]))
+    liked_me[_positions(pool, LIKED_ME_QUERY, viewer["user_id"])] = 1.0
+    features = {
+        **pool,
+        "same_city": (pool["city"] == city).astype(np.float64) if viewer["city_key"] else np.zeros(len(liked_me)),
+        "liked_me": liked_me,
+    }
+
+    scores = score_candidates(features, viewer["age"], _ranking, now)
+    scores[~allowed] = -np.inf
+    best = top_k(scores, _per_user)
+    return pool["user_id"][best[np.isfinite(scores[best])]].tolist()
+
+
+def compute_range(bounds: tuple[int, int]) -> tuple[tuple[int, int], list[tuple[int, int, int]]]:
+    """Рекомендации всех смотрящих с user_id в [start, end): строки (viewer_id, rank, candidate_id)"""
+    now = time.time()
+    rows = []
+    for viewer in _connection.execute(VIEWERS_QUERY, bounds).fetchall():
+        for rank, candidate_id in enumerate(rank_for_viewer(viewer, now), start=1):
+            rows.append((viewer["user_id"], rank, candidate_id))
+    return bounds, rows
+
+
+def build_recommendations(config: DatabaseConfig, workers: int, resume: bool = True) -> int:
+    """
+    Пересчитать таблицу recommendations пулом процессов.
+    Смотрящие делятся на диапазоны user_id по recommendation_chunk_size;
+    каждый диапазон записывается одной транзакцией вместе с отметкой прогресса,
+    поэтому прерванный расчет продолжается с первого незаписанного диапазона.
+    Возвращает число записанных строк.
+    """
+    connection = sqlite3.connect(config.path, timeout=config.busy_timeout / 1000)
+    connection.execute(f"PRAGMA journal_mode={config.journal_mode}")
+
+    progress = connection.execute(
+        "SELECT next_viewer_id FROM recommendation_progress WHERE id = 1 AND finished_at IS NULL"
+    ).fetchone()
+    start = progress[0] if progress and resume else 0
+    if start:
+        logger.info("Продолжаем расчет рекомендаций с user_id %s", start)
+    else:
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO recommendation_progress (id, next_viewer_id) VALUES (1, 0)"
+            )
+
+    max_user_id = connection.execute("SELECT MAX(user_id) FROM profiles").fetchone()[0] or 0
+    chunk = config.recommendation_chunk_size
+    ranges = [(low, low + chunk) for low in range(start, max_user_id + 1, chunk)]
+
+    written = 0
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(
+        workers, initializer=_init_worker,
+        initargs=(config.path, config.ranking, config.recommendations_per_user)
+    ) as pool:
+        # imap отдает диапазоны по порядку, так что прогресс всегда сплошной
+        for (low, high), rows in pool.imap(compute_range, ranges):
+            with connection:
+                connection.execute(
+                    "DELETE FROM recommendations WHERE viewer_id >= ? AND viewer_id < ?", (low, high)
+                )
+                connection.executemany(
+                    "INSERT INTO recommendations (viewer_id, rank, candidate_id) VALUES (?, ?, ?)", rows
+                )
+                connection.execute(
+                    "UPDATE recommendation_progress SET next_viewer_id = ? WHERE id = 1", (high,)
+                )
+            written += len(rows)
+            logger.info("Рекомендации до user_id %s: %s строк", high, written)
+
+    with connection:
+        # Рекомендации для user_id, которых больше нет
+        connection.execute("DELETE FROM recommendations WHERE viewer_id > ?", (max_user_id,))
+        connection.execute(
+            "UPDATE recommendation_progress SET finished_at = CURRENT_TIMESTAMP WHERE id = 1"
+        )
+    connection.close()
+    return written
@@ -0,0 +1,125 @@
+"""
+Компактные множества «уже оценил» для ленты анкет
+"""
+import hashlib
+import math
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+
+class BloomFilter:
+    """
+    Фильтр Блума по целым id.
+    Отрицательный ответ точный, положительный — с вероятностью ошибки
+    error_rate, пока в фильтре не больше capacity элементов.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, bits: Optional[bytes] = None, count: int = 0):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray(bits) if bits else bytearray((self.size + 7) // 8)
+        self.count = count
+
+    def _positions(self, value: int):
+        """Позиции битов для значения (двойное хеширование)"""
+        digest = hashlib.blake2b(value.to_bytes(8, "little", signed=True), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, value: int) -> bool:
+        """
+        Добавить значение; True, если изменился хотя бы один бит.
+        Повторная оценка того же кандидата не увеличивает count, иначе
+        фильтр казался бы переполненным раньше времени.
+        """
+        added = False
+        for position in self._positions(value):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, value: int) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    @property
+    def is_full(self) -> bool:
+        return self.count > self.capacity
+
+
+@dataclass
+class SeenSet:
+    """Фильтр одного пользователя и состояние его сохранения"""
+    filter: BloomFilter
+    watermark: int  # Максимальный id в likes, уже попавший в фильтр
+    dirty: int = 0  # Добавлений с последнего сохранения
+
+
+class SeenSets:
+    """
+    Фильтры «уже оценил» загруженных пользователей.
+    Хранит не больше max_users фильтров, вытесняя давно не нужные.
+    Вытесненный фильтр не теряет оценок: при следующей загрузке он
+    восстанавливается из seen_filters и дописывается по likes после watermark.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, max_users: int = 20000):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.max_users = max_users
+        self._sets: OrderedDict[int, SeenSet] = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[SeenSet]:
+        seen = self._sets.get(user_id)
+        if seen is not None:
+            self._sets.move_to_end(user_id)
+        return seen
+
+    def _put(self, user_id: int, seen: SeenSet):
+        """Запомнить фильтр как самый свежий и вытеснить лишние"""
+        self._sets[user_id] = seen
+        self._sets.move_to_end(user_id)
+        while len(self._sets) > self.max_users:
+            self._sets.popitem(last=False)
+
+    def build(self, user_id: int, rated: list[tuple[int, int]]) -> SeenSet:
+        """Собрать фильтр по парам (id лайка, to_user_id)"""
+        capacity = self.capacity
+        while capacity < len(rated) * 2:
+            capacity *= 2
+        seen = SeenSet(BloomFilter(capacity, self.error_rate), watermark=0, dirty=1)
+        for like_id, to_user_id in rated:
+            seen.filter.add(to_user_id)
+            seen.watermark = max(seen.watermark, like_id)
+        self._put(user_id, seen)
+        return seen
+
+    def restore(self, user_id: int, bits: bytes, capacity: int, error_rate: float,
+                count: int, watermark: int) -> SeenSet:
+        """Восстановить сохраненный фильтр"""
+        seen = SeenSet(BloomFilter(capacity, error_rate, bits=bits, count=count), watermark=watermark)
+        self._put(user_id, seen)
+        return seen
+
+    def discard(self, user_id: int):
+        """Забыть фильтр пользователя"""
+        self._sets.pop(user_id, None)
+
+    def dirty(self) -> list[tuple[int, SeenSet]]:
+        """Фильтры с несохраненными изменениями: пары (user_id, фильтр)"""
+        return [(user_id, seen) for user_id, seen in self._sets.items() if seen.dirty]
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._sets
+
+    def memory_usage(self) -> int:
+        """Примерный объем битовых массивов в байтах"""
+        return sum(len(seen.filter.bits) for seen in self._sets.values())
@@ -1,5 +1,7 @@
+from .admin import router as admin_router
 from .profile import router as profile_router
 from .matching import router as matching_router
 from .payments import router as payments_router
+from .fallback import router as fallback_router
 
-__all__ = ["profile_router", "matching_router", "payments_router"]
+__all__ = ["admin_router", "profile_router", "matching_router", "payments_router", "fallback_router"]
@@ -0,0 +1,63 @@
+"""
+Команды администраторов
+"""
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+from config import BotConfig
+from database.models import Database
+
+
+router = Router()
+
+
+async def find_user(message: Message, command: CommandObject, db: Database, config: BotConfig):
+    """
+    Пользователь по telegram_id из аргумента команды.
+    Зависимости приходят из middleware уже после фильтров, поэтому
+    права администратора проверяются здесь, а не фильтром роутера.
+    """
+    if message.from_user.id not in config.admin_ids:
+        return None
+    if not command.args or not command.args.strip().isdigit():
+        await message.answer(f"❌ Укажи telegram_id: /{command.command} 123456789")
+        return None
+    user = await db.get_user_by_telegram_id(int(command.args.strip()))
+    if not user:
+        await message.answer("❌ Пользователь не найден")
+    return user
+
+
+@router.message(Command("ban", "unban"))
+async def cmd_ban(message: Message, command: CommandObject, db: Database, config: BotConfig):
+    """Заблокировать или разблокировать пользователя"""
+    user = await find_user(message, command, db, config)
+    if not user:
+        return
+    is_banned = command.command == "ban"
+    await db.set_user_banned(user["id"], is_banned)
+    await message.answer("✅ Пользователь заблокирован" if is_banned else "✅ Пользователь разблокирован")
+
+
+@router.message(Command("deactivate", "activate"))
+async def cmd_activate(message: Message, command: CommandObject, db: Database, config: BotConfig):
+    """Скрыть пользователя из ленты или вернуть его"""
+    user = await find_user(message, command, db, config)
+    if not user:
+        return
+    is_active = command.command == "activate"
+    await db.set_user_active(user["id"], is_active)
+    await message.answer("✅ Пользователь активен" if is_active else "✅ Пользователь деактивирован")
+
+
+@router.message(Command("rebuild_likes"))
+async def cmd_rebuild_likes(message: Message, db: Database, config: BotConfig):
+    """Перечитать граф лайков из базы, например после правки likes вручную"""
+    if message.from_user.id not in config.admin_ids:
+        return
+    if db.like_graph is None:
+        await message.answer("❌ Граф лайков выключен")
+        return
+    db.rebuild_like_graph()
+    await message.answer("✅ Граф лайков будет перечитан из базы")
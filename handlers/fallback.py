@@ -0,0 +1,54 @@
+"""
+Обработчики для сообщений, которые не подошли ни одному сценарию
+"""
+from aiogram import Router
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message, CallbackQuery, ReplyKeyboardRemove
+
+from database.fsm_storage import TTLStorage
+import keyboards.keyboards as kb
+from utils.outbox import Outbox
+
+
+router = Router()
+
+
+def restart_prompt(evicted_state: str) -> tuple[str, object]:
+    """Текст и клавиатура для пользователя, чей сценарий был сброшен"""
+    if evicted_state.startswith("ProfileEdit"):
+        return (
+            "⌛ Редактирование анкеты было прервано, изменения не сохранены.\n"
+            "Открой «👤 Моя анкета», чтобы попробовать снова.",
+            kb.get_main_menu()
+        )
+    return (
+        "⌛ Ты слишком долго заполнял анкету, и мы её сбросили.\n"
+        "Начни заново командой /start",
+        ReplyKeyboardRemove()
+    )
+
+
+def pop_evicted_state(state: FSMContext):
+    """Состояние, в котором был сброшен сценарий, если хранилище его запомнило"""
+    if isinstance(state.storage, TTLStorage):
+        return state.storage.pop_evicted(state.key)
+    return None
+
+
+@router.message()
+async def unhandled_message(message: Message, state: FSMContext, outbox: Outbox):
+    """Сообщение вне сценария: возможно, сценарий сброшен по таймауту"""
+    evicted_state = pop_evicted_state(state)
+    if evicted_state:
+        text, keyboard = restart_prompt(evicted_state)
+        outbox.send(message.answer(text, reply_markup=keyboard))
+
+
+@router.callback_query()
+async def unhandled_callback(callback: CallbackQuery, state: FSMContext, outbox: Outbox):
+    """Кнопка из сброшенного сценария"""
+    evicted_state = pop_evicted_state(state)
+    if evicted_state:
+        text, keyboard = restart_prompt(evicted_state)
+        outbox.send(callback.message.answer(text, reply_markup=keyboard))
+    await callback.answer()
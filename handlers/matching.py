@@ -1,136 +1,234 @@
 """
 Обработчики для просмотра анкет и мэтчинга
 """
-import json
-from aiogram import Router, F, Bot
+from typing import Optional, Union
+
+from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InputMediaPhoto, InputMediaVideo
 from aiogram.fsm.context import FSMContext
 
 from database.models import Database
 import keyboards.keyboards as kb
 from config import BotConfig
+from utils.cards import get_match_card, get_profile_card
+from utils.notifications import MatchNotifier
+from utils.outbox import Outbox, Priority
+from utils.prefetch import PreparedCard, ProfilePrefetcher
 
 
 router = Router()
 
 
-async def format_profile_text(profile: dict) -> str:
-    """Форматирование текста анкеты"""
-    gender_emoji = "👨" if profile["gender"] == "male" else "👩"
+async def get_next_card(
+    db: Database,
+    prefetcher: Optional[ProfilePrefetcher],
+    user_id: int,
+    gender: str,
+    looking_for: str
+) -> Optional[PreparedCard]:
+    """Следующая анкета: подготовленная заранее или выбранная сейчас"""
+    if prefetcher:
+        card = await prefetcher.take(user_id, gender, looking_for)
+        if card:
+            return card
     
-    text = (
-        f"{gender_emoji} <b>{profile['name']}</b>, {profile['age']}\n"
-        f"🏙 {profile['city']}\n"
+    next_profile = await db.get_next_profile(
+        user_id=user_id,
+        gender=gender,
+        looking_for=looking_for
     )
+    if not next_profile:
+        return None
     
-    if profile.get("bio"):
-        text += f"\n📝 {profile['bio']}"
-    
+    card = await get_profile_card(db, next_profile)
+    return PreparedCard(next_profile, card, (gender, looking_for))
+
+
+def carousel_caption(text: str, photo_index: int, photo_count: int) -> str:
+    """Подпись карточки с номером фотографии"""
+    if photo_count > 1:
+        text = text.rstrip() + f"\n\n📷 {photo_index + 1}/{photo_count}"
     return text
 
 
+def carousel_media(profile: dict, text: str, photo_index: int = 0) -> Union[InputMediaPhoto, InputMediaVideo]:
+    """Медиа карточки: видео или одна из фотографий"""
+    if profile.get("video"):
+        return InputMediaVideo(media=profile["video"], caption=text, parse_mode="HTML")
+    
+    photos = profile["photo_list"]
+    return InputMediaPhoto(
+        media=photos[photo_index],
+        caption=carousel_caption(text, photo_index, len(photos)),
+        parse_mode="HTML"
+    )
+
+
+def show_carousel_card(message: Message, profile: dict, text: str, outbox: Outbox, edit: bool = False):
+    """
+    Показать анкету одним сообщением.
+    При edit=True заменяется анкета в сообщении message, иначе отправляется новое.
+    """
+    photos = [] if profile.get("video") else profile["photo_list"]
+    has_media = bool(profile.get("video") or photos)
+    reply_markup = kb.get_profile_actions_keyboard(profile["user_id"], 0, len(photos))
+    
+    if edit:
+        if has_media and (getattr(message, "photo", None) or getattr(message, "video", None)):
+            outbox.send(message.edit_media(
+                media=carousel_media(profile, text),
+                reply_markup=reply_markup
+            ))
+            return
+        if not has_media and getattr(message, "text", None):
+            outbox.send(message.edit_text(
+                text,
+                parse_mode="HTML",
+                reply_markup=reply_markup
+            ))
+            return
+        # Текстовое сообщение нельзя превратить в медиа и наоборот — заменяем его
+        outbox.send(message.delete())
+    
+    if profile.get("video"):
+        outbox.send(message.answer_video(
+            video=profile["video"],
+            caption=text,
+            parse_mode="HTML",
+            reply_markup=reply_markup
+        ))
+    elif photos:
+        outbox.send(message.answer_photo(
+            photo=photos[0],
+            caption=carousel_caption(text, 0, len(photos)),
+            parse_mode="HTML",
+            reply_markup=reply_markup
+        ))
+    else:
+        outbox.send(message.answer(
+            text,
+            parse_mode="HTML",
+            reply_markup=reply_markup
+        ))
+
+
 async def send_profile(
     message: Message, 
-    profile: dict, 
+    card: PreparedCard, 
     db: Database,
     config: BotConfig,
-    user_id: int
+    outbox: Outbox,
+    user_id: int,
+    prefetcher: Optional[ProfilePrefetcher] = None,
+    edit: bool = False
 ) -> bool:
     """
     Отправить анкету пользователю.
+    В режиме одной карточки при edit=True анкета заменяет предыдущую в message.
     Возвращает False если лимит просмотров исчерпан.
     """
-    # Проверяем лимит просмотров
-    view_limit = await db.get_view_limit(user_id)
-    total_allowed = config.daily_views_limit + view_limit["extra_views"]
+    # Списываем просмотр, если лимит ещё не исчерпан
+    view_limit = await db.try_consume_view(user_id, config.daily_views_limit)
     
-    if view_limit["views_used"] >= total_allowed:
-        await message.answer(
+    if not view_limit["allowed"]:
+        # Анкета не показана — пусть дождется, пока лимит не сбросят
+        db.return_candidate(user_id, card.profile["user_id"], *card.key)
+        total_allowed = config.daily_views_limit + view_limit["extra_views"]
+        outbox.send(message.answer(
             "😔 Лимит просмотров на сегодня исчерпан!\n\n"
             f"Использовано: {view_limit['views_used']}/{total_allowed}\n\n"
             "Ты можешь сбросить лимит или купить дополнительные просмотры:",
             reply_markup=kb.get_limit_reached_keyboard()
-        )
+        ))
         return False
     
-    # Увеличиваем счетчик просмотров
-    await db.increment_views(user_id)
-    
-    text = await format_profile_text(profile)
-    photos = json.loads(profile["photos"]) if profile["photos"] else []
+    profile = card.profile
+    text = card.card.text
+    reply_markup = card.card.reply_markup
+    photos = profile["photo_list"]
     
     # Отправляем медиа
-    if profile.get("video"):
+    if config.carousel_mode:
+        show_carousel_card(message, profile, text, outbox, edit)
+    elif profile.get("video"):
         # Если есть видео, отправляем его
-        await message.answer_video(
+        outbox.send(message.answer_video(
             video=profile["video"],
             caption=text,
             parse_mode="HTML",
-            reply_markup=kb.get_profile_actions_keyboard(profile["user_id"])
-        )
+            reply_markup=reply_markup
+        ))
     elif photos:
         if len(photos) == 1:
-            await message.answer_photo(
+            outbox.send(message.answer_photo(
                 photo=photos[0],
                 caption=text,
                 parse_mode="HTML",
-                reply_markup=kb.get_profile_actions_keyboard(profile["user_id"])
-            )
+                reply_markup=reply_markup
+            ))
         else:
-            # Отправляем альбом фотографий
-            media = [InputMediaPhoto(media=photo) for photo in photos]
-            media[0].caption = text
-            media[0].parse_mode = "HTML"
-            
-            await message.answer_media_group(media=media)
+            # Отправляем альбом фотографий, собранный вместе с карточкой
+            outbox.send(message.answer_media_group(media=list(card.card.media)))
             # Кнопки отдельным сообщением
-            await message.answer(
+            outbox.send(message.answer(
                 "Оцени анкету:",
-                reply_markup=kb.get_profile_actions_keyboard(profile["user_id"])
-            )
+                reply_markup=reply_markup
+            ))
     else:
-        await message.answer(
+        outbox.send(message.answer(
             text,
             parse_mode="HTML",
-            reply_markup=kb.get_profile_actions_keyboard(profile["user_id"])
-        )
+            reply_markup=reply_markup
+        ))
     
+    # Пока пользователь смотрит эту анкету, готовим следующую
+    if prefetcher:
+        prefetcher.schedule(user_id, *card.key)
     return True
 
 
 @router.message(F.text == "👀 Смотреть анкеты")
-async def start_viewing(message: Message, db: Database, config: BotConfig):
+async def start_viewing(
+    message: Message,
+    db: Database,
+    config: BotConfig,
+    outbox: Outbox,
+    prefetcher: Optional[ProfilePrefetcher] = None
+):
     """Начать просмотр анкет"""
     user = await db.get_user_by_telegram_id(message.from_user.id)
     if not user:
-        await message.answer("❌ Сначала создай анкету командой /start")
+        outbox.send(message.answer("❌ Сначала создай анкету командой /start"))
         return
     
     profile = await db.get_profile(user["id"])
     if not profile:
-        await message.answer("❌ У тебя ещё нет анкеты. Создай её командой /start")
+        outbox.send(message.answer("❌ У тебя ещё нет анкеты. Создай её командой /start"))
         return
     
     # Ищем подходящую анкету
-    next_profile = await db.get_next_profile(
-        user_id=user["id"],
-        gender=profile["gender"],
-        looking_for=profile["looking_for"]
-    )
+    card = await get_next_card(db, prefetcher, user["id"], profile["gender"], profile["looking_for"])
     
-    if not next_profile:
-        await message.answer(
+    if not card:
+        outbox.send(message.answer(
             "😔 Пока нет подходящих анкет.\n"
             "Попробуй позже или расширь критерии поиска!",
             reply_markup=kb.get_no_profiles_keyboard()
-        )
+        ))
         return
     
-    await send_profile(message, next_profile, db, config, user["id"])
+    await send_profile(message, card, db, config, outbox, user["id"], prefetcher)
 
 
 @router.callback_query(F.data.startswith("like_"))
-async def process_like(callback: CallbackQuery, db: Database, config: BotConfig, bot: Bot):
+async def process_like(
+    callback: CallbackQuery,
+    db: Database,
+    config: BotConfig,
+    outbox: Outbox,
+    notifier: MatchNotifier,
+    prefetcher: Optional[ProfilePrefetcher] = None
+):
     """Обработка лайка"""
     target_user_id = int(callback.data.replace("like_", ""))
     
@@ -138,42 +236,23 @@ async def process_like(callback: CallbackQuery, db: Database, config: BotConfig,
     is_match = await db.add_like(user["id"], target_user_id, is_like=True)
     
     if is_match:
-        # Уведомляем обоих пользователей о мэтче
-        target_user = await db.get_user_by_telegram_id(target_user_id)
-        my_profile = await db.get_profile(user["id"])
-        target_profile = await db.get_profile(target_user_id)
-        
-        # Уведомление текущему пользователю
-        await callback.message.answer(
-            f"🎉 <b>У вас взаимная симпатия!</b>\n\n"
-            f"Ты и <b>{target_profile['name']}</b> понравились друг другу!\n"
-            f"Теперь вы можете начать общаться!",
-            parse_mode="HTML",
-            reply_markup=kb.get_match_keyboard(target_user["telegram_id"] if target_user else target_user_id)
-        )
-        
-        # Уведомление второму пользователю
-        if target_user:
-            try:
-                await bot.send_message(
-                    chat_id=target_user["telegram_id"],
-                    text=f"🎉 <b>У вас взаимная симпатия!</b>\n\n"
-                         f"Ты и <b>{my_profile['name']}</b> понравились друг другу!\n"
-                         f"Теперь вы можете начать общаться!",
-                    parse_mode="HTML",
-                    reply_markup=kb.get_match_keyboard(callback.from_user.id)
-                )
-            except Exception:
-                pass  # Пользователь мог заблокировать бота
+        # Уведомления обоим уже записаны вместе с мэтчем, отправит их воркер
+        notifier.wake()
     
     await callback.answer("❤️ Лайк!")
     
     # Показываем следующую анкету
-    await show_next_profile(callback, db, config)
+    await show_next_profile(callback, db, config, outbox, prefetcher)
 
 
 @router.callback_query(F.data.startswith("dislike_"))
-async def process_dislike(callback: CallbackQuery, db: Database, config: BotConfig):
+async def process_dislike(
+    callback: CallbackQuery,
+    db: Database,
+    config: BotConfig,
+    outbox: Outbox,
+    prefetcher: Optional[ProfilePrefetcher] = None
+):
     """Обработка дизлайка"""
     target_user_id = int(callback.data.replace("dislike_", ""))
     
@@ -183,46 +262,75 @@ async def process_dislike(callback: CallbackQuery, db: Database, config: BotConf
     await callback.answer("👎")
     
     # Показываем следующую анкету
-    await show_next_profile(callback, db, config)
+    await show_next_profile(callback, db, config, outbox, prefetcher)
 
 
-async def show_next_profile(callback: CallbackQuery, db: Database, config: BotConfig):
+async def show_next_profile(
+    callback: CallbackQuery,
+    db: Database,
+    config: BotConfig,
+    outbox: Outbox,
+    prefetcher: Optional[ProfilePrefetcher] = None
+):
     """Показать следующую анкету"""
     user = await db.get_user_by_telegram_id(callback.from_user.id)
     profile = await db.get_profile(user["id"])
     
-    next_profile = await db.get_next_profile(
-        user_id=user["id"],
-        gender=profile["gender"],
-        looking_for=profile["looking_for"]
-    )
+    card = await get_next_card(db, prefetcher, user["id"], profile["gender"], profile["looking_for"])
     
-    if not next_profile:
-        await callback.message.answer(
+    if not card:
+        outbox.send(callback.message.answer(
             "😔 Анкеты закончились!\n"
             "Попробуй позже или купи дополнительные просмотры.",
             reply_markup=kb.get_no_profiles_keyboard()
-        )
+        ))
         return
     
-    success = await send_profile(callback.message, next_profile, db, config, user["id"])
+    success = await send_profile(callback.message, card, db, config, outbox, user["id"], prefetcher, edit=True)
     if not success:
         return  # Лимит исчерпан, сообщение уже отправлено
 
 
+@router.callback_query(F.data.startswith("photo_"))
+async def switch_photo(callback: CallbackQuery, db: Database, outbox: Outbox):
+    """Перелистнуть фотографию в карточке анкеты"""
+    _, profile_user_id, photo_index = callback.data.split("_")
+    profile = await db.get_profile(int(profile_user_id))
+    
+    if not profile or not profile["photo_list"] or not profile["is_visible"]:
+        await callback.answer("Анкета больше недоступна")
+        return
+    
+    photos = profile["photo_list"]
+    photo_index = int(photo_index) % len(photos)
+    card = await get_profile_card(db, profile)
+    
+    outbox.send(callback.message.edit_media(
+        media=carousel_media(profile, card.text, photo_index),
+        reply_markup=kb.get_profile_actions_keyboard(profile["user_id"], photo_index, len(photos))
+    ))
+    await callback.answer()
+
+
 @router.callback_query(F.data == "stop_viewing")
-async def stop_viewing(callback: CallbackQuery):
+async def stop_viewing(callback: CallbackQuery, outbox: Outbox):
     """Остановить просмотр анкет"""
     await callback.message.delete()
-    await callback.message.answer(
+    outbox.send(callback.message.answer(
         "👋 Просмотр анкет остановлен.\n"
         "Возвращайся, когда будешь готов!",
         reply_markup=kb.get_main_menu()
-    )
+    ))
 
 
 @router.callback_query(F.data == "refresh_profiles")
-async def refresh_profiles(callback: CallbackQuery, db: Database, config: BotConfig):
+async def refresh_profiles(
+    callback: CallbackQuery,
+    db: Database,
+    config: BotConfig,
+    outbox: Outbox,
+    prefetcher: Optional[ProfilePrefetcher] = None
+):
     """Обновить список анкет"""
     await callback.answer("🔄 Обновляю...")
     await callback.message.delete()
@@ -231,64 +339,85 @@ async def refresh_profiles(callback: CallbackQuery, db: Database, config: BotCon
     user = await db.get_user_by_telegram_id(callback.from_user.id)
     profile = await db.get_profile(user["id"])
     
-    next_profile = await db.get_next_profile(
-        user_id=user["id"],
-        gender=profile["gender"],
-        looking_for=profile["looking_for"]
-    )
+    card = await get_next_card(db, prefetcher, user["id"], profile["gender"], profile["looking_for"])
     
-    if not next_profile:
-        await callback.message.answer(
+    if not card:
+        outbox.send(callback.message.answer(
             "😔 Пока нет новых анкет.\n"
             "Попробуй позже!",
             reply_markup=kb.get_no_profiles_keyboard()
-        )
+        ))
         return
     
-    await send_profile(callback.message, next_profile, db, config, user["id"])
+    await send_profile(callback.message, card, db, config, outbox, user["id"], prefetcher)
 
 
 # === Мэтчи ===
 
 @router.message(F.text == "❤️ Мои мэтчи")
-async def show_matches(message: Message, db: Database):
+async def show_matches(message: Message, db: Database, config: BotConfig, outbox: Outbox):
     """Показать список мэтчей"""
     user = await db.get_user_by_telegram_id(message.from_user.id)
     if not user:
-        await message.answer("❌ Сначала создай анкету командой /start")
+        outbox.send(message.answer("❌ Сначала создай анкету командой /start"))
         return
     
-    matches = await db.get_user_matches(user["id"])
+    total = await db.count_user_matches(user["id"])
     
-    if not matches:
-        await message.answer(
+    if not total:
+        outbox.send(message.answer(
             "💔 У тебя пока нет мэтчей.\n\n"
             "Продолжай смотреть анкеты — взаимная симпатия обязательно случится!"
-        )
+        ))
         return
     
-    await message.answer(f"❤️ <b>Твои мэтчи ({len(matches)}):</b>", parse_mode="HTML")
+    outbox.send(message.answer(f"❤️ <b>Твои мэтчи ({total}):</b>", parse_mode="HTML"))
+    await send_matches_page(message, db, config, outbox, user["id"])
+
+
+@router.callback_query(F.data.startswith("matches_page_"))
+async def show_more_matches(callback: CallbackQuery, db: Database, config: BotConfig, outbox: Outbox):
+    """Показать следующую страницу мэтчей"""
+    cursor = int(callback.data.replace("matches_page_", ""))
+    user = await db.get_user_by_telegram_id(callback.from_user.id)
+    
+    await callback.answer()
+    await callback.message.delete()
+    await send_matches_page(callback.message, db, config, outbox, user["id"], cursor)
+
+
+async def send_matches_page(
+    message: Message,
+    db: Database,
+    config: BotConfig,
+    outbox: Outbox,
+    user_id: int,
+    cursor: int = None
+):
+    """Отправить одну страницу мэтчей"""
+    matches, next_cursor = await db.get_user_matches_page(
+        user_id, cursor=cursor, limit=config.matches_page_size
+    )
     
-    for match in matches[:10]:  # Показываем первые 10
-        # Получаем профиль мэтча
-        matched_user_id = match["user2_id"] if match["user1_id"] == user["id"] else match["user1_id"]
-        matched_profile = await db.get_profile(matched_user_id)
-        matched_user = await db.get_user_by_telegram_id(matched_user_id)
+    for match in matches:
+        card = await get_match_card(db, match)
         
-        if matched_profile and matched_user:
-            photos = json.loads(matched_profile["photos"]) if matched_profile["photos"] else []
-            text = f"<b>{matched_profile['name']}</b>, {matched_profile['age']} — {matched_profile['city']}"
-            
-            if photos:
-                await message.answer_photo(
-                    photo=photos[0],
-                    caption=text,
-                    parse_mode="HTML",
-                    reply_markup=kb.get_match_keyboard(matched_user["telegram_id"])
-                )
-            else:
-                await message.answer(
-                    text,
-                    parse_mode="HTML",
-                    reply_markup=kb.get_match_keyboard(matched_user["telegram_id"])
-                )
+        if match["photo"]:
+            outbox.send(message.answer_photo(
+                photo=match["photo"],
+                caption=card.text,
+                parse_mode="HTML",
+                reply_markup=card.reply_markup
+            ), Priority.BULK)
+        else:
+            outbox.send(message.answer(
+                card.text,
+                parse_mode="HTML",
+                reply_markup=card.reply_markup
+            ), Priority.BULK)
+    
+    if next_cursor is not None:
+        outbox.send(message.answer(
+            "Это не все мэтчи 👇",
+            reply_markup=kb.get_matches_more_keyboard(next_cursor)
+        ), Priority.BULK)
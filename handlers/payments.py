@@ -13,6 +13,7 @@ from aiogram.types import (
 from database.models import Database
 import keyboards.keyboards as kb
 from config import BotConfig
+from utils.outbox import Outbox, Priority
 
 
 router = Router()
@@ -34,31 +35,32 @@ VIEWS_AMOUNTS = {
 
 
 @router.message(F.text == "⭐ Магазин")
-async def show_shop(message: Message, db: Database, config: BotConfig):
+async def show_shop(message: Message, db: Database, config: BotConfig, outbox: Outbox):
     """Показать магазин"""
     user = await db.get_user_by_telegram_id(message.from_user.id)
     if not user:
-        await message.answer("❌ Сначала создай анкету командой /start")
+        outbox.send(message.answer("❌ Сначала создай анкету командой /start"))
         return
     
     view_limit = await db.get_view_limit(user["id"])
     total_allowed = config.daily_views_limit + view_limit["extra_views"]
     
-    await message.answer(
+    outbox.send(message.answer(
         "⭐ <b>Магазин</b>\n\n"
         f"📊 Твой лимит сегодня: {view_limit['views_used']}/{total_allowed}\n\n"
         "Выбери, что хочешь приобрести:",
         parse_mode="HTML",
         reply_markup=kb.get_shop_keyboard()
-    )
+    ))
 
 
 @router.callback_query(F.data == "buy_reset")
 @router.callback_query(F.data == "reset_limit")
-async def buy_reset_limit(callback: CallbackQuery):
+async def buy_reset_limit(callback: CallbackQuery, outbox: Outbox):
     """Покупка сброса лимита"""
     await send_invoice(
         callback.message,
+        outbox,
         title="Сброс лимита просмотров",
         description="Сбрось счетчик просмотров и начни заново!",
         payload="reset_limit",
@@ -70,10 +72,11 @@ async def buy_reset_limit(callback: CallbackQuery):
 @router.callback_query(F.data == "buy_views_10")
 @router.callback_query(F.data == "buy_extra_views")
 @router.callback_query(F.data == "buy_views")
-async def buy_views_10(callback: CallbackQuery):
+async def buy_views_10(callback: CallbackQuery, outbox: Outbox):
     """Покупка 10 просмотров"""
     await send_invoice(
         callback.message,
+        outbox,
         title="+10 просмотров",
         description="Получи дополнительные 10 просмотров анкет!",
         payload="extra_views_10",
@@ -83,10 +86,11 @@ async def buy_views_10(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "buy_views_50")
-async def buy_views_50(callback: CallbackQuery):
+async def buy_views_50(callback: CallbackQuery, outbox: Outbox):
     """Покупка 50 просмотров"""
     await send_invoice(
         callback.message,
+        outbox,
         title="+50 просмотров",
         description="Получи дополнительные 50 просмотров анкет!",
         payload="extra_views_50",
@@ -96,10 +100,11 @@ async def buy_views_50(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "buy_views_100")
-async def buy_views_100(callback: CallbackQuery):
+async def buy_views_100(callback: CallbackQuery, outbox: Outbox):
     """Покупка 100 просмотров"""
     await send_invoice(
         callback.message,
+        outbox,
         title="+100 просмотров",
         description="Получи дополнительные 100 просмотров анкет!",
         payload="extra_views_100",
@@ -110,20 +115,21 @@ async def buy_views_100(callback: CallbackQuery):
 
 async def send_invoice(
     message: Message,
+    outbox: Outbox,
     title: str,
     description: str,
     payload: str,
     amount: int
 ):
     """Отправить инвойс для оплаты звездами"""
-    await message.answer_invoice(
+    outbox.send(message.answer_invoice(
         title=title,
         description=description,
         payload=payload,
         currency="XTR",  # Telegram Stars
         prices=[LabeledPrice(label=title, amount=amount)],
         # Для Telegram Stars provider_token не нужен
-    )
+    ))
 
 
 @router.pre_checkout_query()
@@ -134,7 +140,7 @@ async def process_pre_checkout(pre_checkout_query: PreCheckoutQuery):
 
 
 @router.message(F.content_type == ContentType.SUCCESSFUL_PAYMENT)
-async def process_successful_payment(message: Message, db: Database, config: BotConfig):
+async def process_successful_payment(message: Message, db: Database, config: BotConfig, outbox: Outbox):
     """Обработка успешного платежа"""
     payment = message.successful_payment
     payload = payment.invoice_payload
@@ -150,11 +156,11 @@ async def process_successful_payment(message: Message, db: Database, config: Bot
             payment_type="reset_views",
             telegram_payment_id=payment.telegram_payment_charge_id
         )
-        await message.answer(
+        outbox.send(message.answer(
             "✅ Лимит просмотров успешно сброшен!\n"
             "Теперь ты можешь продолжить смотреть анкеты.",
             reply_markup=kb.get_main_menu()
-        )
+        ), Priority.HIGH)
     
     elif payload.startswith("extra_views_"):
         # Добавление просмотров
@@ -169,19 +175,19 @@ async def process_successful_payment(message: Message, db: Database, config: Bot
             payment_type="extra_views",
             telegram_payment_id=payment.telegram_payment_charge_id
         )
-        await message.answer(
+        outbox.send(message.answer(
             f"✅ Добавлено {views_amount} дополнительных просмотров!\n"
             "Приятного поиска!",
             reply_markup=kb.get_main_menu()
-        )
+        ), Priority.HIGH)
 
 
 @router.callback_query(F.data == "cancel_payment")
-async def cancel_payment(callback: CallbackQuery):
+async def cancel_payment(callback: CallbackQuery, outbox: Outbox):
     """Отмена платежа"""
     await callback.message.delete()
-    await callback.message.answer(
+    outbox.send(callback.message.answer(
         "❌ Покупка отменена.",
         reply_markup=kb.get_main_menu()
-    )
+    ))
     await callback.answer()
@@ -2,15 +2,18 @@
 Обработчики для создания и редактирования анкет
 """
 import json
+import re
+from typing import Optional
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, ContentType
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.filters import Command, StateFilter
 
-from database.models import Database
+from database.models import Database, MIN_AGE, MAX_AGE
 import keyboards.keyboards as kb
 from config import BotConfig
+from utils.cards import get_own_profile_card
 
 
 router = Router()
@@ -22,6 +25,7 @@ class ProfileCreation(StatesGroup):
     age = State()
     gender = State()
     looking_for = State()
+    partner_age = State()
     city = State()
     bio = State()
     photos = State()
@@ -36,6 +40,27 @@ class ProfileEdit(StatesGroup):
     bio = State()
     photos = State()
     video = State()
+    partner_age = State()
+
+
+def parse_age_range(text: str) -> Optional[tuple[int, int]]:
+    """Разобрать диапазон возраста: «20-30», «20 30» или одно число"""
+    numbers = [int(number) for number in re.findall(r"\d+", text)]
+    if len(numbers) == 1:
+        numbers *= 2
+    if len(numbers) != 2:
+        return None
+    min_age, max_age = numbers
+    if not MIN_AGE <= min_age <= max_age <= MAX_AGE:
+        return None
+    return min_age, max_age
+
+
+PARTNER_AGE_PROMPT = (
+    "💞 Какой возраст партнера тебе интересен?\n"
+    "Напиши диапазон, например: 20-30"
+)
+PARTNER_AGE_ERROR = f"❌ Укажи диапазон от {MIN_AGE} до {MAX_AGE}, например: 20-30"
 
 
 # === Начало регистрации ===
@@ -114,6 +139,30 @@ async def process_looking_for(callback: CallbackQuery, state: FSMContext):
     looking_for = callback.data.replace("looking_", "")
     await state.update_data(looking_for=looking_for)
     
+    await callback.message.edit_text(
+        PARTNER_AGE_PROMPT,
+        reply_markup=kb.get_skip_keyboard("partner_age")
+    )
+    await state.set_state(ProfileCreation.partner_age)
+
+
+@router.message(ProfileCreation.partner_age)
+async def process_partner_age(message: Message, state: FSMContext):
+    """Получение диапазона возраста партнера"""
+    age_range = parse_age_range(message.text or "")
+    if not age_range:
+        await message.answer(PARTNER_AGE_ERROR)
+        return
+    
+    await state.update_data(min_partner_age=age_range[0], max_partner_age=age_range[1])
+    await message.answer("🏙 В каком городе ты находишься?")
+    await state.set_state(ProfileCreation.city)
+
+
+@router.callback_query(ProfileCreation.partner_age, F.data == "skip_partner_age")
+async def skip_partner_age(callback: CallbackQuery, state: FSMContext):
+    """Пропуск возраста партнера"""
+    await state.update_data(min_partner_age=None, max_partner_age=None)
     await callback.message.edit_text("🏙 В каком городе ты находишься?")
     await state.set_state(ProfileCreation.city)
 
@@ -242,7 +291,9 @@ async def finish_profile_creation(message: Message, state: FSMContext, db: Datab
         city=data["city"],
         bio=data.get("bio", ""),
         photos=json.dumps(data.get("photos", [])),
-        video=data.get("video")
+        video=data.get("video"),
+        min_partner_age=data.get("min_partner_age"),
+        max_partner_age=data.get("max_partner_age")
     )
     
     await state.clear()
@@ -269,40 +320,23 @@ async def show_my_profile(message: Message, db: Database):
         await message.answer("❌ У тебя ещё нет анкеты. Создай её командой /start")
         return
     
-    # Формируем текст анкеты
-    photos = json.loads(profile["photos"]) if profile["photos"] else []
-    gender_text = "👨 Мужчина" if profile["gender"] == "male" else "👩 Женщина"
-    looking_text = "👨 мужчин" if profile["looking_for"] == "male" else "👩 женщин"
-    visibility = "👁 Видна всем" if profile["is_visible"] else "🙈 Скрыта"
-    
-    text = (
-        f"📋 <b>Твоя анкета:</b>\n\n"
-        f"<b>{profile['name']}</b>, {profile['age']}\n"
-        f"{gender_text}\n"
-        f"🏙 {profile['city']}\n"
-        f"🔍 Ищу: {looking_text}\n\n"
-    )
-    
-    if profile["bio"]:
-        text += f"📝 {profile['bio']}\n\n"
-    
-    text += f"📷 Фото: {len(photos)}\n"
-    text += f"🎥 Видео: {'Есть' if profile['video'] else 'Нет'}\n"
-    text += f"\n{visibility}"
+    # Текст анкеты и кнопки собираются один раз на версию анкеты
+    card = await get_own_profile_card(db, profile)
+    photos = profile["photo_list"]
     
     # Отправляем первое фото с анкетой
     if photos:
         await message.answer_photo(
             photo=photos[0],
-            caption=text,
+            caption=card.text,
             parse_mode="HTML",
-            reply_markup=kb.get_my_profile_keyboard()
+            reply_markup=card.reply_markup
         )
     else:
         await message.answer(
-            text,
+            card.text,
             parse_mode="HTML",
-            reply_markup=kb.get_my_profile_keyboard()
+            reply_markup=card.reply_markup
         )
 
 
@@ -350,13 +384,51 @@ async def process_edit_name(message: Message, state: FSMContext, db: Database):
         city=profile["city"],
         bio=profile["bio"],
         photos=profile["photos"],
-        video=profile["video"]
+        video=profile["video"],
+        min_partner_age=profile["min_partner_age"],
+        max_partner_age=profile["max_partner_age"]
     )
     
     await state.clear()
     await message.answer("✅ Имя обновлено!", reply_markup=kb.get_main_menu())
 
 
+@router.callback_query(F.data == "edit_partner_age")
+async def start_edit_partner_age(callback: CallbackQuery, state: FSMContext):
+    """Начать редактирование возраста партнера"""
+    await callback.message.answer(
+        PARTNER_AGE_PROMPT + "\nИли нажми «Пропустить», чтобы снять ограничение.",
+        reply_markup=kb.get_skip_keyboard("partner_age")
+    )
+    await state.set_state(ProfileEdit.partner_age)
+
+
+@router.message(ProfileEdit.partner_age)
+async def process_edit_partner_age(message: Message, state: FSMContext, db: Database):
+    """Обработка нового диапазона возраста партнера"""
+    age_range = parse_age_range(message.text or "")
+    if not age_range:
+        await message.answer(PARTNER_AGE_ERROR)
+        return
+    
+    user = await db.get_user_by_telegram_id(message.from_user.id)
+    await db.update_partner_age(user["id"], *age_range)
+    
+    await state.clear()
+    await message.answer("✅ Возраст партнера обновлен!", reply_markup=kb.get_main_menu())
+
+
+@router.callback_query(ProfileEdit.partner_age, F.data == "skip_partner_age")
+async def clear_partner_age(callback: CallbackQuery, state: FSMContext, db: Database):
+    """Снять ограничение по возрасту партнера"""
+    user = await db.get_user_by_telegram_id(callback.from_user.id)
+    await db.update_partner_age(user["id"], None, None)
+    
+    await state.clear()
+    await callback.message.delete()
+    await callback.message.answer("✅ Ограничение по возрасту снято!", reply_markup=kb.get_main_menu())
+
+
 @router.callback_query(F.data == "hide_profile")
 async def toggle_profile_visibility(callback: CallbackQuery, db: Database):
     """Переключить видимость анкеты"""
@@ -1,6 +1,10 @@
 """
-Клавиатуры для бота знакомств
+Клавиатуры для бота знакомств.
+Клавиатуры строятся один раз и отдаются всем пользователям одним и тем же
+объектом, поэтому возвращенную разметку нельзя изменять.
 """
+from functools import cache, lru_cache
+
 from aiogram.types import (
     InlineKeyboardMarkup, 
     InlineKeyboardButton,
@@ -10,8 +14,13 @@ from aiogram.types import (
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 
 
+# Сколько клавиатур с id пользователя или анкеты хранить
+PER_USER_CACHE_SIZE = 4096
+
+
 # === Главное меню ===
 
+@cache
 def get_main_menu() -> ReplyKeyboardMarkup:
     """Главное меню бота"""
     builder = ReplyKeyboardBuilder()
@@ -28,6 +37,7 @@ def get_main_menu() -> ReplyKeyboardMarkup:
 
 # === Регистрация ===
 
+@cache
 def get_gender_keyboard() -> InlineKeyboardMarkup:
     """Выбор пола"""
     builder = InlineKeyboardBuilder()
@@ -38,6 +48,7 @@ def get_gender_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@cache
 def get_looking_for_keyboard() -> InlineKeyboardMarkup:
     """Кого ищем"""
     builder = InlineKeyboardBuilder()
@@ -48,6 +59,7 @@ def get_looking_for_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@lru_cache(maxsize=None)
 def get_skip_keyboard(field: str) -> InlineKeyboardMarkup:
     """Кнопка пропуска"""
     builder = InlineKeyboardBuilder()
@@ -57,6 +69,7 @@ def get_skip_keyboard(field: str) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@cache
 def get_done_media_keyboard() -> InlineKeyboardMarkup:
     """Завершить добавление медиа"""
     builder = InlineKeyboardBuilder()
@@ -68,9 +81,28 @@ def get_done_media_keyboard() -> InlineKeyboardMarkup:
 
 # === Просмотр анкет ===
 
-def get_profile_actions_keyboard(profile_user_id: int) -> InlineKeyboardMarkup:
-    """Кнопки действий при просмотре анкеты"""
+@lru_cache(maxsize=PER_USER_CACHE_SIZE)
+def get_profile_actions_keyboard(
+    profile_user_id: int, 
+    photo_index: int = 0, 
+    photo_count: int = 1
+) -> InlineKeyboardMarkup:
+    """
+    Кнопки действий при просмотре анкеты.
+    Если фотографий несколько, добавляются стрелки для их листания.
+    """
     builder = InlineKeyboardBuilder()
+    if photo_count > 1:
+        builder.row(
+            InlineKeyboardButton(
+                text="◀", 
+                callback_data=f"photo_{profile_user_id}_{(photo_index - 1) % photo_count}"
+            ),
+            InlineKeyboardButton(
+                text="▶", 
+                callback_data=f"photo_{profile_user_id}_{(photo_index + 1) % photo_count}"
+            )
+        )
     builder.row(
         InlineKeyboardButton(text="❤️", callback_data=f"like_{profile_user_id}"),
         InlineKeyboardButton(text="👎", callback_data=f"dislike_{profile_user_id}")
@@ -81,6 +113,7 @@ def get_profile_actions_keyboard(profile_user_id: int) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@cache
 def get_no_profiles_keyboard() -> InlineKeyboardMarkup:
     """Нет анкет для просмотра"""
     builder = InlineKeyboardBuilder()
@@ -93,6 +126,7 @@ def get_no_profiles_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@cache
 def get_limit_reached_keyboard() -> InlineKeyboardMarkup:
     """Лимит просмотров исчерпан"""
     builder = InlineKeyboardBuilder()
@@ -107,6 +141,7 @@ def get_limit_reached_keyboard() -> InlineKeyboardMarkup:
 
 # === Мэтчи ===
 
+@lru_cache(maxsize=PER_USER_CACHE_SIZE)
 def get_match_keyboard(matched_telegram_id: int) -> InlineKeyboardMarkup:
     """Кнопка перехода к чату с мэтчем"""
     builder = InlineKeyboardBuilder()
@@ -119,8 +154,19 @@ def get_match_keyboard(matched_telegram_id: int) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@lru_cache(maxsize=PER_USER_CACHE_SIZE)
+def get_matches_more_keyboard(cursor: int) -> InlineKeyboardMarkup:
+    """Следующая страница мэтчей"""
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        InlineKeyboardButton(text="➡️ Показать ещё", callback_data=f"matches_page_{cursor}")
+    )
+    return builder.as_markup()
+
+
 # === Моя анкета ===
 
+@cache
 def get_my_profile_keyboard() -> InlineKeyboardMarkup:
     """Управление своей анкетой"""
     builder = InlineKeyboardBuilder()
@@ -138,6 +184,7 @@ def get_my_profile_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+@cache
 def get_edit_profile_keyboard() -> InlineKeyboardMarkup:
     """Что редактировать в анкете"""
     builder = InlineKeyboardBuilder()
@@ -149,12 +196,16 @@ def get_edit_profile_keyboard() -> InlineKeyboardMarkup:
         InlineKeyboardButton(text="🏙 Город", callback_data="edit_city"),
         InlineKeyboardButton(text="📄 Описание", callback_data="edit_bio")
     )
+    builder.row(
+        InlineKeyboardButton(text="💞 Возраст партнера", callback_data="edit_partner_age")
+    )
     builder.row(
         InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_profile")
     )
     return builder.as_markup()
 
 
+@cache
 def get_confirm_delete_keyboard() -> InlineKeyboardMarkup:
     """Подтверждение удаления"""
     builder = InlineKeyboardBuilder()
@@ -167,6 +218,7 @@ def get_confirm_delete_keyboard() -> InlineKeyboardMarkup:
 
 # === Магазин ===
 
+@cache
 def get_shop_keyboard() -> InlineKeyboardMarkup:
     """Магазин"""
     builder = InlineKeyboardBuilder()
@@ -187,6 +239,7 @@ def get_shop_keyboard() -> InlineKeyboardMarkup:
 
 # === Оплата ===
 
+@lru_cache(maxsize=64)
 def get_payment_keyboard(payment_type: str, amount: int) -> InlineKeyboardMarkup:
     """Кнопка оплаты"""
     builder = InlineKeyboardBuilder()
@@ -0,0 +1,58 @@
+"""
+Пакетный расчет рекомендаций для ленты
+Запускается по расписанию, например раз в ночь:
+    python recommend.py --workers 8
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+# Добавляем текущую директорию в путь поиска модулей
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config import DatabaseConfig, load_config
+from database.models import Database
+from database.recommendations import build_recommendations
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger(__name__)
+
+
+async def prepare_database(db_config: DatabaseConfig):
+    """Создать таблицы и применить миграции, как при запуске бота"""
+    db = Database(db_config.path, db_config)
+    await db.connect()
+    await db.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пересчитать таблицу recommendations")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Процессов для расчета")
+    parser.add_argument("--chunk-size", type=int, help="Смотрящих в одной задаче")
+    parser.add_argument("--restart", action="store_true", help="Начать заново, а не с прерванного места")
+    args = parser.parse_args()
+
+    _, db_config = load_config()
+    if args.chunk_size:
+        db_config.recommendation_chunk_size = args.chunk_size
+
+    asyncio.run(prepare_database(db_config))
+
+    started = time.perf_counter()
+    written = build_recommendations(db_config, args.workers, resume=not args.restart)
+    logger.info("Рекомендации готовы: %s строк за %.1f сек", written, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Общие фикстуры тестов
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# Корень проекта в пути поиска модулей, как в bot.py
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import DatabaseConfig
+
+
+@pytest.fixture
+def db_config(tmp_path) -> DatabaseConfig:
+    """Настройки базы во временной директории"""
+    return DatabaseConfig(path=str(tmp_path / "test.db"))
+
+
+@pytest.fixture
+def run():
+    """Выполнить корутину в отдельном цикле событий"""
+    return asyncio.run
+
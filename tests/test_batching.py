@@ -0,0 +1,107 @@
+"""
+Групповая фиксация: откат только своей точки сохранения и работа после ошибки пачки
+"""
+import asyncio
+import sqlite3
+
+import aiosqlite
+
+from database.batching import WriteBatcher
+
+
+INSERT = "INSERT INTO items (value) VALUES (?)"
+
+
+class FailingCommit:
+    """Соединение, у которого первая фиксация падает"""
+
+    def __init__(self, connection: aiosqlite.Connection):
+        self._connection = connection
+        self.failures = 1
+
+    async def commit(self):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("disk I/O error")
+        await self._connection.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+async def open_items(path: str) -> aiosqlite.Connection:
+    connection = await aiosqlite.connect(path)
+    await connection.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT UNIQUE)")
+    await connection.commit()
+    return connection
+
+
+async def values(connection: aiosqlite.Connection) -> list[str]:
+    async with connection.execute("SELECT value FROM items ORDER BY id") as cursor:
+        return [row[0] for row in await cursor.fetchall()]
+
+
+def test_failed_call_rolls_back_only_its_statements(run, tmp_path):
+    async def scenario():
+        connection = await open_items(str(tmp_path / "batch.db"))
+        batcher = WriteBatcher(connection, interval=0.05, max_statements=100)
+        batcher.start()
+        try:
+            results = await asyncio.gather(
+                batcher.submit([(INSERT, ("a",))]),
+                # Второй запрос нарушает UNIQUE: откатывается и первый запрос этого вызова
+                batcher.submit([(INSERT, ("b",)), (INSERT, ("a",))]),
+                batcher.submit([(INSERT, ("c",)), (INSERT, ("d",))]),
+                return_exceptions=True
+            )
+        finally:
+            await batcher.stop()
+        stored = await values(connection)
+        await connection.close()
+        return results, stored
+
+    results, stored = run(scenario())
+    assert [result.lastrowid for result in results[0]] == [1]
+    assert isinstance(results[1], sqlite3.IntegrityError)
+    assert len(results[2]) == 2
+    assert stored == ["a", "c", "d"]
+
+
+def test_next_batch_works_after_batch_error(run, tmp_path):
+    async def scenario():
+        connection = await open_items(str(tmp_path / "batch.db"))
+        batcher = WriteBatcher(FailingCommit(connection), interval=0.05, max_statements=100)
+        batcher.start()
+        try:
+            failed = await asyncio.gather(
+                batcher.submit([(INSERT, ("a",))]),
+                batcher.submit([(INSERT, ("b",))]),
+                return_exceptions=True
+            )
+            # Пачка откатилась целиком, следующая фиксируется как обычно
+            await batcher.submit([(INSERT, ("a",))])
+        finally:
+            await batcher.stop()
+        stored = await values(connection)
+        await connection.close()
+        return failed, stored
+
+    failed, stored = run(scenario())
+    assert all(isinstance(error, sqlite3.OperationalError) for error in failed)
+    assert stored == ["a"]
+
+
+def test_stop_applies_queued_writes(run, tmp_path):
+    async def scenario():
+        connection = await open_items(str(tmp_path / "batch.db"))
+        batcher = WriteBatcher(connection, interval=10, max_statements=100)
+        batcher.start()
+        pending = asyncio.ensure_future(batcher.submit([(INSERT, ("a",))]))
+        await asyncio.sleep(0)
+        await batcher.stop()
+        await pending
+        stored = await values(connection)
+        await connection.close()
+        return stored
+
+    assert run(scenario()) == ["a"]
@@ -0,0 +1,58 @@
+"""
+Лента анкет: обход до конца показывает каждого подходящего кандидата один раз
+"""
+import dataclasses
+
+import pytest
+
+from config import RankingConfig
+from database.models import Database
+
+
+CITIES = ["Москва", "Санкт-Петербург", "Казань", "Нигдеевск"]
+
+
+async def walk_feed(db: Database, user_id: int) -> list[int]:
+    """Пролистать ленту до конца, оценивая каждую анкету, как это делает пользователь"""
+    shown = []
+    while True:
+        profile = await db.get_next_profile(user_id, "male", "female")
+        if profile is None:
+            return shown
+        shown.append(profile["user_id"])
+        await db.add_like(user_id, profile["user_id"], False)
+
+
+async def fill_and_walk(config) -> tuple[list[int], set[int]]:
+    """Создать 300 анкет в нескольких городах и пролистать ленту мужчины, ищущего женщин"""
+    db = Database(config.path, config)
+    await db.connect()
+    try:
+        viewer = await db.get_or_create_user(1, "viewer")
+        await db.create_profile(viewer, "Зритель", 30, "male", "female", "Москва", "", "[]")
+        eligible = set()
+        for telegram_id in range(2, 302):
+            user_id = await db.get_or_create_user(telegram_id, None)
+            gender, looking_for = ("female", "male") if telegram_id % 4 else ("male", "female")
+            city = CITIES[telegram_id % len(CITIES)]
+            await db.create_profile(user_id, "Анкета", 20 + telegram_id % 20, gender, looking_for, city, "", "[]")
+            if gender == "female":
+                eligible.add(user_id)
+                if telegram_id % 7 == 0:
+                    # Часть кандидатов уже лайкнула зрителя и идет вне очереди
+                    await db.add_like(user_id, viewer, True)
+        return await walk_feed(db, viewer), eligible
+    finally:
+        await db.disconnect()
+
+
+@pytest.mark.parametrize("ranking", [
+    RankingConfig(enabled=False),
+    RankingConfig(enabled=True, pool_size=20, top_k=5),
+    RankingConfig(enabled=True, pool_size=1000, top_k=50),
+], ids=["shuffle", "ranking-small-pool", "ranking-default"])
+def test_feed_shows_each_candidate_once(run, db_config, ranking):
+    config = dataclasses.replace(db_config, ranking=ranking, candidate_batch_size=20)
+    shown, eligible = run(fill_and_walk(config))
+    assert len(shown) == len(set(shown))
+    assert set(shown) == eligible
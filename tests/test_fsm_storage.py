@@ -0,0 +1,102 @@
+"""
+Хранилище FSM: изменения во время записи не теряются, вытеснение сбрасывает давние сценарии,
+очистка воркера не трогает записи чужих воркеров
+"""
+from aiogram.fsm.storage.base import StorageKey
+
+from database.fsm_storage import SQLiteStorage, TTLStorage, storage_key_id
+from database.models import Database
+
+
+def make_key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+def test_changes_during_flush_wait_for_next_flush(run, db_config):
+    async def scenario():
+        db = Database(db_config.path, db_config)
+        await db.connect()
+        try:
+            storage = SQLiteStorage(db)
+            key = make_key(10)
+            save = db.save_fsm_records
+
+            async def save_while_writing(records):
+                # Обработчик другого обновления меняет данные, пока идет запись
+                await storage.set_data(key, {"step": 2})
+                await save(records)
+
+            db.save_fsm_records = save_while_writing
+            await storage.set_state(key, "Form:name")
+            await storage.set_data(key, {"step": 1})
+            await storage.flush()
+            after_first = await db.get_fsm_record(storage_key_id(key))
+            buffered = storage_key_id(key) in storage._entries
+
+            db.save_fsm_records = save
+            await storage.flush()
+            after_second = await db.get_fsm_record(storage_key_id(key))
+            return after_first, buffered, after_second, dict(storage._entries)
+        finally:
+            await db.disconnect()
+
+    after_first, buffered, after_second, entries = run(scenario())
+    assert after_first == ("Form:name", {"step": 1})
+    assert buffered
+    assert after_second == ("Form:name", {"step": 2})
+    assert entries == {}
+
+
+def test_lru_eviction_resets_oldest_session_before_close(run, db_config):
+    async def scenario():
+        db = Database(db_config.path, db_config)
+        await db.connect()
+        try:
+            sqlite_storage = SQLiteStorage(db)
+            storage = TTLStorage(sqlite_storage, ttl=3600, max_sessions=2)
+            first, second, third = make_key(1), make_key(2), make_key(3)
+            for key in (first, second):
+                await storage.set_state(key, "Form:name")
+                await storage.set_data(key, {"name": "Анна"})
+            await sqlite_storage.flush()
+
+            # Первый сценарий свежее второго, вытеснен будет второй
+            await storage.get_state(first)
+            await storage.set_state(third, "Form:age")
+            await storage.close()
+
+            records = {key.user_id: await db.get_fsm_record(storage_key_id(key)) for key in (first, second, third)}
+            return records, storage.pop_evicted(second), storage.pop_evicted(first), storage.evicted_total
+        finally:
+            await db.disconnect()
+
+    records, evicted_state, not_evicted, evicted_total = run(scenario())
+    assert records[2] == (None, {})
+    assert records[1] == ("Form:name", {"name": "Анна"})
+    assert records[3] == ("Form:age", {})
+    assert evicted_state == "Form:name"
+    assert not_evicted is None
+    assert evicted_total == 1
+
+
+def test_expire_keeps_other_shards_records(run, db_config):
+    async def scenario():
+        db = Database(db_config.path, db_config)
+        await db.connect()
+        try:
+            keys = [make_key(user_id) for user_id in range(1, 7)]
+            await db.save_fsm_records([
+                (storage_key_id(key), key.user_id, "Form:name", {}) for key in keys
+            ])
+            await db._write("UPDATE fsm_states SET updated_at = datetime('now', '-1 day')")
+
+            # Воркер 1 из 3 удаляет только записи пользователей с user_id % 3 == 1
+            expired = await SQLiteStorage(db, shard=(1, 3)).expire(3600)
+            left = {key.user_id for key in keys if (await db.get_fsm_record(storage_key_id(key)))[0]}
+            return expired, left
+        finally:
+            await db.disconnect()
+
+    expired, left = run(scenario())
+    assert sorted(expired) == sorted((storage_key_id(make_key(user_id)), "Form:name") for user_id in (1, 4))
+    assert left == {2, 3, 5, 6}
@@ -0,0 +1,43 @@
+"""
+Граф лайков: ограничение размера и перечитывание вытесненных из базы
+"""
+import dataclasses
+
+from database.likegraph import LikeGraph
+from database.models import Database
+
+
+def test_least_recently_used_is_evicted():
+    graph = LikeGraph(max_users=2)
+    graph.load(1, [(10, True)])
+    graph.load(2, [(20, False)])
+    # Обращение к 1 делает его свежим, вытесняется 2
+    assert graph.has_liked(1, 10)
+    graph.load(3, [])
+    assert graph.is_loaded(1) and graph.is_loaded(3)
+    assert not graph.is_loaded(2)
+    assert graph.stats()["users"] == 2
+
+
+def test_evicted_user_is_reloaded_from_database(run, db_config):
+    config = dataclasses.replace(db_config, like_graph=True, like_graph_max_users=2)
+
+    async def scenario():
+        db = Database(config.path, config)
+        await db.connect()
+        try:
+            users = [await db.get_or_create_user(telegram_id, None) for telegram_id in range(1, 6)]
+            first, second = users[0], users[1]
+            await db.add_like(first, second, True)
+            # Оценки остальных вытесняют первого из графа
+            for user_id in users[2:]:
+                await db.add_like(user_id, first, False)
+            assert not db.like_graph.is_loaded(first)
+
+            assert await db._exclude_rated(first, users[1:]) == users[2:]
+            # Встречный лайк находит мэтч по перечитанным оценкам
+            return await db.add_like(second, first, True)
+        finally:
+            await db.disconnect()
+
+    assert run(scenario())
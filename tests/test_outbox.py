@@ -0,0 +1,92 @@
+"""
+Очередь исходящих сообщений: приоритеты, общий лимит и пауза между ответами в чат
+"""
+import asyncio
+
+from aiogram.methods import SendMessage
+
+from utils.outbox import Outbox, Priority, begin_reply
+
+
+class RecordingBot:
+    """Бот, который запоминает время и текст каждой отправки"""
+
+    def __init__(self):
+        self.sent: list[tuple[float, int, str]] = []
+
+    async def __call__(self, method: SendMessage):
+        self.sent.append((asyncio.get_running_loop().time(), method.chat_id, method.text))
+        return True
+
+
+async def deliver(outbox: Outbox, futures: list):
+    """Дождаться отправки и остановить очередь"""
+    await asyncio.wait_for(asyncio.gather(*futures), 10)
+    await outbox.stop()
+
+
+def test_higher_priority_goes_first(run):
+    async def scenario():
+        bot = RecordingBot()
+        outbox = Outbox(bot, rate=100, chat_interval=0)
+        futures = [
+            outbox.send(SendMessage(chat_id=1, text="bulk"), Priority.BULK),
+            outbox.send(SendMessage(chat_id=2, text="normal")),
+            outbox.send(SendMessage(chat_id=3, text="high"), Priority.HIGH),
+            outbox.send(SendMessage(chat_id=4, text="normal-2")),
+        ]
+        outbox.start()
+        await deliver(outbox, futures)
+        return [text for _, _, text in bot.sent]
+
+    assert run(scenario()) == ["high", "normal", "normal-2", "bulk"]
+
+
+def test_rate_limits_whole_bot(run):
+    rate, count = 50, 100
+
+    async def scenario():
+        bot = RecordingBot()
+        outbox = Outbox(bot, rate=rate, chat_interval=0)
+        outbox.start()
+        started = asyncio.get_running_loop().time()
+        futures = [outbox.send(SendMessage(chat_id=chat_id, text="x")) for chat_id in range(count)]
+        await deliver(outbox, futures)
+        return [at - started for at, _, _ in bot.sent]
+
+    times = run(scenario())
+    assert len(times) == count
+    # Полное ведро уходит сразу, дальше не быстрее rate в секунду
+    for i, at in enumerate(times):
+        assert at >= (i + 1 - rate) / rate - 0.01
+
+
+def test_chat_interval_applies_between_replies(run):
+    interval = 0.3
+
+    async def scenario():
+        bot = RecordingBot()
+        outbox = Outbox(bot, rate=100, chat_interval=interval)
+        outbox.start()
+        futures = []
+        # Уведомления вне обработчика — каждое отдельным ответом
+        futures.append(outbox.send(SendMessage(chat_id=1, text="notice-1")))
+        futures.append(outbox.send(SendMessage(chat_id=1, text="notice-2")))
+        begin_reply()
+        futures += [outbox.send(SendMessage(chat_id=1, text=f"card-{i}")) for i in range(3)]
+        begin_reply()
+        futures += [outbox.send(SendMessage(chat_id=1, text=f"page-{i}")) for i in range(2)]
+        await deliver(outbox, futures)
+        return [(at, text) for at, _, text in bot.sent]
+
+    sent = run(scenario())
+    assert [text for _, text in sent] == [
+        "notice-1", "notice-2", "card-0", "card-1", "card-2", "page-0", "page-1"
+    ]
+    gaps = [later[0] - earlier[0] for earlier, later in zip(sent, sent[1:])]
+    # Между ответами пауза, внутри ответа сообщения идут подряд
+    assert gaps[0] >= interval - 0.01
+    assert gaps[1] >= interval - 0.01
+    assert max(gaps[2], gaps[3]) < interval / 2
+    assert gaps[4] >= interval - 0.01
+    assert gaps[5] < interval / 2
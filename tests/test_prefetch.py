@@ -0,0 +1,107 @@
+"""
+Подготовка следующей анкеты: непоказанный кандидат возвращается в очередь
+"""
+import asyncio
+
+from database.models import Database
+from utils.prefetch import ProfilePrefetcher
+
+
+async def create_feed(db: Database, viewers: int, candidates: int) -> tuple[list[int], set[int]]:
+    """Мужчины, ищущие женщин, и анкеты женщин для них"""
+    viewer_ids, candidate_ids = [], set()
+    for telegram_id in range(1, viewers + candidates + 1):
+        user_id = await db.get_or_create_user(telegram_id, None)
+        if telegram_id <= viewers:
+            await db.create_profile(user_id, "Зритель", 30, "male", "female", "Москва", "", "[]")
+            viewer_ids.append(user_id)
+        else:
+            await db.create_profile(user_id, "Анкета", 25, "female", "male", "Москва", "", "[]")
+            candidate_ids.add(user_id)
+    return viewer_ids, candidate_ids
+
+
+async def next_profile(db: Database, prefetcher: ProfilePrefetcher, user_id: int):
+    """Следующая анкета так же, как в обработчике: подготовленная или выбранная сейчас"""
+    card = await prefetcher.take(user_id, "male", "female")
+    if card:
+        return card.profile
+    return await db.get_next_profile(user_id, "male", "female")
+
+
+def test_evicted_slots_return_candidates(run, db_config):
+    async def scenario():
+        db = Database(db_config.path, db_config)
+        await db.connect()
+        try:
+            viewers, candidates = await create_feed(db, 2, 30)
+            # Один слот на двоих: подготовка для одного вытесняет анкету другого
+            prefetcher = ProfilePrefetcher(db, max_users=1)
+            shown = {viewer: [] for viewer in viewers}
+            active = list(viewers)
+            while active:
+                for viewer in list(active):
+                    profile = await next_profile(db, prefetcher, viewer)
+                    if profile is None:
+                        active.remove(viewer)
+                        continue
+                    shown[viewer].append(profile["user_id"])
+                    await db.add_like(viewer, profile["user_id"], False)
+                    prefetcher.schedule(viewer, "male", "female")
+                    await prefetcher.close()
+            return shown, candidates, prefetcher.stats()
+        finally:
+            await db.disconnect()
+
+    shown, candidates, stats = run(scenario())
+    assert stats["misses"] > 0
+    for viewer_shown in shown.values():
+        assert len(viewer_shown) == len(set(viewer_shown))
+        assert set(viewer_shown) == candidates
+
+
+def test_expired_slot_returns_candidate(run, db_config):
+    async def scenario():
+        db = Database(db_config.path, db_config)
+        await db.connect()
+        try:
+            (viewer,), _ = await create_feed(db, 1, 5)
+            prefetcher = ProfilePrefetcher(db, ttl=0.05)
+            prefetcher.schedule(viewer, "male", "female")
+            await prefetcher.close()
+            prepared = prefetcher._slots._data[viewer][1].profile["user_id"]
+
+            await asyncio.sleep(0.1)
+            taken = await prefetcher.take(viewer, "male", "female")
+            following = await db.get_next_profile(viewer, "male", "female")
+            return prepared, taken, following["user_id"]
+        finally:
+            await db.disconnect()
+
+    prepared, taken, following = run(scenario())
+    assert taken is None
+    assert following == prepared
+
+
+def test_rejected_candidate_is_not_shown(run, db_config):
+    async def scenario():
+        db = Database(db_config.path, db_config)
+        await db.connect()
+        try:
+            (viewer,), _ = await create_feed(db, 1, 5)
+            prefetcher = ProfilePrefetcher(db)
+            prefetcher.schedule(viewer, "male", "female")
+            await prefetcher.close()
+            prepared = prefetcher._slots._data[viewer][1].profile["user_id"]
+
+            # Пользователь успел оценить подготовленную анкету другим путем
+            await db.add_like(viewer, prepared, False)
+            taken = await prefetcher.take(viewer, "male", "female")
+            following = await db.get_next_profile(viewer, "male", "female")
+            return prepared, taken, following["user_id"]
+        finally:
+            await db.disconnect()
+
+    prepared, taken, following = run(scenario())
+    assert taken is None
+    assert following != prepared
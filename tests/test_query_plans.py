@@ -0,0 +1,28 @@
+"""
+Планы запросов горячего пути: каждый запрос использует свой индекс
+"""
+import dataclasses
+
+from database.models import Database
+
+
+def check_plans(run, config) -> list[str]:
+    """Создать базу со всеми индексами и проверить планы"""
+    async def check():
+        db = Database(config.path, config)
+        await db.connect()
+        try:
+            return await db.check_query_plans()
+        finally:
+            await db.disconnect()
+    return run(check())
+
+
+def test_query_plans_use_indexes(run, db_config):
+    assert check_plans(run, db_config) == []
+
+
+def test_query_plans_without_readers(run, db_config):
+    # Без читающих соединений запросы идут через писателя
+    config = dataclasses.replace(db_config, reader_connections=0)
+    assert check_plans(run, config) == []
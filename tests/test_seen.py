@@ -0,0 +1,51 @@
+"""
+Фильтры «уже оценил»: счетчик без повторов, ограничение размера и перечитывание вытесненных
+"""
+import dataclasses
+
+from database.models import Database
+from database.seen import BloomFilter, SeenSets
+
+
+def test_repeated_add_is_counted_once():
+    bloom = BloomFilter(capacity=10, error_rate=0.01)
+    assert bloom.add(42)
+    for _ in range(20):
+        assert not bloom.add(42)
+    assert bloom.count == 1
+    assert not bloom.is_full
+
+
+def test_least_recently_used_is_evicted():
+    seen_sets = SeenSets(capacity=10, error_rate=0.01, max_users=2)
+    seen_sets.build(1, [(1, 10)])
+    seen_sets.build(2, [(2, 20)])
+    assert seen_sets.get(1) is not None
+    seen_sets.build(3, [])
+    assert 1 in seen_sets and 3 in seen_sets
+    assert 2 not in seen_sets
+
+
+def test_evicted_filter_keeps_ratings(run, db_config):
+    config = dataclasses.replace(db_config, seen_filter=True, seen_filter_max_users=1)
+
+    async def scenario():
+        db = Database(config.path, config)
+        await db.connect()
+        try:
+            users = [await db.get_or_create_user(telegram_id, None) for telegram_id in range(1, 5)]
+            viewer = users[0]
+            # Повторные оценки одного кандидата не заполняют фильтр
+            for is_like in (False, True, False):
+                await db.add_like(viewer, users[1], is_like)
+            assert db.seen_sets.get(viewer).filter.count == 1
+
+            # Оценка другого пользователя вытесняет фильтр смотрящего
+            await db.add_like(users[2], viewer, True)
+            assert viewer not in db.seen_sets
+
+            assert await db._exclude_rated(viewer, users[1:]) == users[2:]
+        finally:
+            await db.disconnect()
+
+    run(scenario())
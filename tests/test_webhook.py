@@ -0,0 +1,135 @@
+"""
+Вебхук: прием записанных обновлений, проверка секрета и ограничение параллельности
+"""
+import asyncio
+import json
+
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+
+from config import BotConfig
+from utils.webhook import SECRET_HEADER, create_app, create_forwarding_app
+
+
+SECRET = "test-secret"
+
+
+def make_update(update_id: int, text: str = "привет") -> dict:
+    """Обновление в том виде, в каком его присылает Telegram"""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": 1000 + update_id, "type": "private"},
+            "from": {"id": 1000 + update_id, "is_bot": False, "first_name": "Тест"},
+            "text": text,
+        },
+    }
+
+
+def make_config(max_concurrent: int = 40) -> BotConfig:
+    return BotConfig(
+        token="42:TEST", admin_ids=[],
+        webhook_path="/webhook", webhook_secret=SECRET, webhook_max_concurrent=max_concurrent
+    )
+
+
+async def post(client: TestClient, update: dict, secret: str = SECRET):
+    return await client.post("/webhook", data=json.dumps(update), headers={
+        SECRET_HEADER: secret, "Content-Type": "application/json"
+    })
+
+
+def test_webhook_delivers_updates(run):
+    received = []
+    router = Router()
+
+    @router.message()
+    async def handler(message: Message):
+        received.append(message.text)
+
+    async def scenario():
+        dispatcher = Dispatcher()
+        dispatcher.include_router(router)
+        app = create_app(Bot("42:TEST"), dispatcher, make_config())
+        async with TestClient(TestServer(app)) as client:
+            for update_id, text in enumerate(["раз", "два"], start=1):
+                response = await post(client, make_update(update_id, text))
+                assert response.status == 200
+
+    run(scenario())
+    assert received == ["раз", "два"]
+
+
+def test_webhook_rejects_wrong_secret(run):
+    received = []
+    router = Router()
+
+    @router.message()
+    async def handler(message: Message):
+        received.append(message.text)
+
+    async def scenario():
+        dispatcher = Dispatcher()
+        dispatcher.include_router(router)
+        app = create_app(Bot("42:TEST"), dispatcher, make_config())
+        async with TestClient(TestServer(app)) as client:
+            response = await post(client, make_update(1), secret="wrong")
+            assert response.status == 401
+
+    run(scenario())
+    assert received == []
+
+
+def test_forwarding_app_checks_secret(run):
+    forwarded = []
+
+    async def forward(raw: str):
+        forwarded.append(json.loads(raw)["update_id"])
+
+    async def scenario():
+        app = create_forwarding_app(make_config(), forward)
+        async with TestClient(TestServer(app)) as client:
+            assert (await post(client, make_update(1), secret="wrong")).status == 401
+            assert (await post(client, make_update(2))).status == 200
+
+    run(scenario())
+    assert forwarded == [2]
+
+
+def test_webhook_limits_concurrent_updates(run):
+    max_concurrent = 2
+    router = Router()
+    release = asyncio.Event()
+    in_flight = 0
+    peak = 0
+
+    @router.message()
+    async def handler(message: Message):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await release.wait()
+        in_flight -= 1
+
+    async def scenario():
+        dispatcher = Dispatcher()
+        dispatcher.include_router(router)
+        app = create_app(Bot("42:TEST"), dispatcher, make_config(max_concurrent))
+        async with TestClient(TestServer(app)) as client:
+            requests = [asyncio.ensure_future(post(client, make_update(i))) for i in range(1, 6)]
+            # Дать всем запросам дойти до сервера
+            for _ in range(50):
+                await asyncio.sleep(0.01)
+                if in_flight == max_concurrent:
+                    break
+            await asyncio.sleep(0.05)
+            assert in_flight == max_concurrent
+            release.set()
+            responses = await asyncio.gather(*requests)
+            assert [response.status for response in responses] == [200] * 5
+
+    run(scenario())
+    assert peak == max_concurrent
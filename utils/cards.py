@@ -0,0 +1,116 @@
+"""
+Карточки анкет: текст, медиа и кнопки, готовые к отправке
+"""
+from dataclasses import dataclass
+from typing import Any
+
+from aiogram.types import InputMediaPhoto
+
+from database.models import Database
+import keyboards.keyboards as kb
+
+
+@dataclass(frozen=True)
+class ProfileCard:
+    """
+    Отрисованная анкета. Карточки общие для всех, кто их смотрит,
+    поэтому объекты внутри нельзя менять.
+    """
+    text: str
+    media: tuple = ()  # Альбом InputMediaPhoto, если фотографий несколько
+    reply_markup: Any = None
+
+
+async def format_profile_text(profile: dict) -> str:
+    """Форматирование текста анкеты"""
+    gender_emoji = "👨" if profile["gender"] == "male" else "👩"
+
+    text = (
+        f"{gender_emoji} <b>{profile['name']}</b>, {profile['age']}\n"
+        f"🏙 {profile['city']}\n"
+    )
+
+    if profile.get("bio"):
+        text += f"\n📝 {profile['bio']}"
+
+    return text
+
+
+async def format_own_profile_text(profile: dict) -> str:
+    """Текст своей анкеты с настройками"""
+    photos = profile["photo_list"]
+    gender_text = "👨 Мужчина" if profile["gender"] == "male" else "👩 Женщина"
+    looking_text = "👨 мужчин" if profile["looking_for"] == "male" else "👩 женщин"
+    visibility = "👁 Видна всем" if profile["is_visible"] else "🙈 Скрыта"
+    min_age, max_age = profile.get("min_partner_age"), profile.get("max_partner_age")
+    if min_age or max_age:
+        partner_age_text = f"{min_age or 18}–{max_age or 100}"
+    else:
+        partner_age_text = "любой"
+
+    text = (
+        f"📋 <b>Твоя анкета:</b>\n\n"
+        f"<b>{profile['name']}</b>, {profile['age']}\n"
+        f"{gender_text}\n"
+        f"🏙 {profile['city']}\n"
+        f"🔍 Ищу: {looking_text}\n"
+        f"💞 Возраст партнера: {partner_age_text}\n\n"
+    )
+
+    if profile["bio"]:
+        text += f"📝 {profile['bio']}\n\n"
+
+    text += f"📷 Фото: {len(photos)}\n"
+    text += f"🎥 Видео: {'Есть' if profile['video'] else 'Нет'}\n"
+    text += f"\n{visibility}"
+    return text
+
+
+async def get_profile_card(db: Database, profile: dict) -> ProfileCard:
+    """Карточка анкеты в ленте"""
+    card = db.cards.get("feed", profile["user_id"], profile["updated_at"])
+    if card:
+        return card
+
+    text = await format_profile_text(profile)
+    photos = profile["photo_list"]
+    media = ()
+    if not profile.get("video") and len(photos) > 1:
+        # Подпись альбома — у первой фотографии
+        media = tuple(
+            InputMediaPhoto(media=photo, caption=text, parse_mode="HTML") if index == 0
+            else InputMediaPhoto(media=photo)
+            for index, photo in enumerate(photos)
+        )
+
+    card = ProfileCard(text, media, kb.get_profile_actions_keyboard(profile["user_id"]))
+    db.cards.set("feed", profile["user_id"], profile["updated_at"], card)
+    return card
+
+
+async def get_match_card(db: Database, match: dict) -> ProfileCard:
+    """Карточка собеседника в списке мэтчей"""
+    card = db.cards.get("match", match["user_id"], match["updated_at"])
+    if card:
+        return card
+
+    card = ProfileCard(
+        text=f"<b>{match['name']}</b>, {match['age']} — {match['city']}",
+        reply_markup=kb.get_match_keyboard(match["telegram_id"])
+    )
+    db.cards.set("match", match["user_id"], match["updated_at"], card)
+    return card
+
+
+async def get_own_profile_card(db: Database, profile: dict) -> ProfileCard:
+    """Карточка своей анкеты"""
+    card = db.cards.get("own", profile["user_id"], profile["updated_at"])
+    if card:
+        return card
+
+    card = ProfileCard(
+        text=await format_own_profile_text(profile),
+        reply_markup=kb.get_my_profile_keyboard()
+    )
+    db.cards.set("own", profile["user_id"], profile["updated_at"], card)
+    return card
@@ -0,0 +1,122 @@
+"""
+Фоновая доставка уведомлений о мэтчах
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.methods import SendMessage
+
+from database.models import Database
+import keyboards.keyboards as kb
+from utils.outbox import Outbox, Priority
+
+
+logger = logging.getLogger(__name__)
+
+
+def format_match_text(partner_name: Optional[str]) -> str:
+    """Текст уведомления о мэтче"""
+    return (
+        f"🎉 <b>У вас взаимная симпатия!</b>\n\n"
+        f"Ты и <b>{partner_name or 'собеседник'}</b> понравились друг другу!\n"
+        f"Теперь вы можете начать общаться!"
+    )
+
+
+class MatchNotifier:
+    """
+    Рассылает уведомления о мэтчах из таблицы match_notifications.
+    add_like ставит уведомления в той же транзакции, что и мэтч, поэтому
+    после перезапуска недоставленные уведомления будут отправлены.
+    Обработчик лайка только будит воркер через wake() и не ждет отправки.
+    Ошибки доставки записываются в базу; временные — с повтором.
+    """
+
+    def __init__(self, db: Database, outbox: Outbox, poll_interval: float = 30.0,
+                 batch_size: int = 50, max_attempts: int = 5, retry_delay: float = 60.0,
+                 shard: Optional[tuple[int, int]] = None):
+        self.db = db
+        self.outbox = outbox
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.shard = shard  # (номер воркера, число воркеров) в многопроцессном режиме
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Запустить воркер; заодно отправятся уведомления, оставшиеся с прошлого запуска"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0):
+        """Остановить воркер, дав текущей пачке отправиться"""
+        if not self._task:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            # Неотмеченные уведомления останутся pending и уйдут после перезапуска
+            pass
+        self._task = None
+
+    def wake(self):
+        """Появились новые уведомления"""
+        self._wakeup.set()
+
+    async def _run(self):
+        """Цикл выборки уведомлений"""
+        while not self._stopping:
+            try:
+                await self._dispatch_pending()
+            except Exception:
+                logger.exception("Ошибка при выборке уведомлений о мэтчах")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _dispatch_pending(self):
+        """Отправить пачками все уведомления, которые пора отправить"""
+        while not self._stopping:
+            notifications = await self.db.get_pending_notifications(self.batch_size, self.shard)
+            if not notifications:
+                return
+
+            # Следующую пачку берем, когда эта отмечена в базе,
+            # иначе те же строки попадут в выборку ещё раз
+            await asyncio.gather(*(self._deliver(notification) for notification in notifications))
+            if len(notifications) < self.batch_size:
+                return
+
+    async def _deliver(self, notification: dict):
+        """Отправить одно уведомление и записать результат"""
+        future = self.outbox.send(SendMessage(
+            chat_id=notification["telegram_id"],
+            text=format_match_text(notification["partner_name"]),
+            parse_mode="HTML",
+            reply_markup=kb.get_match_keyboard(notification["partner_telegram_id"])
+        ), Priority.HIGH)
+        try:
+            await future
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокирован или чат недоступен — повтор не поможет
+            await self.db.mark_notification_failed(notification["id"], str(e))
+        except Exception as e:
+            attempts = notification["attempts"] + 1
+            if attempts >= self.max_attempts:
+                logger.warning("Уведомление о мэтче %s не доставлено: %s", notification["id"], e)
+                await self.db.mark_notification_failed(notification["id"], str(e))
+            else:
+                await self.db.mark_notification_failed(
+                    notification["id"], str(e), retry_in=self.retry_delay * attempts
+                )
+        else:
+            await self.db.mark_notification_sent(notification["id"])
@@ -0,0 +1,294 @@
+"""
+Очередь исходящих сообщений с учетом лимитов Telegram
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+
+logger = logging.getLogger(__name__)
+
+# Ответ, к которому относятся отправляемые сейчас сообщения
+_current_reply: ContextVar[Optional[int]] = ContextVar("outbox_reply", default=None)
+_replies = itertools.count(1)
+
+
+def begin_reply():
+    """
+    Начать новый ответ в текущем контексте.
+    Вызывается на каждое обновление: сообщения, отправленные обработчиком,
+    уходят в чат подряд, без паузы chat_interval между ними.
+    """
+    _current_reply.set(next(_replies))
+
+
+class Priority(IntEnum):
+    """Классы приоритета: меньше — раньше"""
+    HIGH = 0  # Мэтчи, подтверждения оплаты
+    NORMAL = 1  # Ответы на действия пользователя
+    BULK = 2  # Списки и прочая массовая отправка
+
+
+@dataclass(order=True)
+class _Item:
+    """Сообщение в очереди чата"""
+    priority: int
+    seq: int
+    method: TelegramMethod = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    reply: Optional[int] = field(default=None, compare=False)  # Ответ, из которого сообщение
+    attempts: int = field(default=0, compare=False)
+
+
+@dataclass
+class _Chat:
+    """Очередь одного чата"""
+    items: list = field(default_factory=list)  # Куча _Item
+    next_at: float = 0.0  # Раньше этого времени в чат не пишем
+    busy: bool = False  # Сообщение уже отправляется
+    last_reply: Optional[int] = None  # Ответ последнего доставленного сообщения
+    waiting: bool = False  # Чат стоит в куче ожидания
+
+
+class Outbox:
+    """
+    Центральная отправка сообщений.
+    Обработчики кладут методы aiogram в очередь и не ждут сети.
+    Отправка идет в порядке приоритета с общим лимитом rate сообщений
+    в секунду и паузой chat_interval между ответами в один чат.
+    Сообщения одного ответа (см. begin_reply) идут в чат подряд:
+    альбом с подписью или страница мэтчей не растягиваются на секунды.
+    В пределах чата сообщения одного приоритета уходят по порядку.
+    TelegramRetryAfter откладывает чат на указанное время и повторяет отправку.
+    """
+
+    def __init__(self, bot: Bot, rate: float = 25.0, chat_interval: float = 1.0, max_retries: int = 3):
+        self.bot = bot
+        self.rate = rate
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self._seq = itertools.count()
+        self._chats: dict[Any, _Chat] = {}
+        self._ready: list[tuple[int, int, Any]] = []  # (приоритет, seq, chat_id) головы чата
+        self._waiting: list[tuple[float, Any]] = []  # (next_at, chat_id)
+        self._wakeup = asyncio.Event()
+        self._sending: set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._tokens = rate
+        self._refilled_at = 0.0
+
+    def start(self):
+        """Запустить фоновую отправку"""
+        self._refilled_at = asyncio.get_running_loop().time()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Дождаться отправки очереди и остановиться"""
+        if not self._task:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self.pending() or self._sending) and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        for task in list(self._sending):
+            task.cancel()
+        for chat in self._chats.values():
+            for item in chat.items:
+                if not item.future.done():
+                    item.future.cancel()
+        self._chats.clear()
+
+    def send(self, method: TelegramMethod, priority: Priority = Priority.NORMAL) -> asyncio.Future:
+        """
+        Поставить метод в очередь.
+        Возвращает future с результатом метода; ждать его не обязательно,
+        ошибки отправки записываются в лог.
+        """
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_exception)
+
+        chat_id = getattr(method, "chat_id", None)
+        item = _Item(int(priority), next(self._seq), method, future, _current_reply.get())
+        chat = self._chats.setdefault(chat_id, _Chat())
+        heapq.heappush(chat.items, item)
+        self._schedule(chat_id, chat)
+        return future
+
+    def pending(self) -> int:
+        """Сообщений в очереди"""
+        return sum(len(chat.items) for chat in self._chats.values())
+
+    def stats(self) -> dict:
+        """Размер очереди"""
+        return {"chats": len(self._chats), "pending": self.pending(), "sending": len(self._sending)}
+
+    def _paused(self, chat: _Chat, now: float) -> bool:
+        """Ждет ли голова чата паузы; продолжение того же ответа не ждет"""
+        if chat.next_at <= now:
+            return False
+        reply = chat.items[0].reply
+        return reply is None or reply != chat.last_reply
+
+    def _schedule(self, chat_id: Any, chat: _Chat):
+        """Поставить голову чата в очередь готовых или ожидающих"""
+        if chat.busy or not chat.items:
+            return
+        now = asyncio.get_running_loop().time()
+        if self._paused(chat, now):
+            if not chat.waiting:
+                chat.waiting = True
+                heapq.heappush(self._waiting, (chat.next_at, chat_id))
+                # Цикл отправки мог уснуть без таймаута: пусть пересчитает ближайшую паузу
+                self._wakeup.set()
+            return
+        head = chat.items[0]
+        # Старые записи того же чата отбрасываются при извлечении
+        heapq.heappush(self._ready, (head.priority, head.seq, chat_id))
+        self._wakeup.set()
+
+    def _has_ready(self) -> bool:
+        """Есть ли готовое сообщение; устаревшие записи отбрасываются"""
+        now = asyncio.get_running_loop().time()
+        while self._ready:
+            priority, seq, chat_id = self._ready[0]
+            chat = self._chats.get(chat_id)
+            if (chat is not None and not chat.busy and chat.items
+                    and (chat.items[0].priority, chat.items[0].seq) == (priority, seq)
+                    and not self._paused(chat, now)):
+                return True
+            heapq.heappop(self._ready)
+        return False
+
+    def _pop_ready(self) -> Optional[tuple[Any, _Chat, _Item]]:
+        """Взять самое приоритетное готовое сообщение"""
+        if not self._has_ready():
+            return None
+        _, _, chat_id = heapq.heappop(self._ready)
+        chat = self._chats[chat_id]
+        return chat_id, chat, heapq.heappop(chat.items)
+
+    def _release_waiting(self, now: float) -> Optional[float]:
+        """
+        Вернуть в работу чаты, у которых кончилась пауза, и забыть пустые.
+        Возвращает время окончания ближайшей паузы.
+        """
+        while self._waiting and self._waiting[0][0] <= now:
+            _, chat_id = heapq.heappop(self._waiting)
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                continue
+            if chat.next_at > now:
+                # Пауза сдвинулась: чат успел отправить продолжение ответа
+                heapq.heappush(self._waiting, (chat.next_at, chat_id))
+                continue
+            chat.waiting = False
+            if not chat.items and not chat.busy:
+                del self._chats[chat_id]
+                continue
+            self._schedule(chat_id, chat)
+        return self._waiting[0][0] if self._waiting else None
+
+    async def _take_token(self):
+        """Дождаться места в общем лимите"""
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            self._tokens = min(self.rate, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def _run(self):
+        """Цикл выбора следующего сообщения"""
+        loop = asyncio.get_running_loop()
+        while True:
+            next_release = self._release_waiting(loop.time())
+            if not self._has_ready():
+                self._wakeup.clear()
+                timeout = None if next_release is None else max(next_release - loop.time(), 0)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Сообщение выбираем после ожидания лимита: за это время
+            # могло прийти более приоритетное
+            await self._take_token()
+            self._release_waiting(loop.time())
+            picked = self._pop_ready()
+            if picked is None:
+                continue
+            chat_id, chat, item = picked
+            chat.busy = True
+            task = asyncio.create_task(self._deliver(chat_id, chat, item))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _deliver(self, chat_id: Any, chat: _Chat, item: _Item):
+        """Отправить одно сообщение и решить судьбу чата"""
+        loop = asyncio.get_running_loop()
+        try:
+            result = await self.bot(item.method)
+        except TelegramRetryAfter as e:
+            item.attempts += 1
+            chat.last_reply = None
+            chat.next_at = loop.time() + e.retry_after
+            # Лимит мог быть общим для бота: не отправляем всплеск следом
+            self._tokens = 0
+            if item.attempts > self.max_retries:
+                logger.warning("Не удалось отправить %s в чат %s: %s", type(item.method).__name__, chat_id, e)
+                item.future.set_exception(e)
+            else:
+                heapq.heappush(chat.items, item)
+        except TelegramNetworkError as e:
+            item.attempts += 1
+            chat.last_reply = None
+            chat.next_at = loop.time() + self.chat_interval * item.attempts
+            if item.attempts > self.max_retries:
+                logger.warning("Не удалось отправить %s в чат %s: %s", type(item.method).__name__, chat_id, e)
+                item.future.set_exception(e)
+            else:
+                heapq.heappush(chat.items, item)
+        except Exception as e:
+            # Пользователь заблокировал бота, чат удален и т.п. — повтор не поможет
+            chat.next_at = loop.time() + self.chat_interval
+            logger.warning("Не удалось отправить %s в чат %s: %s", type(item.method).__name__, chat_id, e)
+            item.future.set_exception(e)
+        else:
+            chat.next_at = loop.time() + self.chat_interval
+            chat.last_reply = item.reply
+            item.future.set_result(result)
+        finally:
+            chat.busy = False
+            if chat.items:
+                self._schedule(chat_id, chat)
+            elif not chat.waiting:
+                # Пустой чат дожидается конца паузы и удаляется в _release_waiting
+                chat.waiting = True
+                heapq.heappush(self._waiting, (chat.next_at, chat_id))
+
+
+def _consume_exception(future: asyncio.Future):
+    """Пометить ошибку прочитанной: отправитель мог не ждать результат"""
+    if not future.cancelled():
+        future.exception()
@@ -0,0 +1,101 @@
+"""
+Предварительная подготовка следующей анкеты в ленте
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from database.cache import TTLCache
+from database.models import Database
+from utils.cards import ProfileCard, get_profile_card
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PreparedCard:
+    """Анкета, выбранная для показа, и её карточка"""
+    profile: dict
+    card: ProfileCard
+    key: tuple = ()  # Параметры поиска, под которые она выбрана
+
+
+class ProfilePrefetcher:
+    """
+    Пока пользователь смотрит анкету, следующая выбирается и
+    отрисовывается в фоне и ждет в слоте пользователя. Перед показом
+    кандидат проверяется ещё раз: за это время анкету могли скрыть,
+    автора забанить, а сам пользователь мог её оценить.
+    Кандидат, которого так и не показали (слот устарел или вытеснен,
+    проверка перед показом не прошла), возвращается в очередь.
+    """
+
+    def __init__(self, db: Database, max_users: int = 10000, ttl: Optional[float] = 600.0):
+        self.db = db
+        self._slots = TTLCache(max_users, ttl, on_evict=self._return)
+        self._tasks: dict[int, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def schedule(self, user_id: int, gender: str, looking_for: str):
+        """Начать подготовку следующей анкеты, если она ещё не готовится"""
+        if user_id in self._tasks or self._slots.get(user_id) is not None:
+            return
+        task = asyncio.create_task(self._prepare(user_id, (gender, looking_for)))
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(user_id, None))
+
+    async def take(self, user_id: int, gender: str, looking_for: str) -> Optional[PreparedCard]:
+        """Забрать подготовленную анкету, если она ещё актуальна"""
+        task = self._tasks.get(user_id)
+        if task is not None:
+            await asyncio.wait([task])
+
+        card = self._slots.get(user_id)
+        if card is None:
+            self.misses += 1
+            return None
+        self._slots.pop(user_id)
+
+        if card.key != (gender, looking_for):
+            # Очередь под прежние параметры поиска сбросится при выборе по новым
+            self.misses += 1
+            return None
+        profile = await self.db.recheck_candidate(user_id, card.profile["user_id"], gender, looking_for)
+        if profile is None:
+            # Очередь проверит кандидата заново: оцененного или скрытого она пропустит
+            self._return(user_id, card)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if profile != card.profile:
+            # Анкету успели отредактировать — берем карточку новой версии
+            card = PreparedCard(profile, await get_profile_card(self.db, profile), card.key)
+        return card
+
+    async def close(self):
+        """Дождаться начатой подготовки; вызывается до закрытия базы"""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks.values()))
+
+    def stats(self) -> dict:
+        """Попадания и промахи"""
+        return {"slots": len(self._slots), "hits": self.hits, "misses": self.misses}
+
+    def _return(self, user_id: int, card: PreparedCard):
+        """Вернуть непоказанного кандидата в очередь пользователя"""
+        self.db.return_candidate(user_id, card.profile["user_id"], *card.key)
+
+    async def _prepare(self, user_id: int, key: tuple):
+        """Выбрать и отрисовать следующую анкету"""
+        try:
+            profile = await self.db.get_next_profile(user_id, *key)
+            if profile is None:
+                return
+            card = await get_profile_card(self.db, profile)
+            self._slots.set(user_id, PreparedCard(profile, card, key))
+        except Exception:
+            logger.exception("Не удалось подготовить анкету для %s", user_id)
@@ -0,0 +1,96 @@
+"""
+Прием обновлений через вебхук
+"""
+import asyncio
+import hmac
+import logging
+from typing import Awaitable, Callable
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import BotConfig
+
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def concurrency_limit(max_concurrent: int):
+    """
+    Middleware aiohttp: не больше max_concurrent обновлений в обработке.
+    Остальные запросы ждут, а Telegram не присылает новые, пока не получит
+    ответы на уже отправленные.
+    """
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    @web.middleware
+    async def middleware(request: web.Request, handler):
+        async with semaphore:
+            return await handler(request)
+
+    return middleware
+
+
+def create_app(bot: Bot, dispatcher: Dispatcher, config: BotConfig) -> web.Application:
+    """Приложение aiohttp с обработчиком вебхука"""
+    app = web.Application(middlewares=[concurrency_limit(config.webhook_max_concurrent)])
+    # Обновление обрабатывается до ответа Telegram, иначе ограничение не работает
+    SimpleRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        handle_in_background=False,
+        secret_token=config.webhook_secret or None,
+    ).register(app, path=config.webhook_path)
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+
+def create_forwarding_app(config: BotConfig, forward: Callable[[str], Awaitable]) -> web.Application:
+    """
+    Приложение для супервизора: проверить секрет и передать тело
+    обновления в forward, не разбирая его в объекты aiogram.
+    """
+    async def handle(request: web.Request) -> web.Response:
+        secret = request.headers.get(SECRET_HEADER, "")
+        if config.webhook_secret and not hmac.compare_digest(secret, config.webhook_secret):
+            return web.Response(body="Unauthorized", status=401)
+        await forward(await request.text())
+        return web.Response()
+
+    app = web.Application(middlewares=[concurrency_limit(config.webhook_max_concurrent)])
+    app.router.add_post(config.webhook_path, handle)
+    return app
+
+
+async def run_webhook(bot: Bot, dispatcher: Dispatcher, config: BotConfig):
+    """Принимать обновления через вебхук и обрабатывать их в этом процессе"""
+    app = create_app(bot, dispatcher, config)
+    await serve_webhook(bot, app, config, dispatcher.resolve_used_update_types())
+
+
+async def serve_webhook(bot: Bot, app: web.Application, config: BotConfig, allowed_updates: list[str]):
+    """
+    Запустить сервер и зарегистрировать вебхук.
+    При остановке вебхук не удаляется: Telegram копит обновления
+    до следующего запуска.
+    """
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, config.webhook_host, config.webhook_port)
+    await site.start()
+    logger.info("Вебхук слушает %s:%s%s", config.webhook_host, config.webhook_port, config.webhook_path)
+
+    try:
+        await bot.set_webhook(
+            url=config.webhook_url.rstrip("/") + config.webhook_path,
+            secret_token=config.webhook_secret or None,
+            max_connections=min(config.webhook_max_concurrent, 100),  # Предел Telegram
+            allowed_updates=allowed_updates,
+            drop_pending_updates=config.drop_pending_updates,
+        )
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
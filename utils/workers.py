@@ -0,0 +1,203 @@
+"""
+Многопроцессный режим: супервизор принимает обновления и раздает их воркерам
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import time
+from functools import partial
+from queue import Full
+from typing import Callable, Optional
+
+import aiohttp
+from aiogram import Bot, Dispatcher
+
+
+logger = logging.getLogger(__name__)
+
+
+def update_user_id(update: dict) -> int:
+    """Пользователь, от которого пришло обновление; 0, если его нет"""
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        if "from" in value:
+            return value["from"]["id"]
+        if "user" in value:
+            return value["user"]["id"]
+        if "chat" in value:
+            return value["chat"]["id"]
+    return 0
+
+
+def shard_of(user_id: int, workers: int) -> int:
+    """Номер воркера для пользователя"""
+    return user_id % workers
+
+
+class Supervisor:
+    """
+    Запускает workers процессов и раздает им обновления по from_user.id.
+    Все обновления одного пользователя попадают в один воркер, поэтому
+    их порядок и состояние FSM не зависят от других процессов.
+    Очереди ограничены: если воркер не успевает, прием обновлений ждет.
+    Упавший воркер перезапускается на той же очереди; если воркеры падают
+    чаще max_restarts раз за restart_window секунд, watch завершается ошибкой.
+    """
+
+    def __init__(self, workers: int, target: Callable, queue_size: int = 1000,
+                 max_restarts: int = 5, restart_window: float = 60.0):
+        self.workers = workers
+        self.target = target
+        self.queue_size = queue_size
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self._context = multiprocessing.get_context("spawn")
+        self._queues: list = []
+        self._processes: list = []
+        self._restarts: list[float] = []  # Время последних перезапусков
+        self._stopping = False
+
+    def start(self):
+        """Запустить процессы-воркеры; target получает номер воркера и его очередь"""
+        for index in range(self.workers):
+            self._queues.append(self._context.Queue(self.queue_size))
+            self._processes.append(self._spawn(index))
+        logger.info("Запущено воркеров: %s", self.workers)
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=self.target, args=(index, self._queues[index]), name=f"worker-{index}"
+        )
+        process.start()
+        return process
+
+    async def watch(self, interval: float = 1.0):
+        """
+        Следить за воркерами и перезапускать упавшие.
+        Обновления, которые упавший воркер уже взял из очереди, теряются;
+        остальные дождутся нового процесса в той же очереди.
+        """
+        while not self._stopping:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self._processes):
+                if self._stopping or process.is_alive():
+                    continue
+                now = time.monotonic()
+                self._restarts = [at for at in self._restarts if now - at < self.restart_window]
+                if len(self._restarts) >= self.max_restarts:
+                    raise RuntimeError(
+                        f"Воркер {process.name} упал с кодом {process.exitcode}, "
+                        f"перезапусков за {self.restart_window:.0f} сек: {len(self._restarts)}"
+                    )
+                logger.error("Воркер %s упал с кодом %s, перезапускаем", process.name, process.exitcode)
+                self._restarts.append(now)
+                self._processes[index] = self._spawn(index)
+
+    async def stop(self, timeout: float = 15.0):
+        """Попросить воркеры доработать очередь и дождаться их"""
+        self._stopping = True
+        loop = asyncio.get_running_loop()
+        for queue in self._queues:
+            try:
+                await loop.run_in_executor(None, partial(queue.put, None, timeout=timeout))
+            except Full:
+                logger.warning("Очередь воркера переполнена, сигнал остановки не доставлен")
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                logger.warning("Воркер %s не остановился, завершаем", process.name)
+                process.terminate()
+        self._queues.clear()
+        self._processes.clear()
+
+    async def dispatch(self, raw: str, update: Optional[dict] = None):
+        """Передать сырое обновление воркеру его пользователя"""
+        if update is None:
+            update = json.loads(raw)
+        queue = self._queues[shard_of(update_user_id(update), self.workers)]
+        try:
+            queue.put_nowait(raw)
+            return
+        except Full:
+            pass
+        # Очередь полна — ждем в потоке, чтобы не блокировать цикл событий.
+        # Ожидание ограничено, чтобы поток не завис навсегда при остановке
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, partial(queue.put, raw, timeout=1.0))
+                return
+            except Full:
+                continue
+
+    async def poll(self, bot: Bot, allowed_updates: list[str], timeout: int = 30):
+        """
+        Long polling без разбора обновлений в объекты aiogram:
+        супервизору нужен только id пользователя, остальное делает воркер.
+        """
+        url = bot.session.api.api_url(bot.token, "getUpdates")
+        offset = None
+        async with aiohttp.ClientSession() as session:
+            while True:
+                payload = {"timeout": timeout, "allowed_updates": allowed_updates}
+                if offset is not None:
+                    payload["offset"] = offset
+                try:
+                    async with session.post(url, json=payload,
+                                            timeout=aiohttp.ClientTimeout(total=timeout + 10)) as response:
+                        body = await response.json()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning("Ошибка getUpdates: %s", e)
+                    await asyncio.sleep(1)
+                    continue
+
+                if not body.get("ok"):
+                    retry_after = body.get("parameters", {}).get("retry_after", 1)
+                    logger.warning("getUpdates: %s", body.get("description"))
+                    await asyncio.sleep(retry_after)
+                    continue
+
+                for update in body["result"]:
+                    await self.dispatch(json.dumps(update), update)
+                    offset = update["update_id"] + 1
+
+
+async def consume_updates(bot: Bot, dispatcher: Dispatcher, queue, max_concurrent: int = 100):
+    """
+    Цикл воркера: обрабатывать обновления из очереди супервизора.
+    Обновления разных пользователей идут параллельно, одного — строго по очереди.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrent)
+    tails: dict[int, asyncio.Task] = {}  # Последняя задача каждого пользователя
+
+    async def process(update: dict, previous: Optional[asyncio.Task]):
+        try:
+            if previous:
+                await asyncio.wait([previous])
+            await dispatcher.feed_raw_update(bot, update)
+        except Exception:
+            logger.exception("Ошибка обработки обновления %s", update.get("update_id"))
+        finally:
+            semaphore.release()
+
+    def forget(user_id: int, task: asyncio.Task):
+        if tails.get(user_id) is task:
+            del tails[user_id]
+
+    while True:
+        raw = await loop.run_in_executor(None, queue.get)
+        if raw is None:
+            break
+        update = json.loads(raw)
+        user_id = update_user_id(update)
+
+        await semaphore.acquire()
+        task = asyncio.create_task(process(update, tails.get(user_id)))
+        tails[user_id] = task
+        task.add_done_callback(lambda done, user_id=user_id: forget(user_id, done))
+
+    if tails:
+        await asyncio.wait(list(tails.values()))